@@ -6,6 +6,9 @@ from flask_cors import CORS
 
 def create_app(config_name='default'):
     app = Flask(__name__)
+    # Parse uploads into in-memory UploadBuffers instead of saving them to UPLOAD_FOLDER
+    from .utils.upload_buffer_util import UploadRequest
+    app.request_class = UploadRequest
     app.config.from_object(f'app.config.{config_name.capitalize()}Config')
 
     # Decode the JSON credentials from environment variables
@@ -44,6 +47,11 @@ def create_app(config_name='default'):
     from .api.document_routes import api_blueprint
     app.register_blueprint(api_blueprint, url_prefix='/api')
 
+    from .warmup import start_warm_up, start_background_services
+    if app.config['START_BACKGROUND_SERVICES']:
+        start_background_services(app.config['LRO_MANAGER_ENABLED'])
+    start_warm_up(app.config['WARM_UP'])
+
     CORS(app)
 
     return app
@@ -1,17 +1,60 @@
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
-from werkzeug.utils import secure_filename
+from flask import Blueprint, request, jsonify, current_app, url_for
 from app.services.document_processing_w2_paystub import process_document_w2_paystub
 from app.services.document_processing_fannie_mae import process_document_fannie_mae
+from app.services.document_processing_batch import process_documents_batch
+from app.utils.jobs_util import get_job_queue, observe_stage, run_inline, Job, QueueFullError
+from app.utils.docai_cache_util import get_document_cache
+from app.utils.upload_buffer_util import take_upload
+from app.utils.firestore_util import firestore_writer_stats
+from app.utils import metrics_util
+from concurrent.futures import Future
 import os
+import time
 
 # Define allowed extensions
 ALLOWED_EXTENSIONS = {'pdf'}
+DOCUMENT_TYPES = ['paystub', 'w2', '1040']
 
 api_blueprint = Blueprint('api', __name__)
 
+REQUESTS_IN_FLIGHT = metrics_util.gauge('docproc_http_requests_in_flight', 'API requests currently being handled.')
+
+@api_blueprint.before_request
+def start_request():
+    REQUESTS_IN_FLIGHT.inc()
+    if request.method == 'POST':
+        # Parsing the multipart body reads every upload into its UploadBuffer
+        start = time.perf_counter()
+        request.files
+        document_types = set(request.form.getlist('document_type'))
+        observe_stage('upload_save', time.perf_counter() - start,
+                      document_types.pop() if len(document_types) == 1 else None)
+
+@api_blueprint.teardown_request
+def finish_request(error=None):
+    REQUESTS_IN_FLIGHT.dec()
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def wants_async():
+    value = request.args.get('async', request.form.get('async', 'false'))
+    return value.lower() in ['true', '1', 't']
+
+def process_file(upload, document_type, pdf_name, spreadsheet_id):
+    """
+    Run the pipeline for an UploadBuffer and close it afterwards.
+    Returns a Future when part of the work continues in the background (1040 batch splits).
+    """
+    try:
+        if document_type in ['paystub', 'w2']:
+            return process_document_w2_paystub(upload, 'application/pdf', document_type, spreadsheet_id)
+        elif document_type == '1040':
+            return process_document_fannie_mae(upload, document_type, pdf_name, spreadsheet_id)
+    finally:
+        # Releases the buffer, and its temporary file if the upload spilled to disk
+        upload.close()
+
 @api_blueprint.route('/process', methods=['POST'])
 def process_documents():
     document_type = request.form.get('document_type')
@@ -22,33 +65,95 @@ def process_documents():
         return jsonify({'error': 'No file part'}), 400
 
     file = request.files['file']
-    
+
     # If the user does not select a file, the browser submits an empty file without a filename
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
     if file and allowed_file(file.filename):
-        upload_folder = current_app.config['UPLOAD_FOLDER']
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(upload_folder, filename)
-        file.save(file_path)
-
-        try:
-            if document_type in ['paystub', 'w2']:
-                process_document_w2_paystub(file_path, 'application/pdf', document_type, spreadsheet_id)
-            elif document_type == '1040':
-                process_document_fannie_mae(file_path, document_type, file.filename, spreadsheet_id)
-            else:
-                return jsonify({'error': 'Invalid document type'}), 400
-        finally:
-            # Ensure the file is deleted after processing
-            if os.path.exists(file_path):
-                os.remove(file_path)
+        if document_type not in DOCUMENT_TYPES:
+            return jsonify({'error': 'Invalid document type'}), 400
+
+        # The parsed upload is processed in place; it only touches disk past UPLOAD_SPOOL_MAX_BYTES
+        upload = take_upload(file)
 
+        if wants_async():
+            try:
+                job = get_job_queue().submit(
+                    process_file, upload, document_type, file.filename, spreadsheet_id,
+                    document_type=document_type, filename=file.filename
+                )
+            except QueueFullError as e:
+                upload.close()
+                return jsonify({'error': str(e)}), 503
+            status_url = url_for('api.job_status', job_id=job.id)
+            return jsonify({'job_id': job.id, 'status_url': status_url}), 202, {'Location': status_url}
+
+        with run_inline(Job(document_type=document_type, filename=file.filename)):
+            result = process_file(upload, document_type, file.filename, spreadsheet_id)
+            if isinstance(result, Future):
+                result.result()
         return jsonify({'message': 'Document processed successfully'}), 200
     else:
         return jsonify({'error': 'Invalid file type'}), 400
 
+@api_blueprint.route('/process/batch', methods=['POST'])
+def process_documents_batch_route():
+    """
+    Process several files for one spreadsheet. Send each file as a 'files' part with a
+    matching 'document_type' part, in the order the sheet writes should be applied.
+    """
+    files = request.files.getlist('files')
+    document_types = request.form.getlist('document_type')
+    spreadsheet_id = request.form.get('spreadsheetId')
+
+    if not files:
+        return jsonify({'error': 'No file part'}), 400
+    if len(document_types) != len(files):
+        return jsonify({'error': 'Expected one document_type per file'}), 400
+    # Validate everything before saving anything
+    for file, document_type in zip(files, document_types):
+        if file.filename == '' or not allowed_file(file.filename):
+            return jsonify({'error': f"Invalid file: {file.filename or '<empty>'}"}), 400
+        if document_type not in DOCUMENT_TYPES:
+            return jsonify({'error': f"Invalid document type for {file.filename}"}), 400
+
+    uploads = [(take_upload(file), document_type, file.filename) for file, document_type in zip(files, document_types)]
+    try:
+        results = process_documents_batch(uploads, spreadsheet_id)
+    finally:
+        for upload, _, _ in uploads:
+            upload.close()
+
+    status = 200 if all(result['state'] == 'succeeded' for result in results) else 207
+    return jsonify({'results': results}), status
+
+@api_blueprint.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job id'}), 404
+    return jsonify(job.to_dict()), 200
+
+@api_blueprint.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    cache = get_document_cache()
+    if cache is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify({'enabled': True, **cache.stats()}), 200
+
+@api_blueprint.route('/firestore/stats', methods=['GET'])
+def firestore_stats():
+    stats = firestore_writer_stats()
+    if stats is None:
+        return jsonify({'enabled': current_app.config['FIRESTORE_ASYNC_WRITES'], 'queue_depth': 0}), 200
+    return jsonify({'enabled': True, **stats}), 200
+
+@api_blueprint.route('/metrics', methods=['GET'])
+def metrics():
+    """Stage latencies, API call counts and in-flight gauges in the Prometheus text format."""
+    return metrics_util.render_metrics(), 200, {'Content-Type': metrics_util.CONTENT_TYPE}
+
 @api_blueprint.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy'}), 200
@@ -0,0 +1,271 @@
+"""
+ASGI application serving /api/process on the asyncio pipeline (services/document_processing_async).
+
+The upload is streamed off the socket into an UploadBuffer as it arrives and the document is
+processed in the event loop, so a request waiting on Document AI or Sheets holds no thread.
+Every other route is handed to the Flask app in a worker thread, so the API is unchanged.
+"""
+import asyncio
+import json
+import sys
+import time
+import traceback
+from urllib.parse import parse_qs
+from werkzeug.datastructures import FileStorage, MultiDict
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from . import create_app
+from .api.document_routes import DOCUMENT_TYPES, REQUESTS_IN_FLIGHT, allowed_file, process_file
+from .services.document_processing_async import process_document_async
+from .utils.jobs_util import Job, QueueFullError, get_job_queue, observe_stage, run_inline
+from .utils.upload_buffer_util import UploadBuffer, take_upload
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+async def read_body(receive, buffer):
+    """Copy the request body into buffer as it arrives."""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        buffer.write(message.get('body', b''))
+        if not message.get('more_body', False):
+            return buffer
+
+
+async def read_multipart(receive, boundary, new_upload, max_form_memory_size=None):
+    """
+    Parse a multipart/form-data body as it is received. File parts are written into the
+    UploadBuffer returned by new_upload(filename); other parts are decoded as form fields.
+    Returns (form MultiDict, files MultiDict of FileStorage).
+    """
+    decoder = MultipartDecoder(boundary, max_form_memory_size)
+    form, files = MultiDict(), MultiDict()
+    part, container = None, None
+    try:
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise ClientDisconnected()
+            decoder.receive_data(message.get('body', b''))
+            more_body = message.get('more_body', False)
+            if not more_body:
+                decoder.receive_data(None)
+
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File):
+                    part, container = event, new_upload(event.filename)
+                elif isinstance(event, Field):
+                    part, container = event, bytearray()
+                elif isinstance(event, Data):
+                    if isinstance(part, File):
+                        container.write(event.data)
+                    else:
+                        container.extend(event.data)
+                    if not event.more_data:
+                        if isinstance(part, File):
+                            container.seek(0)
+                            files.add(part.name, FileStorage(container, part.filename, part.name, headers=part.headers))
+                        else:
+                            form.add(part.name, container.decode('utf-8', 'replace'))
+                        part, container = None, None
+                event = decoder.next_event()
+            if isinstance(event, Epilogue):
+                break
+    except BaseException:
+        if isinstance(container, UploadBuffer):
+            container.close()
+        for file in files.values():
+            file.stream.close()
+        raise
+    return form, files
+
+
+def wsgi_environ(scope, body):
+    """PEP 3333 environ for an ASGI HTTP scope whose body has been read into body."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _header(scope, name):
+    for key, value in scope.get('headers', []):
+        if key.decode('latin-1').lower() == name:
+            return value.decode('latin-1')
+    return None
+
+
+class AsgiApp:
+    """
+    :param flask_app: The Flask app from create_app, used for its config and every route
+                      that is not served natively
+    """
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.config = flask_app.config
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise NotImplementedError(f"Unsupported ASGI scope type {scope['type']}")
+
+        root_path = scope.get('root_path', '')
+        route = scope['path'][len(root_path):] if scope['path'].startswith(root_path) else scope['path']
+        content_type = _header(scope, 'content-type') or ''
+        if scope['method'] == 'POST' and route == '/api/process' and content_type.startswith('multipart/form-data'):
+            return await self.process(scope, receive, send)
+        return await self.call_flask(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def new_upload(self, filename):
+        return UploadBuffer(
+            spill_threshold=self.config['ASYNC_UPLOAD_SPOOL_MAX_BYTES'],
+            directory=self.config.get('UPLOAD_FOLDER') or None,
+            filename=filename,
+        )
+
+    async def process(self, scope, receive, send):
+        """POST /api/process, with the same form fields and responses as the Flask route."""
+        REQUESTS_IN_FLIGHT.inc()
+        files = MultiDict()
+        try:
+            _, options = parse_options_header(_header(scope, 'content-type'))
+            start = time.perf_counter()
+            form, files = await read_multipart(receive, options.get('boundary', '').encode('latin-1'),
+                                               self.new_upload, self.config.get('MAX_FORM_MEMORY_SIZE'))
+            observe_stage('upload_save', time.perf_counter() - start, form.get('document_type'))
+            status, body, headers = await self.process_form(scope, form, files)
+        except ClientDisconnected:
+            return
+        except RequestEntityTooLarge:
+            status, body, headers = 413, {'error': 'Request entity too large'}, []
+        except Exception as e:
+            traceback.print_exception(e)
+            status, body, headers = 500, {'error': 'Internal Server Error'}, []
+        finally:
+            # Uploads not handed to the pipeline or the job queue
+            for file in files.values():
+                if not file.stream.closed:
+                    file.stream.close()
+            REQUESTS_IN_FLIGHT.dec()
+        await self.send_json(scope, send, status, body, headers)
+
+    async def process_form(self, scope, form, files):
+        document_type = form.get('document_type')
+        spreadsheet_id = form.get('spreadsheetId')
+        if 'file' not in files:
+            return 400, {'error': 'No file part'}, []
+        file = files['file']
+        if file.filename == '':
+            return 400, {'error': 'No selected file'}, []
+        if not allowed_file(file.filename):
+            return 400, {'error': 'Invalid file type'}, []
+        if document_type not in DOCUMENT_TYPES:
+            return 400, {'error': 'Invalid document type'}, []
+
+        upload = take_upload(file)
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        wants_async = query.get('async', [form.get('async', 'false')])[0]
+        if wants_async.lower() in ['true', '1', 't']:
+            try:
+                job = get_job_queue().submit(
+                    process_file, upload, document_type, file.filename, spreadsheet_id,
+                    document_type=document_type, filename=file.filename
+                )
+            except QueueFullError as e:
+                upload.close()
+                return 503, {'error': str(e)}, []
+            status_url = f"{scope.get('root_path', '')}/api/jobs/{job.id}"
+            return 202, {'job_id': job.id, 'status_url': status_url}, [(b'location', status_url.encode('latin-1'))]
+
+        try:
+            with run_inline(Job(document_type=document_type, filename=file.filename)):
+                await process_document_async(upload, document_type, file.filename, spreadsheet_id)
+        finally:
+            upload.close()
+        return 200, {'message': 'Document processed successfully'}, []
+
+    async def send_json(self, scope, send, status, body, headers):
+        payload = json.dumps(body).encode('utf-8')
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())] + headers
+        if _header(scope, 'origin') is not None:
+            # What flask_cors adds for the Flask routes
+            headers.append((b'access-control-allow-origin', b'*'))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': payload})
+
+    async def call_flask(self, scope, receive, send):
+        """Run the request through the Flask app in a worker thread."""
+        body = UploadBuffer(spill_threshold=self.config['UPLOAD_SPOOL_MAX_BYTES'],
+                            directory=self.config.get('UPLOAD_FOLDER') or None)
+        try:
+            try:
+                await read_body(receive, body)
+            except ClientDisconnected:
+                return
+            body.seek(0)
+            status, headers, content = await asyncio.to_thread(self.run_wsgi, wsgi_environ(scope, body))
+        finally:
+            body.close()
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    def run_wsgi(self, environ):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+        result = self.flask_app(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], content
+
+
+def create_asgi_app(config_name='default'):
+    return AsgiApp(create_app(config_name))
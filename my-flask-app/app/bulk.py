@@ -0,0 +1,443 @@
+"""
+Bulk extraction: runs the paystub, W-2, 1040 and Schedule C pipelines over a directory or
+manifest of PDFs and streams one record per document to JSONL or Parquet instead of Sheets.
+
+Run from my-flask-app:
+
+    python -m app.bulk INPUT --output results.jsonl [--document-type w2] [--workers 8]
+        [--threads 4] [--docai-concurrency 16] [--format parquet] [--verbose]
+
+INPUT is a directory, searched recursively for PDFs whose document type is taken from the
+name of a parent directory (paystub/, w2/, 1040/, schedule_c/), or a manifest: a .jsonl file of
+{"path": ..., "document_type": ...} or a .csv file with path and document_type columns.
+
+Documents are spread over --workers processes, so local PDF work (splitting, region
+extraction, optimization) scales with cores, and each process keeps --threads documents in
+flight, so remote work overlaps. Document AI calls of all processes together are capped at
+--docai-concurrency in flight and share OUTBOUND_RATE_LIMITS, which then holds for the whole
+run rather than per process.
+
+The output is the checkpoint: documents with an 'ok' record in it are skipped when the run
+is started again, failed ones are retried. Readers should keep the last record per key.
+"""
+import argparse
+import contextlib
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from .config import get_config
+from .utils.jobs_util import Job, job_context, track_stage
+from .utils.outbound_util import limit_concurrency, reset_outbound_scheduler
+
+config = get_config(os.getenv('APP_ENV', 'default'))
+
+DOCUMENT_TYPES = ('paystub', 'w2', '1040', 'schedule_c')
+# Directory names (lowercase, without '-', '_' and a plural 's') that set the document type
+DIRECTORY_TYPES = {'paystub': 'paystub', 'w2': 'w2', '1040': '1040', 'schedulec': 'schedule_c'}
+
+# Settings applied to the shared app config in every worker
+BULK_CONFIG = {
+    # Batch splits wait on their operation in the worker rather than through the poller
+    'LRO_MANAGER_ENABLED': False,
+    # Workers are already a process pool; sections of a 1040 run one after the other
+    'SECTION_PROCESS_WORKERS': 0,
+}
+
+# key: identifies a document version, so an edited or retyped file is processed again
+BulkItem = namedtuple('BulkItem', ['path', 'document_type', 'key'])
+
+PARQUET_COLUMNS = ('key', 'path', 'document_type', 'status', 'error', 'seconds', 'stages', 'api_calls', 'result')
+# Nested fields are stored as JSON strings in Parquet
+PARQUET_JSON_COLUMNS = ('stages', 'api_calls', 'result')
+
+
+def document_key(path, document_type):
+    stat = os.stat(path)
+    return f"{document_type}:{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def directory_type(path, root):
+    """Document type named by the closest parent directory of path below root, or None."""
+    parts = os.path.relpath(os.path.dirname(path), root).split(os.sep)
+    for part in reversed(parts):
+        name = part.lower().replace('-', '').replace('_', '')
+        document_type = DIRECTORY_TYPES.get(name) or DIRECTORY_TYPES.get(name[:-1] if name.endswith('s') else None)
+        if document_type:
+            return document_type
+    return None
+
+
+def walk_directory(root, document_type=None):
+    """(path, document type) of every PDF below root, in a stable order."""
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for name in sorted(files):
+            if name.lower().endswith('.pdf'):
+                path = os.path.join(directory, name)
+                yield path, document_type or directory_type(path, root)
+
+
+def read_manifest(path, document_type=None):
+    """(path, document type) of every entry of a .jsonl or .csv manifest; paths are relative to it."""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r', newline='') as f:
+        if path.lower().endswith('.csv'):
+            entries = list(csv.DictReader(f))
+        else:
+            entries = [json.loads(line) for line in f if line.strip()]
+    for entry in entries:
+        yield os.path.join(base, entry['path']), document_type or entry.get('document_type') or None
+
+
+def collect_items(source, document_type=None):
+    """BulkItems of a directory or manifest; entries without a known document type are reported and skipped."""
+    entries = walk_directory(source, document_type) if os.path.isdir(source) else read_manifest(source, document_type)
+    items = []
+    for path, item_type in entries:
+        if item_type not in DOCUMENT_TYPES:
+            print(f"Skipping {path}: unknown document type {item_type!r}", file=sys.stderr)
+            continue
+        items.append(BulkItem(path, item_type, document_key(path, item_type)))
+    return items
+
+
+# Pipelines; each returns a JSON-serializable result and runs under the document's Job
+
+def extract_w2_paystub(item):
+    from .services.document_processing_w2_paystub import extract_document_w2_paystub
+    entities = extract_document_w2_paystub(item.path, 'application/pdf', item.document_type)
+    return {'entities': entities.to_records()}
+
+
+def extract_1040(item):
+    """Split the package like the 1040 endpoint and extract every section that has a handler."""
+    import tempfile
+    from .models.fannie_mae_1040_extraction import EXTRACTED_SECTIONS
+    from .models.fannie_mae_operations.section_dispatcher import handler_for
+    from .models.fannie_mae_operations.splitter import split_1040_package
+    # Unique, as the online splitter archives the split PDFs under this name
+    pdf_name = f"{hashlib.sha1(item.key.encode('utf-8')).hexdigest()[:12]}_{os.path.basename(item.path)}"
+    sections = []
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        with track_stage('split'):
+            output_files = split_1040_package(
+                config.PROJECT_ID, config.LOCATION, config.SPLITTER_PROCESSOR_ID, pdf_name, item.path,
+                tmpdirname, sections=EXTRACTED_SECTIONS
+            )
+        for local_file, gcs_path in output_files:
+            handler = handler_for(local_file)
+            if handler is None:
+                continue
+            with track_stage(handler.stage):
+                values = handler.extract(local_file)
+            sections.append({'section': handler.label, 'file': os.path.basename(local_file),
+                             'gcs_path': gcs_path, 'values': values})
+    return {'sections': sections}
+
+
+def extract_schedule_c(item):
+    """A Schedule C that was split out already: region extraction only, no Document AI."""
+    from .models.fannie_mae_operations.extraction_scheduleC import extract_scheduleC
+    with track_stage('schedule_c'):
+        return {'values': extract_scheduleC(item.path)}
+
+
+PIPELINES = {
+    'paystub': extract_w2_paystub,
+    'w2': extract_w2_paystub,
+    '1040': extract_1040,
+    'schedule_c': extract_schedule_c,
+}
+
+
+def process_item(item):
+    """Run one document through its pipeline; returns its output record, with the error if it failed."""
+    job = Job(document_type=item.document_type, filename=os.path.basename(item.path))
+    result, error = None, None
+    start = time.perf_counter()
+    with job_context(job):
+        try:
+            result = PIPELINES[item.document_type](item)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    return {
+        'key': item.key,
+        'path': item.path,
+        'document_type': item.document_type,
+        'status': 'error' if error else 'ok',
+        'error': error,
+        'seconds': round(time.perf_counter() - start, 3),
+        'stages': {name: round(seconds, 3) for name, seconds in job.stages.items()},
+        'api_calls': dict(job.api_calls),
+        'result': result,
+    }
+
+
+def wait_for_background_work():
+    """Let queued Firestore writes and split-PDF archival finish before their documents count as done."""
+    from .models.fannie_mae_operations.splitter import wait_for_archives
+    from .utils import firestore_util
+    wait_for_archives()
+    if firestore_util.firestore_writer_stats() is not None:
+        firestore_util.get_firestore_writer().flush()
+
+
+def process_chunk(items, threads):
+    """Process a chunk of documents threads at a time; runs in a worker process."""
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='bulk') as executor:
+        records = list(executor.map(process_item, items))
+    wait_for_background_work()
+    return records
+
+
+def share_rate_limits(limits, processes):
+    """OUTBOUND_RATE_LIMITS divided between processes, so that together they stay within the quota."""
+    return {name: [rate / processes, max(1, burst // processes)] for name, (rate, burst) in limits.items()}
+
+
+def init_worker(settings, docai_gate, quiet):
+    """Process pool initializer: apply the bulk settings and the shared Document AI limit."""
+    if quiet:
+        # The pipeline logs with print(); the progress goes to stderr
+        sys.stdout = open(os.devnull, 'w')
+    for key, value in settings.items():
+        setattr(config, key, value)
+    reset_outbound_scheduler()
+    limit_concurrency('documentai', docai_gate)
+
+
+# Output sinks; both tell which documents they already hold, which is what makes runs resumable
+
+class JsonlSink:
+    """Appends one JSON record per line, flushed as it is written."""
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def completed(self):
+        """Keys of the documents recorded as 'ok'."""
+        keys = set()
+        if not os.path.exists(self.path):
+            return keys
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line of an interrupted run
+                    continue
+                if record.get('status') == 'ok':
+                    keys.add(record['key'])
+        return keys
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Start on a new line after a line cut short by an interrupted run
+        cut_short = False
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                cut_short = f.read(1) != b'\n'
+        self._file = open(self.path, 'a')
+        if cut_short:
+            self._file.write('\n')
+        return self
+
+    def write(self, record):
+        self._file.write(json.dumps(record, default=str) + '\n')
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ParquetSink:
+    """
+    Writes the records to a directory of Parquet files of up to batch_rows rows each. A file is
+    written whole and then renamed into place, so an interrupted run only loses its last batch.
+    Needs pyarrow.
+    """
+    def __init__(self, path, batch_rows=500):
+        self.path = path
+        self.batch_rows = batch_rows
+        self._rows = []
+        self._run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self._parts = 0
+
+    @staticmethod
+    def _pyarrow():
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+        return pyarrow, pyarrow.parquet
+
+    def _part_files(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith('.parquet'))
+
+    def completed(self):
+        _, parquet = self._pyarrow()
+        keys = set()
+        for part in self._part_files():
+            table = parquet.read_table(part, columns=['key', 'status'])
+            keys.update(key for key, status in zip(table.column('key').to_pylist(), table.column('status').to_pylist())
+                        if status == 'ok')
+        return keys
+
+    def open(self):
+        self._pyarrow()
+        os.makedirs(self.path, exist_ok=True)
+        return self
+
+    def write(self, record):
+        self._rows.append(record)
+        if len(self._rows) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        pyarrow, parquet = self._pyarrow()
+        columns = {
+            column: [json.dumps(row[column], default=str) if column in PARQUET_JSON_COLUMNS else row[column]
+                     for row in self._rows]
+            for column in PARQUET_COLUMNS
+        }
+        schema = pyarrow.schema([(column, pyarrow.float64() if column == 'seconds' else pyarrow.string())
+                                 for column in PARQUET_COLUMNS])
+        self._parts += 1
+        part = os.path.join(self.path, f"part-{self._run_id}-{self._parts:05d}.parquet")
+        parquet.write_table(pyarrow.table(columns, schema=schema), part + '.tmp')
+        os.replace(part + '.tmp', part)
+        self._rows = []
+
+    def close(self):
+        self.flush()
+
+
+def open_sink(path, output_format=None, batch_rows=500):
+    output_format = output_format or ('parquet' if path.lower().endswith('.parquet') else 'jsonl')
+    if output_format == 'parquet':
+        return ParquetSink(path, batch_rows)
+    return JsonlSink(path)
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def run(items, sink, workers, threads, docai_concurrency, quiet=True, progress_interval=10.0):
+    """
+    Process items not yet completed in sink and write their records to it as they finish.
+    With workers=0 everything runs in this process, on threads only.
+    Returns {'total', 'skipped', 'processed', 'errors', 'seconds'}.
+    """
+    completed = sink.completed()
+    pending = [item for item in items if item.key not in completed]
+    summary = {'total': len(items), 'skipped': len(items) - len(pending), 'processed': 0, 'errors': 0}
+    print(f"{len(items)} documents, {summary['skipped']} already done, {len(pending)} to process "
+          f"on {workers or 'no'} worker processes x {threads} threads", file=sys.stderr)
+
+    stack = contextlib.ExitStack()
+    processes = max(workers, 1)
+    settings = dict(BULK_CONFIG, OUTBOUND_RATE_LIMITS=share_rate_limits(config.OUTBOUND_RATE_LIMITS, processes))
+    if workers:
+        # spawn: forked workers would inherit the client and executor threads of this process
+        context = multiprocessing.get_context('spawn')
+        docai_gate = context.BoundedSemaphore(docai_concurrency)
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                                       initargs=(settings, docai_gate, quiet))
+        previous = None
+    else:
+        previous = {key: getattr(config, key) for key in settings}
+        init_worker(settings, threading.BoundedSemaphore(docai_concurrency), quiet=False)
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bulk-chunk')
+        if quiet:
+            stdout = stack.enter_context(open(os.devnull, 'w'))
+            stack.enter_context(contextlib.redirect_stdout(stdout))
+
+    start = time.perf_counter()
+    last_report = start
+    sink.open()
+    try:
+        # Two chunks per worker in flight: one running and one ready to start
+        remaining = chunks(pending, threads)
+        in_flight = set()
+        while True:
+            while len(in_flight) < processes * 2:
+                chunk = next(remaining, None)
+                if chunk is None:
+                    break
+                in_flight.add(executor.submit(process_chunk, chunk, threads))
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                for record in future.result():
+                    sink.write(record)
+                    summary['processed'] += 1
+                    if record['status'] != 'ok':
+                        summary['errors'] += 1
+                        print(f"Failed {record['path']}: {record['error']}", file=sys.stderr)
+            now = time.perf_counter()
+            if now - last_report >= progress_interval:
+                last_report = now
+                print(f"{summary['processed']}/{len(pending)} documents, {summary['errors']} errors, "
+                      f"{summary['processed'] / (now - start):.2f} documents/s", file=sys.stderr)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        sink.close()
+        stack.close()
+        if previous is not None:
+            for key, value in previous.items():
+                setattr(config, key, value)
+            reset_outbound_scheduler()
+
+    summary['seconds'] = round(time.perf_counter() - start, 3)
+    print(f"Processed {summary['processed']} documents in {summary['seconds']}s, {summary['errors']} errors",
+          file=sys.stderr)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.bulk', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='directory of PDFs, or a .jsonl / .csv manifest')
+    parser.add_argument('--output', required=True, help='.jsonl file, or directory of Parquet files')
+    parser.add_argument('--format', choices=['jsonl', 'parquet'],
+                        help='default: parquet when --output ends with .parquet, otherwise jsonl')
+    parser.add_argument('--document-type', choices=DOCUMENT_TYPES, help='document type of every input')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='worker processes (default: one per core); 0 runs everything in this process')
+    parser.add_argument('--threads', type=int, default=4, help='documents in flight per worker process')
+    parser.add_argument('--docai-concurrency', type=int, default=16,
+                        help='Document AI calls in flight across all workers')
+    parser.add_argument('--parquet-batch-rows', type=int, default=500, help='rows per Parquet file')
+    parser.add_argument('--verbose', action='store_true', help="show the pipeline's own logging")
+    args = parser.parse_args(argv)
+
+    items = collect_items(args.input, args.document_type)
+    sink = open_sink(args.output, args.format, args.parquet_batch_rows)
+    summary = run(items, sink, args.workers, max(args.threads, 1), args.docai_concurrency, quiet=not args.verbose)
+    return summary
+
+
+if __name__ == '__main__':
+    summary = main()
+    sys.exit(1 if summary['errors'] else 0)
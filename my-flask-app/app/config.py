@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -37,6 +38,127 @@ class Config:
     GOOGLE_FIRESTORE_CREDENTIALS = os.getenv('GOOGLE_FIRESTORE_CREDENTIALS')
 
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER')
+    # Uploads are kept in memory up to this size and only spill to UPLOAD_FOLDER beyond it
+    UPLOAD_SPOOL_MAX_BYTES = int(os.getenv('UPLOAD_SPOOL_MAX_BYTES', 20 * 1024 * 1024))
+
+    # Asynchronous job mode for /api/process (?async=true)
+    ASYNC_JOB_WORKERS = int(os.getenv('ASYNC_JOB_WORKERS', 2))
+    ASYNC_JOB_QUEUE_SIZE = int(os.getenv('ASYNC_JOB_QUEUE_SIZE', 16))
+    ASYNC_JOB_RETENTION = int(os.getenv('ASYNC_JOB_RETENTION', 500))
+
+    # Entities and properties Document AI is less confident about are dropped (0 keeps everything)
+    ENTITY_MIN_CONFIDENCE = float(os.getenv('ENTITY_MIN_CONFIDENCE', 0))
+
+    # Extraction records are written to Firestore in the background in WriteBatches of up
+    # to FIRESTORE_BATCH_SIZE, committed at least every FIRESTORE_FLUSH_INTERVAL seconds
+    FIRESTORE_ASYNC_WRITES = os.getenv('FIRESTORE_ASYNC_WRITES', 'true').lower() in ['true', '1', 't']
+    FIRESTORE_BATCH_SIZE = int(os.getenv('FIRESTORE_BATCH_SIZE', 500))
+    FIRESTORE_FLUSH_INTERVAL = float(os.getenv('FIRESTORE_FLUSH_INTERVAL', 1.0))
+    FIRESTORE_WRITER_QUEUE_SIZE = int(os.getenv('FIRESTORE_WRITER_QUEUE_SIZE', 10000))
+    FIRESTORE_MAX_RETRIES = int(os.getenv('FIRESTORE_MAX_RETRIES', 5))
+
+    # Concurrent Document AI extractions across all /api/process/batch requests
+    BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', 4))
+
+    # Cache of Document AI results keyed by PDF hash and processor ('memory', 'disk', 'gcs' or 'none')
+    DOCAI_CACHE_BACKEND = os.getenv('DOCAI_CACHE_BACKEND', 'memory')
+    DOCAI_CACHE_TTL = int(os.getenv('DOCAI_CACHE_TTL', 24 * 60 * 60))
+    DOCAI_CACHE_MAX_BYTES = int(os.getenv('DOCAI_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    DOCAI_CACHE_DIR = os.getenv('DOCAI_CACHE_DIR', '/tmp/docai-cache')
+    DOCAI_CACHE_BUCKET = os.getenv('DOCAI_CACHE_BUCKET')
+    DOCAI_CACHE_PREFIX = os.getenv('DOCAI_CACHE_PREFIX', 'docai-cache/')
+    # Bump when a processor's default version changes so cached results are not reused
+    DOCAI_PROCESSOR_VERSION = os.getenv('DOCAI_PROCESSOR_VERSION', 'default')
+
+    # W-2s and paystubs with a usable text layer in a known layout are read locally
+    # (models/extraction_text_layer.py); a required field below TEXT_LAYER_MIN_CONFIDENCE sends
+    # the document to Document AI. TEXT_LAYER_LAYOUTS_PATH: JSON list of extra layouts
+    TEXT_LAYER_FAST_PATH = os.getenv('TEXT_LAYER_FAST_PATH', 'true').lower() in ['true', '1', 't']
+    TEXT_LAYER_MIN_CONFIDENCE = float(os.getenv('TEXT_LAYER_MIN_CONFIDENCE', 0.85))
+    TEXT_LAYER_MIN_CHARS = int(os.getenv('TEXT_LAYER_MIN_CHARS', 100))
+    TEXT_LAYER_MAX_PAGES = int(os.getenv('TEXT_LAYER_MAX_PAGES', 4))
+    TEXT_LAYER_LAYOUTS_PATH = os.getenv('TEXT_LAYER_LAYOUTS_PATH')
+
+    # Paystub and W-2 PDFs are optimized before online processing: blank, duplicate and
+    # irrelevant pages dropped, images above PDF_OPTIMIZE_TARGET_DPI resampled, metadata stripped
+    PDF_OPTIMIZE = os.getenv('PDF_OPTIMIZE', 'true').lower() in ['true', '1', 't']
+    PDF_OPTIMIZE_TARGET_DPI = int(os.getenv('PDF_OPTIMIZE_TARGET_DPI', 200))
+    PDF_OPTIMIZE_JPEG_QUALITY = int(os.getenv('PDF_OPTIMIZE_JPEG_QUALITY', 80))
+
+    # Document AI routing (utils/docai_router_util.py): documents within the online limits are
+    # processed online, those up to SHARDED_MAX_PAGES pages as concurrent online shards merged
+    # back into one Document, larger ones with a batch job
+    DOCAI_ONLINE_MAX_PAGES = int(os.getenv('DOCAI_ONLINE_MAX_PAGES', 15))
+    DOCAI_ONLINE_MAX_BYTES = int(os.getenv('DOCAI_ONLINE_MAX_BYTES', 20 * 1024 * 1024))
+    SHARDED_MAX_PAGES = int(os.getenv('SHARDED_MAX_PAGES', 150))
+    DOCAI_SHARD_WORKERS = int(os.getenv('DOCAI_SHARD_WORKERS', 8))
+    # Fraction of DOCAI_ONLINE_MAX_BYTES a shard is sized for, leaving room for uneven pages
+    DOCAI_SHARD_SIZE_MARGIN = float(os.getenv('DOCAI_SHARD_SIZE_MARGIN', 0.8))
+
+    # 1040 splitting: 'auto' routes by size as above, or force 'online', 'sharded' or 'batch'
+    SPLIT_MODE = os.getenv('SPLIT_MODE', 'auto')
+    ONLINE_SPLIT_MAX_PAGES = int(os.getenv('ONLINE_SPLIT_MAX_PAGES', 15))
+    ONLINE_SPLIT_MAX_BYTES = int(os.getenv('ONLINE_SPLIT_MAX_BYTES', 20 * 1024 * 1024))
+    # Upload every split section to GCS in the background for archival
+    ARCHIVE_SPLIT_PDFS = os.getenv('ARCHIVE_SPLIT_PDFS', 'true').lower() in ['true', '1', 't']
+    # Sections of a split 1040 are extracted concurrently: PyMuPDF extraction in a process pool
+    # (0 workers: threads only), I/O-bound extractors in a thread pool
+    SECTION_PROCESS_WORKERS = int(os.getenv('SECTION_PROCESS_WORKERS', min(4, os.cpu_count() or 1)))
+    SECTION_PROCESS_START_METHOD = os.getenv('SECTION_PROCESS_START_METHOD', 'spawn')
+    SECTION_THREAD_WORKERS = int(os.getenv('SECTION_THREAD_WORKERS', 4))
+
+    # Concurrent GCS transfers (split PDF archival, batch outputs) on the shared storage client.
+    # Objects of GCS_CHUNKED_TRANSFER_THRESHOLD bytes or more move in parallel chunks (0: never)
+    GCS_TRANSFER_WORKERS = int(os.getenv('GCS_TRANSFER_WORKERS', 16))
+    GCS_CHUNKED_TRANSFER_THRESHOLD = int(os.getenv('GCS_CHUNKED_TRANSFER_THRESHOLD', 64 * 1024 * 1024))
+    GCS_TRANSFER_CHUNK_SIZE = int(os.getenv('GCS_TRANSFER_CHUNK_SIZE', 32 * 1024 * 1024))
+
+    # Outbound Google API calls (utils/outbound_util.py): per-process token buckets as JSON
+    # {"service" or "service:quota": [calls per second, burst]}; Sheets quotas are 'read' and
+    # 'write', Document AI quotas are per processor id plus 'batch'. Services not listed are
+    # not limited. Retryable errors (429, 5xx) are retried up to OUTBOUND_MAX_ATTEMPTS times.
+    OUTBOUND_RATE_LIMITS = json.loads(os.getenv('OUTBOUND_RATE_LIMITS') or json.dumps({
+        'sheets:read': [5, 20],
+        'sheets:write': [5, 20],
+        'documentai': [10, 20],
+        'documentai:batch': [0.5, 5],
+    }))
+    OUTBOUND_MAX_ATTEMPTS = int(os.getenv('OUTBOUND_MAX_ATTEMPTS', 5))
+    OUTBOUND_INITIAL_BACKOFF = float(os.getenv('OUTBOUND_INITIAL_BACKOFF', 0.5))
+    OUTBOUND_MAX_BACKOFF = float(os.getenv('OUTBOUND_MAX_BACKOFF', 30))
+
+    # Background poller for Document AI batch operations; in-flight operation names are
+    # persisted next to LRO_STATE_PATH, one file per process, and resumed by one process
+    # when the app starts again
+    LRO_MANAGER_ENABLED = os.getenv('LRO_MANAGER_ENABLED', 'true').lower() in ['true', '1', 't']
+    LRO_STATE_PATH = os.getenv('LRO_STATE_PATH', '/tmp/docai-operations.json')
+    LRO_POLL_INITIAL_DELAY = float(os.getenv('LRO_POLL_INITIAL_DELAY', 5))
+    LRO_POLL_MAX_DELAY = float(os.getenv('LRO_POLL_MAX_DELAY', 60))
+    LRO_TIMEOUT = int(os.getenv('LRO_TIMEOUT', 900))
+
+    # Cold start: the Google SDKs are imported on first use. WARM_UP imports them ahead of the
+    # first request, either in a 'background' thread, 'eager'ly inside create_app (use with
+    # gunicorn --preload, so workers inherit the imports) or not at all ('off')
+    WARM_UP = os.getenv('WARM_UP', 'background')
+    # Set to false when create_app runs in a process that will fork (gunicorn --preload);
+    # gunicorn.conf.py then starts the background services in each worker instead
+    START_BACKGROUND_SERVICES = os.getenv('START_BACKGROUND_SERVICES', 'true').lower() in ['true', '1', 't']
+
+    # ASGI entry point (asgi.py): /api/process runs on the asyncio pipeline. Uploads spill to disk
+    # sooner so hundreds of concurrent documents do not each hold their PDF in memory.
+    ASYNC_DOCAI_CONCURRENCY = int(os.getenv('ASYNC_DOCAI_CONCURRENCY', 100))
+    ASYNC_UPLOAD_SPOOL_MAX_BYTES = int(os.getenv('ASYNC_UPLOAD_SPOOL_MAX_BYTES', 1024 * 1024))
+
+    # Every cell the paystub and W-2 populators read lies in this range of the income worksheet;
+    # it is read in one call when a document is populated (empty: read cell by cell)
+    SHEETS_SNAPSHOT_RANGE = os.getenv('SHEETS_SNAPSHOT_RANGE', 'C10:I90')
+    # Paystubs and W-2s for one spreadsheet are populated one at a time; up to this many queued
+    # documents share one snapshot read and one batchUpdate
+    SHEETS_COALESCE_MAX_DOCUMENTS = int(os.getenv('SHEETS_COALESCE_MAX_DOCUMENTS', 20))
+
+    # JSON file of {"Earning type": ["keyword", ...]} adding employer-specific paystub earning
+    # codes to the built-in taxonomy (utils/earnings_util.py); its keywords take precedence
+    EARNINGS_TAXONOMY_PATH = os.getenv('EARNINGS_TAXONOMY_PATH')
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -45,6 +167,7 @@ class DevelopmentConfig(Config):
 
 class TestingConfig(Config):
     TESTING = True
+    WARM_UP = os.getenv('WARM_UP', 'off')
     SECRET_KEY = 'testing_secret_key'  # Consider using a more secure approach for production
 
 class ProductionConfig(Config):
@@ -58,12 +181,12 @@ config_by_name = {
     'default': DevelopmentConfig  # Default to development if unspecified
 }
 
+# One instance per config class, shared by every module that calls get_config()
+_instances = {}
+
 def get_config(env):
-    if env == 'development':
-        return DevelopmentConfig()
-    elif env == 'testing':
-        return TestingConfig()
-    elif env == 'production':
-        return ProductionConfig()
-    else:
-        return DevelopmentConfig()
+    config_class = config_by_name.get(env, DevelopmentConfig)
+    instance = _instances.get(config_class)
+    if instance is None:
+        instance = _instances.setdefault(config_class, config_class())
+    return instance
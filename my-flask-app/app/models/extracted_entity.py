@@ -0,0 +1,111 @@
+import json
+from array import array
+
+# Record keys used for Firestore documents, cached results and archived JSON
+RECORD_KEYS = ('Type', 'Raw Value', 'Normalized Value', 'Confidence')
+
+
+class ExtractedEntity:
+    """One Document AI entity or entity property, with confidence kept as a float in [0, 1]."""
+    __slots__ = ('type', 'raw_value', 'normalized_value', 'confidence')
+
+    def __init__(self, type, raw_value, normalized_value='', confidence=0.0):
+        self.type = type
+        self.raw_value = raw_value
+        self.normalized_value = normalized_value
+        self.confidence = confidence
+
+    def __eq__(self, other):
+        if not isinstance(other, ExtractedEntity):
+            return NotImplemented
+        return (self.type, self.raw_value, self.normalized_value, self.confidence) == \
+               (other.type, other.raw_value, other.normalized_value, other.confidence)
+
+    def __repr__(self):
+        return f"ExtractedEntity({self.type!r}, {self.raw_value!r}, confidence={self.confidence:.2f})"
+
+    def to_record(self):
+        return dict(zip(RECORD_KEYS, (self.type, self.raw_value, self.normalized_value, self.confidence)))
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(record['Type'], record['Raw Value'], record.get('Normalized Value', ''),
+                   parse_confidence(record.get('Confidence', 0.0)))
+
+
+def parse_confidence(value):
+    """Confidence as a float; accepts the "97%" strings stored before confidence was numeric."""
+    if isinstance(value, str):
+        value = value.strip()
+        return float(value[:-1]) / 100 if value.endswith('%') else float(value or 0)
+    return float(value)
+
+
+def iter_entities(document, min_confidence=None):
+    """
+    Yield an ExtractedEntity for every entity in a documentai.Document followed by its properties,
+    skipping any below min_confidence.
+    """
+    for entity in document.entities:
+        if min_confidence is None or entity.confidence >= min_confidence:
+            yield ExtractedEntity(entity.type_, entity.mention_text, entity.normalized_value.text, entity.confidence)
+
+        for prop in entity.properties:
+            if min_confidence is None or prop.confidence >= min_confidence:
+                yield ExtractedEntity(prop.type_, prop.mention_text, prop.normalized_value.text, prop.confidence)
+
+
+class EntitySet:
+    """
+    Column-oriented collection of extracted entities in document order: one list per text field
+    and an array of doubles for confidences, rather than a dict per entity.
+    Iterating yields ExtractedEntity objects.
+    """
+    __slots__ = ('_types', '_raw_values', '_normalized_values', '_confidences')
+
+    def __init__(self, entities=()):
+        self._types = []
+        self._raw_values = []
+        self._normalized_values = []
+        self._confidences = array('d')
+        for entity in entities:
+            self.append(entity)
+
+    @classmethod
+    def from_document(cls, document, min_confidence=None):
+        return cls(iter_entities(document, min_confidence))
+
+    @classmethod
+    def from_records(cls, records):
+        return cls(ExtractedEntity.from_record(record) for record in records)
+
+    def append(self, entity):
+        self._types.append(entity.type)
+        self._raw_values.append(entity.raw_value)
+        self._normalized_values.append(entity.normalized_value)
+        self._confidences.append(entity.confidence)
+
+    def __len__(self):
+        return len(self._types)
+
+    def __iter__(self):
+        return self.iter()
+
+    def __eq__(self, other):
+        if not isinstance(other, EntitySet):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def iter(self, min_confidence=None):
+        """Yield the entities, skipping any below min_confidence."""
+        for i, confidence in enumerate(self._confidences):
+            if min_confidence is None or confidence >= min_confidence:
+                yield ExtractedEntity(self._types[i], self._raw_values[i], self._normalized_values[i], confidence)
+
+    def to_records(self):
+        """List of plain dicts, as stored in Firestore and the Document AI cache."""
+        return [entity.to_record() for entity in self]
+
+    def to_json(self, indent=4):
+        """Serialize for archiving; the pipeline itself passes EntitySets around in memory."""
+        return json.dumps(self.to_records(), indent=indent)
@@ -1,9 +1,11 @@
-from ..utils.doc_ai_util import online_process
-from ..utils.firestore_util import initialize_firestore, store_data_in_firestore
-from ..utils.google_sheets_util import SheetPopulator
-from typing import List, Dict, Any
-from google.cloud import documentai_v1 as documentai
-import json
+from ..utils.firestore_util import store_data_in_firestore
+from ..utils.spreadsheet_actor_util import populate_spreadsheet
+from ..utils.jobs_util import track_stage
+from ..utils.docai_cache_util import get_document_cache, file_cache_key
+from ..utils.docai_router_util import process_document
+from ..utils.pdf_optimize_util import prepare_document
+from .extracted_entity import EntitySet
+from . import extraction_text_layer
 from ..config import get_config
 import os
 
@@ -13,63 +15,71 @@ env = os.getenv('APP_ENV', 'default')
 # Get the configuration for the current environment
 config = get_config(env)
 
-def extract_data(document: documentai.Document) -> List[Dict[str, Any]]:
-    data = []
-    for entity in document.entities:
-        
-        data.append({
-            'Type': entity.type_,
-            'Raw Value': entity.mention_text,
-            'Normalized Value': entity.normalized_value.text,
-            'Confidence': f"{entity.confidence:.0%}"
-        })
+PAYSTUB_GENERAL_CELL_MAP = {
+    "gross_earnings_ytd": "C30",
+    "employee_name": "C4",
+    # Add more general entries here
+}
+PAYSTUB_EARNINGS_CELL_MAP = {
+    "Regular": {"rate": "C10", "hours": "G10", "ytd": "C11"},
+    "Commission": "C52",
+    "Bonus": "C39"  # Combined cell for Bonus and Overtime
+}
 
-        for prop in entity.properties:
-            
-            data.append({
-                'Type': prop.type_,
-                'Raw Value': prop.mention_text,
-                'Normalized Value': prop.normalized_value.text,
-                'Confidence': f"{prop.confidence:.0%}"
-            })
-    return data
-
-def paystub_extractor(project_id, location, processor_id, file_path, mime_type, spreadsheet_id):
+def extract_paystub_entities(project_id, location, processor_id, file_path, mime_type):
     """
-    Orchestrates the process of extracting data from paystubs.
-    Utilizes Google Document AI to process the document, stores the data in Firestore,
-    and updates a Google Sheet based on a specific mapping.
+    Extracts the paystub entities, from the text layer or with Google Document AI, and stores them in Firestore.
+    A re-upload of a PDF whose Document AI result is cached skips Document AI and Firestore.
+    Returns an EntitySet.
     """
-    # Process the document using Google Document AI
-    document = online_process(project_id, location, processor_id, file_path, mime_type)
-    # print(f"Processed document of type {type(document.document)} with attributes {dir(document.document)}")
+    # Generated stubs are read from their text layer; anything else is processed by Google Document AI.
+    # Only Document AI results are cached, as the text layer is cheaper to read than the cache
+    with track_stage('text_layer'):
+        entities = extraction_text_layer.extract(file_path, mime_type, 'paystub')
+
+    cache = None
+    if entities is None:
+        cache = get_document_cache()
+        cache_key = file_cache_key(file_path, processor_id) if cache else None
+        records = cache.get(cache_key) if cache else None
+        if records is not None:
+            return EntitySet.from_records(records)
+
+        # The cache stays keyed by the upload itself; only what is sent to Document AI is optimized
+        document_file = prepare_document(file_path, mime_type, 'paystub')
+        with track_stage('document_ai'):
+            document = process_document(project_id, location, processor_id, document_file, mime_type)
+
+        # Extract data from the processed document
+        entities = EntitySet.from_document(document, config.ENTITY_MIN_CONFIDENCE or None)
 
-    # Extract data from the processed document
-    data = extract_data(document.document)
+    with track_stage('firestore'):
+        store_data_in_firestore(entities.to_records(), 'paystub-entities')
 
-    # Save the extracted data to JSON and store in Firestore
-    json_file = 'extracted_data.json'  # Define the JSON file name
-    with open(json_file, 'w') as f:
-        json.dump(data, f, indent=4)
+    if cache:
+        cache.set(cache_key, entities.to_records())
+    return entities
 
-    initialize_firestore()
-    with open(json_file, 'r') as f:
-        json_data = json.load(f)
-    store_data_in_firestore(json_data, 'paystub-entities')
+def paystub_population(entities):
+    """populate(populator) writing the paystub entities, for a SpreadsheetActor."""
+    def populate(sheet_populator):
+        sheet_populator.populate_sheet(False, entities, PAYSTUB_GENERAL_CELL_MAP, PAYSTUB_EARNINGS_CELL_MAP)
+    return populate
 
-    # Initialize SheetPopulator and populate the Google Sheet
+def populate_paystub_sheet(spreadsheet_id, entities):
+    """Writes extracted paystub entities to the Income Calculation Worksheet."""
+    # Populate the Google Sheet through its actor, so concurrent paystubs get distinct rows
     google_sheets_credentials = os.getenv('GOOGLE_SHEETS_CREDENTIALS')
     google_sheets_url = f'https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit?usp=sharing'
 
-    sheet_populator = SheetPopulator(google_sheets_credentials, google_sheets_url)
-    general_cell_map = {
-        "gross_earnings_ytd": "C30",
-        "employee_name": "C4",
-        # Add more general entries here
-    }
-    earnings_cell_map = {
-        "Regular": {"rate": "C10", "hours": "G10", "ytd": "C11"},
-        "Commission": "C52",
-        "Bonus": "C39"  # Combined cell for Bonus and Overtime
-    } 
-    sheet_populator.populate_sheet(False, json_data, general_cell_map, earnings_cell_map)
\ No newline at end of file
+    with track_stage('sheets'):
+        populate_spreadsheet(google_sheets_url, paystub_population(entities), google_sheets_credentials)
+
+def paystub_extractor(project_id, location, processor_id, file_path, mime_type, spreadsheet_id):
+    """
+    Orchestrates the process of extracting data from paystubs.
+    Utilizes Google Document AI to process the document, stores the data in Firestore,
+    and updates a Google Sheet based on a specific mapping.
+    """
+    entities = extract_paystub_entities(project_id, location, processor_id, file_path, mime_type)
+    populate_paystub_sheet(spreadsheet_id, entities)
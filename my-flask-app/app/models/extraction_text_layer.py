@@ -0,0 +1,368 @@
+"""
+Local extraction of W-2 and paystub fields from the text layer of digitally generated PDFs.
+
+Most W-2s and payroll-provider paystubs are generated PDFs whose text layer already holds every
+value, at known positions relative to printed labels. For those, the entities SheetPopulator
+consumes are read here with PyMuPDF in milliseconds instead of a Document AI round trip:
+
+ 1. the text layer must be usable (enough text, not garbled by an unmapped font)
+ 2. a layout is picked by anchor text, e.g. "Wage and Tax Statement" for the IRS W-2
+ 3. each field of the layout is read next to its label: to the right on the same row, or below it
+    as in the boxes of a W-2; earning lines are the rows of the earnings section
+
+Every field gets a confidence from how close and how unambiguous its value was. extract() returns
+None, so the document goes to Document AI, when there is no usable text layer, no layout matches
+or a required field is missing or below TEXT_LAYER_MIN_CONFIDENCE.
+"""
+import json
+import os
+import re
+import threading
+from collections import namedtuple
+from datetime import datetime
+from ..utils import metrics_util
+from ..utils.upload_buffer_util import open_pdf
+from .extracted_entity import EntitySet, ExtractedEntity
+from ..config import get_config
+
+# Get the configuration for the current environment
+config = get_config(os.getenv('APP_ENV', 'default'))
+
+# Layouts are tried in order and the one with the most anchors present wins. A field is read by
+# "labels" (any of them) as a "value" of kind amount, date, year or text; "index" picks the n-th
+# value right of the label (e.g. 1 for the YTD column). A field with "section" reads the rows of
+# a table instead: from the row holding the header label and a column name down to an end label.
+DEFAULT_LAYOUTS = [
+    {
+        "name": "irs_w2",
+        "document_type": "w2",
+        "anchors": ["wage and tax statement", "wages, tips, other compensation", "federal income tax withheld",
+                    "employer identification number", "social security wages"],
+        "min_anchors": 3,
+        "fields": [
+            {"type": "FormYear", "labels": ["wage and tax statement"], "value": "year", "required": True},
+            {"type": "WagesTipsOtherCompensation", "labels": ["wages, tips, other compensation"],
+             "value": "amount", "required": True},
+            {"type": "FederalIncomeTaxWithheld", "labels": ["federal income tax withheld"], "value": "amount"},
+            {"type": "SocialSecurityWages", "labels": ["social security wages"], "value": "amount"},
+            {"type": "MedicareWagesAndTips", "labels": ["medicare wages and tips"], "value": "amount"},
+        ],
+    },
+    {
+        # ADP "Earnings Statement"
+        "name": "adp_earnings_statement",
+        "document_type": "paystub",
+        "anchors": ["earnings statement", "period beginning", "period ending", "pay date", "net pay"],
+        "min_anchors": 4,
+        "fields": [
+            {"type": "employee_name", "labels": ["employee name"], "value": "text"},
+            {"type": "start_date", "labels": ["period beginning"], "value": "date", "required": True},
+            {"type": "end_date", "labels": ["period ending"], "value": "date", "required": True},
+            {"type": "pay_date", "labels": ["pay date"], "value": "date", "required": True},
+            {"type": "earning_item", "required": True,
+             "section": {"header": ["earnings"], "end": ["gross pay", "deductions", "statutory"]}},
+            {"type": "gross_earnings", "labels": ["gross pay"], "value": "amount", "required": True},
+            {"type": "gross_earnings_ytd", "labels": ["gross pay"], "value": "amount", "index": 1},
+            {"type": "net_pay", "labels": ["net pay"], "value": "amount"},
+        ],
+    },
+    {
+        # Other payroll providers (Paychex, Gusto, ...) label the same fields in a few ways
+        "name": "paystub",
+        "document_type": "paystub",
+        "anchors": ["pay date", "check date", "period start", "period end", "pay period", "gross pay",
+                    "net pay", "earnings"],
+        "min_anchors": 4,
+        "fields": [
+            {"type": "employee_name", "labels": ["employee name"], "value": "text"},
+            {"type": "start_date", "labels": ["period start", "period beginning", "pay period start",
+                                              "period begin", "start date"], "value": "date", "required": True},
+            {"type": "end_date", "labels": ["period end", "period ending", "pay period end", "end date"],
+             "value": "date", "required": True},
+            {"type": "pay_date", "labels": ["pay date", "check date", "pay day"], "value": "date", "required": True},
+            {"type": "earning_item", "required": True,
+             "section": {"header": ["earnings"], "end": ["gross pay", "gross earnings", "total earnings",
+                                                         "total gross", "deductions", "taxes"]}},
+            {"type": "gross_earnings", "labels": ["gross pay", "gross earnings", "total gross"],
+             "value": "amount", "required": True},
+            {"type": "gross_earnings_ytd", "labels": ["gross pay", "gross earnings", "total gross"],
+             "value": "amount", "index": 1},
+            {"type": "net_pay", "labels": ["net pay"], "value": "amount"},
+        ],
+    },
+]
+
+# Words of a table header row next to its label, e.g. "Earnings  Rate  Hours  This Period  YTD"
+SECTION_COLUMNS = ('rate', 'hours', 'current', 'this period', 'ytd', 'year to date', 'amount')
+_COLUMN_WORDS = {word for column in SECTION_COLUMNS for word in column.split()}
+
+VALUE_PATTERNS = {
+    'amount': re.compile(r'^\(?-?\$?[0-9][0-9,]*\.[0-9]{2}\)?$'),
+    'date': re.compile(r'^([0-9]{1,2})/([0-9]{1,2})/([0-9]{2}|[0-9]{4})$'),
+    'year': re.compile(r'^(19|20)[0-9]{2}$'),
+}
+
+# How far from its label a value may be, in rows (values below a label) and in points
+MAX_ROWS_BELOW = 3
+MAX_GAP = 300
+
+DOCUMENTS = metrics_util.counter(
+    'docproc_text_layer_documents', 'Documents offered to the text-layer extractor, by outcome.',
+    ('document_type', 'outcome'))
+
+Word = namedtuple('Word', ['x0', 'y0', 'x1', 'y1', 'text', 'key'])
+Row = namedtuple('Row', ['page', 'y0', 'y1', 'words'])
+Layout = namedtuple('Layout', ['name', 'document_type', 'anchors', 'min_anchors', 'fields'])
+
+_PUNCTUATION = ':,.;#()'
+_NUMBER = re.compile(r'^\(?-?\$?[0-9][0-9,]*(\.[0-9]+)?\)?$')
+
+
+def _key(text):
+    return text.lower().strip(_PUNCTUATION)
+
+
+def load_layouts(path=None):
+    """The built-in layouts, after those of the JSON file at path (a list shaped like DEFAULT_LAYOUTS)."""
+    layouts = []
+    if path:
+        with open(path) as f:
+            layouts.extend(json.load(f))
+    layouts.extend(DEFAULT_LAYOUTS)
+    return [
+        Layout(layout['name'], layout['document_type'], [anchor.lower() for anchor in layout['anchors']],
+               layout.get('min_anchors', len(layout['anchors'])), layout['fields'])
+        for layout in layouts
+    ]
+
+
+def read_rows(pdf):
+    """Words of every page grouped into rows by vertical position, top to bottom and left to right."""
+    rows = []
+    for page in pdf:
+        words = sorted(
+            (Word(x0, y0, x1, y1, text, _key(text)) for x0, y0, x1, y1, text, *_ in page.get_text('words')),
+            key=lambda word: ((word.y0 + word.y1) / 2, word.x0),
+        )
+        current = []
+        for word in words:
+            if current and (word.y0 + word.y1) / 2 > current[0].y1:
+                rows.append(Row(page.number, current[0].y0, current[0].y1, sorted(current, key=lambda w: w.x0)))
+                current = []
+            current.append(word)
+        if current:
+            rows.append(Row(page.number, current[0].y0, current[0].y1, sorted(current, key=lambda w: w.x0)))
+    return rows
+
+
+def usable_text(rows):
+    """True when the text layer has enough text and is not mostly unmapped glyphs."""
+    text = ''.join(word.text for row in rows for word in row.words)
+    if len(text) < config.TEXT_LAYER_MIN_CHARS:
+        return False
+    garbled = sum(1 for char in text if char == '�' or not char.isprintable())
+    return garbled <= 0.02 * len(text)
+
+
+def find_label(rows, label):
+    """(row index, first word index, last word index) of every occurrence of a label phrase."""
+    tokens = [token for token in (_key(part) for part in label.split()) if token]
+    found = []
+    for row_index, row in enumerate(rows):
+        keys = [word.key for word in row.words]
+        for start in range(len(keys) - len(tokens) + 1):
+            if keys[start:start + len(tokens)] == tokens:
+                found.append((row_index, start, start + len(tokens) - 1))
+    return found
+
+
+def _normalize(kind, text):
+    """(raw value, normalized value) as Document AI reports them, e.g. dates as MM/DD/YYYY and ISO."""
+    if kind == 'date':
+        month, day, year = VALUE_PATTERNS['date'].match(text).groups()
+        year = int(year) + 2000 if len(year) == 2 else int(year)
+        try:
+            date = datetime(year, int(month), int(day))
+        except ValueError:
+            return None
+        return date.strftime('%m/%d/%Y'), date.strftime('%Y-%m-%d')
+    return text, ''
+
+
+def _values_near(rows, occurrence, kind, index):
+    """[(raw, normalized, confidence)] of the value next to one label occurrence, or []."""
+    row_index, first, last = occurrence
+    row = rows[row_index]
+    label_x0, label_x1 = row.words[first].x0, row.words[last].x1
+    height = max(row.y1 - row.y0, 1)
+
+    right = row.words[last + 1:]
+    if kind == 'text':
+        # The words up to the first wide gap, where the next column starts
+        words, previous_x1 = [], label_x1
+        for word in right:
+            if word.x0 - previous_x1 > (MAX_GAP if not words else 2 * height):
+                break
+            words.append(word.text)
+            previous_x1 = word.x1
+        text = ' '.join(words).strip(_PUNCTUATION + ' ')
+        return [(text, '', 0.9)] if text else []
+    matches = [word for word in right if VALUE_PATTERNS[kind].match(word.text.strip(':'))]
+    if len(matches) > index and matches[index].x0 - label_x1 < MAX_GAP:
+        value = _normalize(kind, matches[index].text.strip(':'))
+        return [value + (0.99,)] if value else []
+
+    # Below the label, within the columns it spans (the box of a W-2 field)
+    if index:
+        return []
+    for offset, below in enumerate(rows[row_index + 1:row_index + 1 + MAX_ROWS_BELOW]):
+        if below.page != row.page or below.y0 - row.y1 > MAX_ROWS_BELOW * height:
+            break
+        values = sorted(
+            (abs(word.x0 - label_x0), word.text) for word in below.words
+            if label_x0 <= word.x1 and word.x0 <= label_x1 and VALUE_PATTERNS[kind].match(word.text)
+        )
+        for _, text in values:
+            value = _normalize(kind, text)
+            if value:
+                return [value + (0.97 - 0.08 * offset,)]
+    return []
+
+
+def read_field(rows, field):
+    """(raw value, normalized value, confidence) of a labelled field, or None."""
+    kind, index = field.get('value', 'text'), field.get('index', 0)
+    candidates = []
+    for label in field['labels']:
+        for occurrence in find_label(rows, label):
+            candidates.extend(_values_near(rows, occurrence, kind, index))
+    if not candidates:
+        return None
+    raw, normalized, confidence = max(candidates, key=lambda candidate: candidate[2])
+    # A label printed several times (copies of a W-2) must give one value
+    if len({candidate[0] for candidate in candidates}) > 1:
+        confidence *= 0.6
+    return raw, normalized, confidence
+
+
+def read_section(rows, section):
+    """(earning line, confidence) for every row of a table section such as Earnings."""
+    headers = [
+        (row_index, first, last)
+        for label in section['header'] for row_index, first, last in find_label(rows, label)
+        if any(find_label([rows[row_index]], column) for column in SECTION_COLUMNS)
+    ]
+    if not headers:
+        return []
+    row_index, first, last = headers[0]
+    header = rows[row_index]
+    # Only the columns under the header, up to the first header word that is not a column name,
+    # so a table printed alongside (deductions) is left out
+    left, right = header.words[first].x0 - 5, header.words[-1].x1 + 5
+    for word in header.words[last + 1:]:
+        if word.key not in _COLUMN_WORDS:
+            right = word.x0 - 1
+            break
+    end_labels = [[_key(part) for part in label.split()] for label in section['end']]
+
+    lines = []
+    for row in rows[row_index + 1:]:
+        if row.page != header.page:
+            break
+        words = [word for word in row.words if word.x0 >= left and word.x1 <= right]
+        keys = [word.key for word in words]
+        if not words or any(keys[:len(end)] == end for end in end_labels):
+            break
+        # A line is a description followed by its columns (rate, hours, this period, YTD), as printed
+        numbers = [bool(_NUMBER.match(word.text)) for word in words]
+        if numbers[0] or not any(VALUE_PATTERNS['amount'].match(word.text) for word in words):
+            continue
+        columns = len(numbers) - numbers.index(True)
+        if not all(numbers[-columns:]):
+            continue
+        lines.append((' '.join(word.text for word in words), 0.95 if columns >= 2 else 0.8))
+    return lines
+
+
+def match_layout(rows, document_type, layouts):
+    """(layout, fraction of its anchors present) of the best layout for document_type, or (None, 0)."""
+    text = ' '.join(word.key for row in rows for word in row.words)
+    best, best_score = None, 0.0
+    for layout in layouts:
+        if layout.document_type != document_type:
+            continue
+        present = sum(1 for anchor in layout.anchors if ' '.join(_key(part) for part in anchor.split()) in text)
+        if present >= layout.min_anchors and present / len(layout.anchors) > best_score:
+            best, best_score = layout, present / len(layout.anchors)
+    return best, best_score
+
+
+def extract_rows(rows, document_type, layouts, min_confidence):
+    """(EntitySet, outcome): the entities of a layout matched in rows, or None and why not."""
+    layout, score = match_layout(rows, document_type, layouts)
+    if layout is None:
+        return None, 'no_layout'
+    # Fields of a layout matched on only part of its anchors are trusted less
+    layout_factor = 0.9 + 0.1 * score
+    entities = EntitySet()
+    for field in layout.fields:
+        if 'section' in field:
+            values = [(line, '', confidence) for line, confidence in read_section(rows, field['section'])]
+        else:
+            value = read_field(rows, field)
+            values = [value] if value else []
+        values = [(raw, normalized, round(confidence * layout_factor, 3)) for raw, normalized, confidence in values]
+        confident = [value for value in values if value[2] >= min_confidence]
+        if field.get('required') and not confident:
+            print(f"Text layer ({layout.name}): {field['type']} not found with confidence {min_confidence}: {values}")
+            return None, 'low_confidence'
+        for raw, normalized, confidence in confident:
+            entities.append(ExtractedEntity(field['type'], raw, normalized, confidence))
+    return entities, 'extracted'
+
+
+_layouts = None
+_layouts_lock = threading.Lock()
+
+
+def get_layouts():
+    """Process-wide layouts: TEXT_LAYER_LAYOUTS_PATH, then the built-in ones, loaded on first use."""
+    global _layouts
+    if _layouts is None:
+        with _layouts_lock:
+            if _layouts is None:
+                _layouts = load_layouts(config.TEXT_LAYER_LAYOUTS_PATH)
+    return _layouts
+
+
+def reset_layouts():
+    """Drop the loaded layouts so the next call reloads TEXT_LAYER_LAYOUTS_PATH."""
+    global _layouts
+    with _layouts_lock:
+        _layouts = None
+
+
+def extract(source, mime_type, document_type):
+    """
+    EntitySet of a W-2 or paystub PDF (UploadBuffer, bytes or local path) read from its text
+    layer, or None when it should go to Document AI instead.
+    """
+    if not config.TEXT_LAYER_FAST_PATH or mime_type != 'application/pdf':
+        return None
+    try:
+        with open_pdf(source) as pdf:
+            # W-2s and stubs are a page or two; reading a long document's words would only cost time
+            rows = read_rows(pdf) if pdf.page_count <= config.TEXT_LAYER_MAX_PAGES else None
+    except Exception as e:
+        print(f"Could not read the text layer: {e}")
+        return None
+    if rows is None:
+        entities, outcome = None, 'too_many_pages'
+    elif not usable_text(rows):
+        entities, outcome = None, 'no_text_layer'
+    else:
+        entities, outcome = extract_rows(rows, document_type, get_layouts(), config.TEXT_LAYER_MIN_CONFIDENCE)
+    DOCUMENTS.inc(document_type=document_type, outcome=outcome)
+    if entities is not None:
+        print(f"Extracted {len(entities)} {document_type} entities from the text layer")
+    return entities
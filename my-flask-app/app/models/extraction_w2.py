@@ -1,9 +1,11 @@
-from typing import List, Dict, Any
-from google.cloud import documentai_v1 as documentai
-from ..utils.doc_ai_util import online_process
-from ..utils.firestore_util import initialize_firestore, store_data_in_firestore
-from ..utils.google_sheets_util import SheetPopulator
-import json
+from ..utils.firestore_util import store_data_in_firestore
+from ..utils.spreadsheet_actor_util import populate_spreadsheet
+from ..utils.jobs_util import track_stage
+from ..utils.docai_cache_util import get_document_cache, file_cache_key
+from ..utils.docai_router_util import process_document
+from ..utils.pdf_optimize_util import prepare_document
+from .extracted_entity import EntitySet
+from . import extraction_text_layer
 from ..config import get_config
 import os
 
@@ -13,42 +15,53 @@ env = os.getenv('APP_ENV', 'default')
 # Get the configuration for the current environment
 config = get_config(env)
 
-def save_data_to_json(data, filename='data.json'):
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=4)
-    return filename
-
-def extract_data(document: documentai.Document) -> List[Dict[str, Any]]:
-    data = []
-    for entity in document.entities:
-        data.append({
-            'Type': entity.type_,
-            'Raw Value': entity.mention_text,
-            'Normalized Value': entity.normalized_value.text,
-            'Confidence': f"{entity.confidence:.0%}"
-        })
-
-        for prop in entity.properties:
-            data.append({
-                'Type': prop.type_,
-                'Raw Value': prop.mention_text,
-                'Normalized Value': prop.normalized_value.text,
-                'Confidence': f"{prop.confidence:.0%}"
-            })
-    return data
+def extract_w2_entities(project_id, location, processor_id, file_path, mime_type):
+    """
+    Extracts the W-2 entities, from the text layer or with Google Document AI, and stores them in Firestore.
+    Returns an EntitySet.
+    """
+    # Generated forms are read from their text layer; those results are not cached, as the
+    # cache holds Document AI output and the text layer is cheaper to read than the cache
+    with track_stage('text_layer'):
+        entities = extraction_text_layer.extract(file_path, mime_type, 'w2')
 
-def w2_extractor(project_id, location, processor_id, file_path, mime_type, spreadsheet_id):
-    document = online_process(project_id, location, processor_id, file_path, mime_type)
-    data = extract_data(document.document)
-    
-    json_filename = save_data_to_json(data)
-    initialize_firestore()
-    store_data_in_firestore(data, 'w2-entities')
-
-    # Initialize SheetPopulator and populate the Google Sheet
+    cache = None
+    if entities is None:
+        cache = get_document_cache()
+        cache_key = file_cache_key(file_path, processor_id) if cache else None
+        records = cache.get(cache_key) if cache else None
+
+        # A cached result skips Document AI and Firestore and goes straight to the sheet
+        if records is not None:
+            return EntitySet.from_records(records)
+
+        # The cache stays keyed by the upload itself; only what is sent to Document AI is optimized
+        document_file = prepare_document(file_path, mime_type, 'w2')
+        with track_stage('document_ai'):
+            document = process_document(project_id, location, processor_id, document_file, mime_type)
+        entities = EntitySet.from_document(document, config.ENTITY_MIN_CONFIDENCE or None)
+
+    with track_stage('firestore'):
+        store_data_in_firestore(entities.to_records(), 'w2-entities')
+
+    if cache:
+        cache.set(cache_key, entities.to_records())
+    return entities
+
+def w2_population(entities):
+    """populate(populator) writing the W-2 entities, for a SpreadsheetActor."""
+    def populate(sheet_populator):
+        sheet_populator.populate_sheet(True, entities)
+    return populate
+
+def populate_w2_sheet(spreadsheet_id, entities):
+    # Populate the Google Sheet through its actor, so concurrent W-2s get distinct year slots
     google_sheets_credentials = os.getenv('GOOGLE_SHEETS_CREDENTIALS')
     google_sheets_url = f'https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit?usp=sharing'
-    
-    sheet_populator = SheetPopulator(google_sheets_credentials, google_sheets_url)
 
-    sheet_populator.populate_sheet(True, data)
\ No newline at end of file
+    with track_stage('sheets'):
+        populate_spreadsheet(google_sheets_url, w2_population(entities), google_sheets_credentials)
+
+def w2_extractor(project_id, location, processor_id, file_path, mime_type, spreadsheet_id):
+    entities = extract_w2_entities(project_id, location, processor_id, file_path, mime_type)
+    populate_w2_sheet(spreadsheet_id, entities)
@@ -1,23 +1,66 @@
-from .fannie_mae_operations.extraction_scheduleC import scheduleC_extractor
-from .fannie_mae_operations.splitter import main_process_batch_splitter
+from .fannie_mae_operations import extraction_scheduleC  # noqa: F401 (registers its section handler)
+from .fannie_mae_operations.section_dispatcher import extract_sections, section_labels
+from .fannie_mae_operations.splitter import (
+    split_1040_package, split_route, split_locally, cached_split_manifest,
+    submit_batch_split, finish_batch_split, archive_prefix_for
+)
 from ..config import get_config
+from ..utils.docai_router_util import BATCH
+from ..utils.jobs_util import track_stage
+from ..utils.lro_util import register_operation_callback
 import os
 import tempfile
 
 config = get_config(os.getenv('APP_ENV', 'default'))
 
+# Splitter sections we extract data from (those with a section handler); only these are written out locally
+EXTRACTED_SECTIONS = section_labels()
+
+# Operation manager callback kind for batch-split 1040 packages
+BATCH_SPLIT_KIND = '1040_batch_split'
+
 def process_1040_document(project_id, location, processor_id, pdf_name, file_path, spreadsheet_id):
-    tmpdirname = tempfile.mkdtemp()
-    
-    output_files = main_process_batch_splitter(
-        project_id=project_id,
-        location=location,
-        processor_id=processor_id,
-        pdf_name=pdf_name,
-        file_path=file_path,
-        output_files=tmpdirname
-    )
-    for local_file, _ in output_files:
-        
-        if 'schedule_C.pdf' in local_file:
-            scheduleC_extractor(local_file, spreadsheet_id)
\ No newline at end of file
+    """
+    Splits a 1040 package and extracts its sections into the spreadsheet.
+    With LRO_MANAGER_ENABLED, packages that need the batch splitter are handed to the
+    operation manager and a Future is returned instead of waiting for the batch job.
+    """
+    plan = split_route(file_path)
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        if config.LRO_MANAGER_ENABLED and plan.route == BATCH:
+            manifest = cached_split_manifest(file_path, processor_id)
+            if manifest is None:
+                with track_stage('split_submit'):
+                    return submit_batch_split(
+                        project_id, location, processor_id, pdf_name, file_path,
+                        BATCH_SPLIT_KIND, {'spreadsheet_id': spreadsheet_id}
+                    )
+            output_files = split_locally(
+                manifest, file_path, pdf_name, tmpdirname, EXTRACTED_SECTIONS, archive_prefix_for(pdf_name)
+            )
+            extract_sections(output_files, spreadsheet_id)
+            return
+
+        with track_stage('split'):
+            output_files = split_1040_package(
+                project_id=project_id,
+                location=location,
+                processor_id=processor_id,
+                pdf_name=pdf_name,
+                file_path=file_path,
+                output_files=tmpdirname,
+                sections=EXTRACTED_SECTIONS,
+                plan=plan
+            )
+        extract_sections(output_files, spreadsheet_id)
+
+@register_operation_callback(BATCH_SPLIT_KIND)
+def complete_batch_split(operation, context):
+    """Continues the 1040 pipeline once the batch split operation has finished."""
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        with track_stage('split'):
+            manifest, local_pdf_path, archive_prefix = finish_batch_split(operation, context, tmpdirname)
+            output_files = split_locally(
+                manifest, local_pdf_path, context['pdf_name'], tmpdirname, EXTRACTED_SECTIONS, archive_prefix
+            )
+        extract_sections(output_files, context['spreadsheet_id'])
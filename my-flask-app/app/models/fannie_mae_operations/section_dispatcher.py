@@ -0,0 +1,144 @@
+import contextvars
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from ...utils.google_sheets_util import SheetPopulatorWithoutAI
+from ...utils.jobs_util import Job, job_context, observe_stage, track_stage
+from ...config import get_config
+
+# Get the current environment ('development', 'testing', 'production')
+env = os.getenv('APP_ENV', 'default')
+
+# Get the configuration for the current environment
+config = get_config(env)
+
+# extract(pdf_path) returns {field: value}; cell_map maps those fields to Fannie Mae sheet cells.
+# cpu_bound extractors (PyMuPDF region extraction) run in the process pool so sections do not
+# contend for the GIL; the others (e.g. Document AI calls) run in the thread pool.
+SectionHandler = namedtuple('SectionHandler', ['label', 'extract', 'cell_map', 'stage', 'cpu_bound'])
+
+_handlers = {}
+
+_section_executor = ThreadPoolExecutor(max_workers=config.SECTION_THREAD_WORKERS, thread_name_prefix='1040-section')
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def register_section_handler(label, cell_map, stage, cpu_bound=True):
+    """
+    Decorator registering extract(pdf_path) for split sections whose type ends with label.
+    extract must be a module-level function so it can be sent to the process pool.
+    """
+    def decorator(extract):
+        _handlers[label] = SectionHandler(label, extract, cell_map, stage, cpu_bound)
+        return extract
+    return decorator
+
+
+def section_labels():
+    """Section types the splitter should write out, i.e. those with a handler."""
+    return tuple(_handlers)
+
+
+def handler_for(local_file):
+    """The handler for a split section file such as return_pg3-4_schedule_C.pdf, or None."""
+    stem = os.path.splitext(os.path.basename(local_file))[0]
+    for label, handler in _handlers.items():
+        if stem.endswith(label):
+            return handler
+    return None
+
+
+def get_process_pool():
+    """Return the process-wide pool for CPU-bound section extraction, creating it on first use."""
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                # spawn: forking a process that runs request and poller threads is not safe
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=config.SECTION_PROCESS_WORKERS,
+                    mp_context=multiprocessing.get_context(config.SECTION_PROCESS_START_METHOD),
+                )
+    return _process_pool
+
+
+def _reset_after_fork():
+    global _process_pool, _process_pool_lock
+    _process_pool = None
+    _process_pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def run_section(extract, stage, pdf_path):
+    """Run one extractor under a throwaway Job; returns (values, stage seconds) to replay in the parent."""
+    job = Job()
+    with job_context(job):
+        with track_stage(stage):
+            values = extract(pdf_path)
+    return values, dict(job.stages)
+
+
+def _run_section_in_thread(handler, local_file):
+    with track_stage(handler.stage):
+        return handler.extract(local_file)
+
+
+def _submit(handler, local_file, in_process):
+    if handler.cpu_bound and in_process:
+        return get_process_pool().submit(run_section, handler.extract, handler.stage, local_file), True
+    # Threads share the current job, so stages and API calls are recorded on it directly
+    context = contextvars.copy_context()
+    return _section_executor.submit(context.run, _run_section_in_thread, handler, local_file), False
+
+
+def extract_section_values(output_files):
+    """
+    Run the extractor of every split section concurrently and merge their results into
+    {cell: value}. A lone section runs on the calling thread, where a pool would only add overhead.
+    """
+    sections = [(local_file, handler_for(local_file)) for local_file, _ in output_files or []]
+    sections = [(local_file, handler) for local_file, handler in sections if handler is not None]
+    if not sections:
+        return {}
+
+    if len(sections) == 1:
+        local_file, handler = sections[0]
+        results = [(handler, _run_section_in_thread(handler, local_file))]
+    else:
+        in_process = config.SECTION_PROCESS_WORKERS > 0
+        futures = [(handler, _submit(handler, local_file, in_process)) for local_file, handler in sections]
+        results = []
+        for handler, (future, replay_stages) in futures:
+            values = future.result()
+            if replay_stages:
+                values, stages = values
+                for name, seconds in stages.items():
+                    observe_stage(name, seconds)
+            results.append((handler, values))
+
+    merged = {}
+    for handler, values in results:
+        print(f"Extracted {handler.label} data: {values}")
+        for field, value in values.items():
+            if field in handler.cell_map and value is not None:
+                merged[handler.cell_map[field]] = value
+    return merged
+
+
+def extract_sections(output_files, spreadsheet_id):
+    """Extract every split section and write all of them to the spreadsheet in one update."""
+    values = extract_section_values(output_files)
+    if not values:
+        return
+
+    google_sheets_credentials = os.getenv('GOOGLE_SHEETS_CREDENTIALS')
+    google_sheets_url = f'https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit?usp=sharing'
+
+    with track_stage('sheets'):
+        google_sheet_populator = SheetPopulatorWithoutAI(google_sheets_credentials, google_sheets_url)
+        google_sheet_populator.populate_cells(values)
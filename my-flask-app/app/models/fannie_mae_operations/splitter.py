@@ -1,7 +1,18 @@
 import os
-from google.cloud import storage
-from ...utils.gcs_operations import download_blob, upload_file_to_gcs
-from ...utils.batch_processing_util import setup_documentai_processing_batch, get_output_paths, split_pdf_from_json
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from ...utils.doc_ai_util import online_process
+from ...utils.gcs_operations import upload_file_to_gcs
+from ...utils.gcs_transfer_util import download_many, upload_many
+from ...utils.batch_processing_util import (
+    setup_documentai_processing_batch, submit_documentai_processing_batch, get_output_paths,
+    build_split_manifest, manifest_from_document, join_shard_sections, split_pdf_sections, split_pdf_from_manifest
+)
+from ...utils.docai_cache_util import get_document_cache, file_cache_key
+from ...utils.docai_router_util import BATCH, SHARDED, plan_route, process_sharded
+from ...utils.lro_util import get_operation_manager
+from ...utils.upload_buffer_util import read_document
 from ...config import get_config
 
 
@@ -11,61 +22,201 @@ env = os.getenv('APP_ENV', 'default')
 # Get the configuration for the current environment
 config = get_config(env)
 
-def main_process_batch_splitter(project_id, location, processor_id, pdf_name, file_path, output_files):
+# Archival uploads of split PDFs run here, off the request path
+_archive_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='split-archive')
+_pending_archives = set()
+_pending_archives_lock = threading.Lock()
 
-    processing_dir = os.path.dirname(file_path)
-    upload_file_to_gcs(file_path, config.INPUT_BUCKET, pdf_name)
+def archive_split_pdfs(pdf_bytes, manifest, pdf_name, prefix):
+    """
+    Uploads every split section of the PDF to the output bucket under prefix, each section
+    as soon as it is split, and returns the transfer manifest.
+    """
+    transfers = upload_many(
+        ((content, f"{prefix}{filename}", 'application/pdf')
+         for filename, content in split_pdf_sections(manifest, pdf_bytes, pdf_name)),
+        config.OUTPUT_BUCKET
+    )
+    print(f"Archived {len(transfers)} split PDFs ({sum(entry['bytes'] for entry in transfers)} bytes) "
+          f"to gs://{config.OUTPUT_BUCKET}/{prefix}")
+    return transfers
+
+def _archive_done(future):
+    with _pending_archives_lock:
+        _pending_archives.discard(future)
+    if future.exception() is not None:
+        print(f"Error archiving split PDFs: {future.exception()}")
+
+def wait_for_archives(timeout=None):
+    """Block until the archival uploads queued so far have finished."""
+    with _pending_archives_lock:
+        pending = list(_pending_archives)
+    wait(pending, timeout=timeout)
+
+def batch_input_name(pdf_name):
+    """
+    Object name of a package in the input bucket. Unique, since batch splits of packages uploaded
+    under the same file name may be in flight (or resumed) at the same time.
+    """
+    return f"splits/{uuid.uuid4().hex}/{pdf_name}"
+
+def archive_prefix_for(pdf_name):
+    return f"split_pdfs/{os.path.splitext(pdf_name)[0]}/"
+
+def split_locally(manifest, file_path, pdf_name, output_files, sections, archive_prefix):
+    """
+    Splits the local PDF per the manifest, writing only the requested sections to output_files,
+    and queues archival of all sections when ARCHIVE_SPLIT_PDFS is set.
+    Returns a list of (local path, GCS path) tuples; the GCS path is None when not archived.
+    """
+    split_files = split_pdf_from_manifest(manifest, file_path, output_files, pdf_name, section_types=sections)
+
+    archived = config.ARCHIVE_SPLIT_PDFS
+    if archived:
+        pdf_bytes = read_document(file_path)
+        future = _archive_executor.submit(archive_split_pdfs, pdf_bytes, manifest, pdf_name, archive_prefix)
+        with _pending_archives_lock:
+            _pending_archives.add(future)
+        future.add_done_callback(_archive_done)
+
+    print(f"Split PDFs to {output_files}")
+    return [
+        (os.path.join(output_files, file),
+         f"gs://{config.OUTPUT_BUCKET}/{archive_prefix}{file}" if archived else None)
+        for file in split_files
+    ]
+
+def main_process_online_splitter(project_id, location, processor_id, pdf_name, file_path, output_files, sections=None,
+                                 plan=None):
+    """
+    Splits a 1040 package with online processing and PyMuPDF, without a GCS round trip.
+    With a sharded plan (see split_route) the shards are split online concurrently.
+    """
+    cache = get_document_cache()
+    cache_key = file_cache_key(file_path, processor_id) if cache else None
+    manifest = cache.get(cache_key) if cache else None
+
+    if manifest is None:
+        if plan is not None and plan.route == SHARDED:
+            document = process_sharded(project_id, location, processor_id, file_path, plan.shards)
+            manifest = join_shard_sections(manifest_from_document(document), plan.shards)
+        else:
+            result = online_process(project_id, location, processor_id, file_path, 'application/pdf')
+            manifest = manifest_from_document(result.document)
+        if cache:
+            cache.set(cache_key, manifest)
+
+    return split_locally(manifest, file_path, pdf_name, output_files, sections, archive_prefix_for(pdf_name))
+
+def cached_split_manifest(file_path, processor_id):
+    """Returns the cached split manifest for this PDF, or None."""
+    cache = get_document_cache()
+    return cache.get(file_cache_key(file_path, processor_id)) if cache else None
+
+def read_batch_split_output(operation, output_dir, extra_downloads=()):
+    """
+    Downloads the batch output JSON of every output directory (concurrently, each to its own
+    file) and returns (split manifest, output blob path). extra_downloads, (gs:// URI, local path)
+    pairs, are fetched in the same round of transfers.
+    """
+    output_directories = get_output_paths(operation)
+    print("json_path:", output_directories)
+
+    downloads = [
+        (f"{directory}output-document.json", os.path.join(output_dir, f"output-document-{index}.json"))
+        for index, directory in enumerate(output_directories)
+    ]
+    download_many(downloads + list(extra_downloads))
+
+    manifest = []
+    for _, local_json_path in downloads:
+        manifest.extend(build_split_manifest(local_json_path))
+    blob_path = output_directories[-1].replace('gs://', '').split('/', 1)[1] if output_directories else ''
+    return manifest, blob_path
+
+def main_process_batch_splitter(project_id, location, processor_id, pdf_name, file_path, output_files, sections=None):
+
+    # A PDF we have already split skips the GCS round trip and batch job entirely
+    cache = get_document_cache()
+    cache_key = file_cache_key(file_path, processor_id) if cache else None
+    manifest = cache.get(cache_key) if cache else None
+    if manifest is not None:
+        print(f"Using cached split manifest for {pdf_name}")
+        return split_locally(manifest, file_path, pdf_name, output_files, sections, archive_prefix_for(pdf_name))
+
+    input_name = batch_input_name(pdf_name)
+    upload_file_to_gcs(file_path, config.INPUT_BUCKET, input_name)
 
     operation = setup_documentai_processing_batch(
         project_id=project_id,
         location=location,
         processor_id=processor_id,
-        pdf_name=pdf_name,
+        pdf_name=input_name,
     )
-    # Find the JSON output file
-    storage_client = storage.Client(project_id)
 
-    output_directories = get_output_paths(operation)
-    print("json_path:", output_directories)
-    
-    tmpdirname = output_files
-    local_json_path = os.path.join(tmpdirname, 'output-document.json')
-    local_pdf_path = os.path.join(tmpdirname, pdf_name) 
-    
-    for directory in output_directories:
-        json_file_path = directory + "output-document.json"
-        bucket_name, blob_path = directory.replace('gs://', '').split('/', 1)
-        # Download the JSON
-        download_blob(storage_client, bucket_name, blob_path + "output-document.json", local_json_path)
-    
-    # Download the original PDF from the correct bucket
+    # Split the local copy of the PDF rather than downloading it back from the input bucket
     try:
-        download_blob(storage_client, config.INPUT_BUCKET, pdf_name, local_pdf_path) 
+        manifest, blob_path = read_batch_split_output(operation, output_files)
     except Exception as e:
-        print(f"Error downloading original PDF: {e}")
-        return  # Exit if PDF can't be downloaded
-
-    # Split PDF into smaller PDFs in the temporary directory
-    try:
-        split_pdf_from_json(local_json_path, local_pdf_path, tmpdirname)
-    except Exception as e:
-        print(f"Error splitting PDF: {e}")
+        print(f"Error reading split output: {e}")
         return
+    if cache:
+        cache.set(cache_key, manifest)
 
-    print(f"Split PDFs to {tmpdirname}")
-    print(f"input file path: {processing_dir}")
-    file_paths = []  # List to store local file paths
-    # Save the local path of each split file along with its GCS path
-    for file in os.listdir(tmpdirname):
-        local_file_path = os.path.join(tmpdirname, file)
-        gcs_file_path = f"gs://{config.OUTPUT_BUCKET}/{blob_path}split_pdfs/{file}"
-        file_paths.append((local_file_path, gcs_file_path))
+    file_paths = split_locally(manifest, file_path, pdf_name, output_files, sections, f"{blob_path}split_pdfs/")
+    print("All operations completed successfully.")
 
-    # Upload the split PDFs
-    for local_file_path, gcs_file_path in file_paths:
-        bucket_name, blob_path = gcs_file_path.replace('gs://', '').split('/', 1)
-        upload_file_to_gcs(local_file_path, bucket_name, blob_path)
+    return file_paths  # Return list of tuples containing local and GCS file paths
 
-    print("All operations completed successfully.")
+def submit_batch_split(project_id, location, processor_id, pdf_name, file_path, kind, context):
+    """
+    Uploads the PDF, starts the batch split job and hands it to the operation manager
+    without waiting. The callback registered for kind receives the operation and context;
+    see finish_batch_split. Returns the manager's Future.
+    """
+    input_name = batch_input_name(pdf_name)
+    upload_file_to_gcs(file_path, config.INPUT_BUCKET, input_name)
+    operation = submit_documentai_processing_batch(
+        project_id=project_id,
+        location=location,
+        processor_id=processor_id,
+        pdf_name=input_name,
+    )
+    cache = get_document_cache()
+    context = dict(context, pdf_name=pdf_name, input_name=input_name,
+                   cache_key=file_cache_key(file_path, processor_id) if cache else None)
+    return get_operation_manager().track(operation.operation.name, kind, context, location)
+
+def finish_batch_split(operation, context, output_dir):
+    """
+    Completes a batch split started by submit_batch_split. The upload may be gone by now
+    (or the process restarted), so the original PDF is read back from the input bucket.
+    Returns (split manifest, local PDF path, archive prefix).
+    """
+    local_pdf_path = os.path.join(output_dir, os.path.basename(context['pdf_name']))
+    manifest, blob_path = read_batch_split_output(
+        operation, output_dir, [(f"gs://{config.INPUT_BUCKET}/{context['input_name']}", local_pdf_path)]
+    )
+    cache = get_document_cache()
+    if cache and context.get('cache_key'):
+        cache.set(context['cache_key'], manifest)
+    return manifest, local_pdf_path, f"{blob_path}split_pdfs/"
+
+def split_route(file_path):
+    """RoutePlan of the splitter for this PDF: SPLIT_MODE, or by size against the splitter's online limits."""
+    return plan_route(file_path, max_pages=config.ONLINE_SPLIT_MAX_PAGES, max_bytes=config.ONLINE_SPLIT_MAX_BYTES,
+                      mode=config.SPLIT_MODE)
 
-    return file_paths  # Return list of tuples containing local and GCS file paths
\ No newline at end of file
+def split_1040_package(project_id, location, processor_id, pdf_name, file_path, output_files, sections=None,
+                       plan=None):
+    """
+    Splits a 1040 package online, as concurrent online shards or with a batch job; see split_route.
+    plan is the package's split_route when the caller has already computed it.
+    """
+    if plan is None:
+        plan = split_route(file_path)
+    print(f"Splitting {pdf_name} ({plan.page_count} pages, {plan.bytes} bytes): {plan.route}")
+    if plan.route == BATCH:
+        return main_process_batch_splitter(project_id, location, processor_id, pdf_name, file_path, output_files, sections)
+    return main_process_online_splitter(project_id, location, processor_id, pdf_name, file_path, output_files, sections,
+                                        plan)
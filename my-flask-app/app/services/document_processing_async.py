@@ -0,0 +1,107 @@
+"""
+asyncio variant of the document pipeline, used by the ASGI entry point (asgi.py).
+
+Document AI calls are awaited on the asyncio client, so a document waiting on the network
+costs a coroutine rather than a worker thread. Storage, Firestore and the Document AI
+cache have no asyncio client in our dependencies and are offloaded with asyncio.to_thread, as is
+the 1040 pipeline, whose splitting and region extraction are PyMuPDF work. Sheets population
+goes through the spreadsheet's SpreadsheetActor on a thread too, so documents arriving here and
+through the Flask, batch and operation manager paths are serialized per spreadsheet together.
+"""
+import asyncio
+import os
+import weakref
+from concurrent.futures import Future
+from ..models import extraction_text_layer
+from ..models.extracted_entity import EntitySet
+from ..utils.docai_cache_util import get_document_cache, file_cache_key
+from ..utils import docai_router_util
+from ..utils.firestore_util import store_data_in_firestore
+from ..utils.jobs_util import track_stage
+from ..utils.pdf_optimize_util import prepare_document
+from .document_processing_fannie_mae import process_document_fannie_mae
+from .document_processing_w2_paystub import populate_document_w2_paystub
+from app.config import get_config
+
+# Get the configuration for the current environment
+config = get_config(os.getenv('APP_ENV', 'default'))
+
+# Processor id setting and Firestore collection per document type
+EXTRACTORS = {
+    'paystub': ('PAYSTUB_PROCESSOR_ID', 'paystub-entities'),
+    'w2': ('W2_PROCESSOR_ID', 'w2-entities'),
+}
+
+# asyncio primitives belong to one event loop, so they are kept per loop
+_documentai_slots = weakref.WeakKeyDictionary()
+
+
+def documentai_slots():
+    """Semaphore bounding the Document AI calls in flight on the running loop."""
+    loop = asyncio.get_running_loop()
+    slots = _documentai_slots.get(loop)
+    if slots is None:
+        slots = _documentai_slots[loop] = asyncio.Semaphore(config.ASYNC_DOCAI_CONCURRENCY)
+    return slots
+
+
+def _cached_records(upload, processor_id):
+    cache = get_document_cache()
+    if not cache:
+        return None, None
+    cache_key = file_cache_key(upload, processor_id)
+    return cache_key, cache.get(cache_key)
+
+
+async def extract_document_async(upload, mime_type, document_type):
+    """Async counterpart of extract_document_w2_paystub; returns an EntitySet."""
+    if document_type not in EXTRACTORS:
+        raise ValueError(f"Unsupported document type: {document_type}")
+    processor_setting, collection_name = EXTRACTORS[document_type]
+    processor_id = getattr(config, processor_setting)
+
+    cache_key, records = await asyncio.to_thread(_cached_records, upload, processor_id)
+    if records is not None:
+        return EntitySet.from_records(records)
+
+    with track_stage('text_layer'):
+        entities = await asyncio.to_thread(extraction_text_layer.extract, upload, mime_type, document_type)
+    if entities is None:
+        document_file = await asyncio.to_thread(prepare_document, upload, mime_type, document_type)
+        with track_stage('document_ai'):
+            async with documentai_slots():
+                document = await docai_router_util.process_document_async(
+                    config.PROJECT_ID, config.LOCATION, processor_id, document_file, mime_type)
+        entities = EntitySet.from_document(document, config.ENTITY_MIN_CONFIDENCE or None)
+    records = entities.to_records()
+
+    with track_stage('firestore'):
+        await asyncio.to_thread(store_data_in_firestore, records, collection_name)
+    if cache_key is not None:
+        await asyncio.to_thread(get_document_cache().set, cache_key, records)
+    return entities
+
+
+async def populate_document_async(document_type, spreadsheet_id, entities):
+    """
+    Async counterpart of populate_document_w2_paystub. The population is queued on the
+    spreadsheet's SpreadsheetActor like every other path's, from a thread, since the actor
+    reads and writes the sheet with pygsheets.
+    """
+    if document_type not in EXTRACTORS:
+        raise ValueError(f"Unsupported document type: {document_type}")
+    await asyncio.to_thread(populate_document_w2_paystub, document_type, spreadsheet_id, entities)
+
+
+async def process_document_async(upload, document_type, pdf_name, spreadsheet_id, mime_type='application/pdf'):
+    """Run the whole pipeline for one upload; the caller closes the upload."""
+    if document_type in EXTRACTORS:
+        entities = await extract_document_async(upload, mime_type, document_type)
+        await populate_document_async(document_type, spreadsheet_id, entities)
+    elif document_type == '1040':
+        result = await asyncio.to_thread(process_document_fannie_mae, upload, document_type, pdf_name, spreadsheet_id)
+        if isinstance(result, Future):
+            # A batch split finishes on the operation manager; wait for it without a thread
+            await asyncio.wrap_future(result)
+    else:
+        raise ValueError(f"Unsupported document type: {document_type}")
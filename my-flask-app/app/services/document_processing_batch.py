@@ -0,0 +1,108 @@
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from ..utils.jobs_util import Job, job_context, record_job_metrics, track_stage, RUNNING, SUCCEEDED, FAILED
+from ..utils.spreadsheet_actor_util import get_spreadsheet_actor
+from .document_processing_w2_paystub import extract_document_w2_paystub, document_population
+from .document_processing_fannie_mae import process_document_fannie_mae
+from app.config import get_config
+
+# Get the configuration for the current environment
+config = get_config(os.getenv('APP_ENV', 'default'))
+
+# Shared by all batch requests so the total number of concurrent Document AI calls stays bounded
+_executor = ThreadPoolExecutor(max_workers=config.BATCH_MAX_WORKERS, thread_name_prefix='batch-extract')
+
+
+def _extract(job, upload, document_type, pdf_name, spreadsheet_id):
+    """
+    Phase 1 for one file: Document AI extraction (paystub/W-2) or the whole 1040 pipeline.
+    A 1040 on the batch splitter returns the Future of its operation rather than holding the worker.
+    """
+    with job_context(job):
+        if document_type in ['paystub', 'w2']:
+            return extract_document_w2_paystub(upload, 'application/pdf', document_type)
+        # 1040s write to their own worksheet, so they can finish here without ordering concerns
+        return process_document_fannie_mae(upload, document_type, pdf_name, spreadsheet_id)
+
+
+def _finish(job, error=None):
+    if error is not None:
+        job.error = f"{type(error).__name__}: {error}"
+        job.state = FAILED
+        print(f"Batch file {job.filename} failed: {job.error}")
+    else:
+        job.state = SUCCEEDED
+    job.finished_at = time.time()
+    record_job_metrics(job)
+
+
+def _finish_when_done(job, future):
+    """Finish job in future's done callback; returns a Future resolved once it has been."""
+    finished = Future()
+
+    def callback(done):
+        _finish(job, done.exception())
+        finished.set_result(None)
+    future.add_done_callback(callback)
+    return finished
+
+
+def process_documents_batch(uploads, spreadsheet_id):
+    """
+    Process a borrower's files for one spreadsheet.
+
+    Document AI calls for all files run concurrently on a bounded executor; sheet writes for
+    paystubs and W-2s are then queued on the spreadsheet's actor in upload order, because W-2
+    year slots and paystub rows are assigned from what earlier files wrote. The actor applies
+    them one file at a time in memory and writes them together.
+
+    :param uploads: List of (UploadBuffer or file path, document_type, pdf_name) in upload order
+    :param spreadsheet_id: Google Sheets spreadsheet id all files are written to
+    :return: List of per-file result dicts, in upload order
+    """
+    jobs = [Job(document_type=document_type, filename=pdf_name) for _, document_type, pdf_name in uploads]
+    for job in jobs:
+        job.state = RUNNING
+        job.started_at = job.created_at
+
+    futures = [
+        _executor.submit(_extract, job, upload, document_type, pdf_name, spreadsheet_id)
+        for job, (upload, document_type, pdf_name) in zip(jobs, uploads)
+    ]
+
+    google_sheets_url = f'https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit?usp=sharing'
+    actor = get_spreadsheet_actor(google_sheets_url, os.getenv('GOOGLE_SHEETS_CREDENTIALS'))
+    queued, pending = [], []
+    for job, future, (_, document_type, _) in zip(jobs, futures, uploads):
+        try:
+            data = future.result()
+            if isinstance(data, Future):
+                # The 1040 finishes in its batch operation's callback
+                pending.append(_finish_when_done(job, data))
+                continue
+            if document_type in ['paystub', 'w2']:
+                with job_context(job):
+                    queued.append((job, actor.enqueue(document_population(document_type, data))))
+                continue
+        except Exception as e:
+            _finish(job, e)
+            continue
+        _finish(job)
+
+    for job, item in queued:
+        try:
+            with job_context(job), track_stage('sheets'):
+                actor.wait(item)
+        except Exception as e:
+            _finish(job, e)
+            continue
+        _finish(job)
+
+    wait(pending)
+    results = []
+    for job in jobs:
+        status = job.to_dict()
+        results.append({key: status[key] for key in
+                        ('filename', 'document_type', 'state', 'total_seconds', 'stages', 'error')})
+    return results
@@ -13,11 +13,12 @@ def process_document_fannie_mae(file_path, document_type, pdf_name, spreadsheet_
     :param file_path: Path to the file to be processed
     :param pdf_name:  Name of the pdf file
     :param document_type: Type of the document (e.g., 'paystub', 'w2', '1040')
+    :return: None, or a Future when the batch split continues in the background
     """
     # Retrieve configuration from Flask app context
     project_id = config.PROJECT_ID
     location = config.LOCATION
     if document_type == '1040':
         processor_id = config.SPLITTER_PROCESSOR_ID 
-        process_1040_document(project_id, location, processor_id, pdf_name, file_path, spreadsheet_id=spreadsheet_id)
+        return process_1040_document(project_id, location, processor_id, pdf_name, file_path, spreadsheet_id=spreadsheet_id)
     
\ No newline at end of file
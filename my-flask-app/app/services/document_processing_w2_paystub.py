@@ -1,8 +1,10 @@
 from flask import current_app as app
 import os
 from ..utils.doc_ai_util import online_process
-from ..models.extraction_paystub import paystub_extractor as extract_paystub
-from ..models.extraction_w2 import w2_extractor as extract_w2
+from ..models.extraction_paystub import (
+    paystub_extractor as extract_paystub, extract_paystub_entities, populate_paystub_sheet, paystub_population
+)
+from ..models.extraction_w2 import w2_extractor as extract_w2, extract_w2_entities, populate_w2_sheet, w2_population
 from app.config import get_config
 
 # Get the configuration for the current environment
@@ -31,4 +33,41 @@ def process_document_w2_paystub(file_path, mime_type, document_type, spreadsheet
     elif document_type == 'w2':
         return extract_w2(project_id, location, processor_id, file_path, mime_type, spreadsheet_id)
     else:
-        raise ValueError(f"Unsupported document type: {document_type}")
\ No newline at end of file
+        raise ValueError(f"Unsupported document type: {document_type}")
+
+def extract_document_w2_paystub(file_path, mime_type, document_type):
+    """
+    Run only the Document AI / Firestore half of the pipeline and return the extracted EntitySet.
+
+    :param file_path: Path to the file to be processed
+    :param mime_type: MIME type of the file
+    :param document_type: Type of the document (e.g., 'paystub', 'w2')
+    """
+    project_id = config.PROJECT_ID
+    location = config.LOCATION
+    if document_type == 'paystub':
+        return extract_paystub_entities(project_id, location, config.PAYSTUB_PROCESSOR_ID, file_path, mime_type)
+    elif document_type == 'w2':
+        return extract_w2_entities(project_id, location, config.W2_PROCESSOR_ID, file_path, mime_type)
+    else:
+        raise ValueError(f"Unsupported document type: {document_type}")
+
+
+def document_population(document_type, entities):
+    """populate(populator) writing the EntitySet, to queue on the spreadsheet's SpreadsheetActor."""
+    if document_type == 'paystub':
+        return paystub_population(entities)
+    elif document_type == 'w2':
+        return w2_population(entities)
+    else:
+        raise ValueError(f"Unsupported document type: {document_type}")
+
+
+def populate_document_w2_paystub(document_type, spreadsheet_id, entities):
+    """Write the EntitySet returned by extract_document_w2_paystub to the spreadsheet."""
+    if document_type == 'paystub':
+        populate_paystub_sheet(spreadsheet_id, entities)
+    elif document_type == 'w2':
+        populate_w2_sheet(spreadsheet_id, entities)
+    else:
+        raise ValueError(f"Unsupported document type: {document_type}")
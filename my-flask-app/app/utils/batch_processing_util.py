@@ -1,13 +1,15 @@
 import os
-from google.cloud import documentai_v1 as documentai
-from google.api_core.client_options import ClientOptions
-from google.cloud.documentai_toolbox import document
+from .clients_util import get_documentai_client
+from .jobs_util import track_stage
+from .outbound_util import THROTTLED, call_api
+from .upload_buffer_util import open_pdf
 from ..config import get_config
 
 config = get_config(os.getenv('APP_ENV', 'default'))
 
 
-def setup_documentai_processing_batch(project_id, location, processor_id, pdf_name, mime_type="application/pdf"):
+def submit_documentai_processing_batch(project_id, location, processor_id, pdf_name, mime_type="application/pdf"):
+    """Starts a batch job for a PDF already in the input bucket and returns the operation without waiting."""
     input_uri=config.INPUT_URI+pdf_name
     output_uri=config.OUTPUT_URI
     print(f"Input URI: {input_uri}")
@@ -16,10 +18,8 @@ def setup_documentai_processing_batch(project_id, location, processor_id, pdf_na
     print(f"Location: {location}")
     print(f"Processor ID: {processor_id}")
     
-    
-    client = documentai.DocumentProcessorServiceClient(
-        client_options=ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
-    )
+    from google.cloud import documentai_v1 as documentai
+    client = get_documentai_client(location)
     # Create a GcsDocument for a single document processing
     gcs_document = documentai.GcsDocument(
         gcs_uri=input_uri,
@@ -38,9 +38,18 @@ def setup_documentai_processing_batch(project_id, location, processor_id, pdf_na
         document_output_config=output_config
     )
 
-    operation = client.batch_process_documents(request)
+    # Not idempotent: a timeout or 5xx may come after the server started the operation, and a
+    # retry would start (and bill) a second one writing to the same output prefix. A 429 is
+    # rejected before anything starts, so only throttling is retried
+    operation = call_api('documentai', 'batch_process_documents', client.batch_process_documents, request,
+                         quota='batch', retry=(THROTTLED,))
     print("Batch processing started for a single document...")
-    operation.result(timeout=900)  # Wait up to 15 minutes
+    return operation
+
+def setup_documentai_processing_batch(project_id, location, processor_id, pdf_name, mime_type="application/pdf"):
+    operation = submit_documentai_processing_batch(project_id, location, processor_id, pdf_name, mime_type)
+    with track_stage('document_ai_batch'):
+        operation.result(timeout=900)  # Wait up to 15 minutes
     print("Document processing completed.")
     return operation
 
@@ -57,9 +66,80 @@ def get_output_paths(operation):
     return output_paths
 
 def split_pdf_from_json(document_path, pdf_path, output_folder):
+    from google.cloud.documentai_toolbox import document
     wrapped_document = document.Document.from_document_path(document_path=document_path)
     output_files = wrapped_document.split_pdf(pdf_path=pdf_path, output_path=output_folder)
     
     print("Document Successfully Split")
     for output_file in output_files:
-        print(output_file)
\ No newline at end of file
+        print(output_file)
+
+def manifest_from_document(split_document):
+    """Returns the splitter sections of a Document as a list of {'type', 'start_page', 'end_page'} (0-based, inclusive)."""
+    manifest = []
+    for entity in split_document.entities:
+        page_refs = entity.page_anchor.page_refs
+        if not page_refs:
+            continue
+        manifest.append({
+            'type': entity.type_ or 'subdoc',
+            'start_page': int(page_refs[0].page),
+            'end_page': int(page_refs[-1].page),
+        })
+    return manifest
+
+def join_shard_sections(manifest, shards):
+    """
+    Joins the sections a shard boundary cut in two. The splitter sees each shard on its own, so
+    a section running over a boundary comes back as two consecutive sections of the same type.
+
+    :param shards: (first page, last page) of each shard the manifest was built from
+    """
+    boundaries = {first_page for first_page, _ in shards[1:]}
+    joined = []
+    for section in manifest:
+        previous = joined[-1] if joined else None
+        if (previous is not None and section['start_page'] in boundaries
+                and previous['type'] == section['type'] and previous['end_page'] == section['start_page'] - 1):
+            previous['end_page'] = section['end_page']
+        else:
+            joined.append(dict(section))
+    return joined
+
+def build_split_manifest(document_path):
+    """Builds a split manifest from a batch output JSON file."""
+    from google.cloud import documentai_v1 as documentai
+    with open(document_path, 'r') as f:
+        split_document = documentai.Document.from_json(f.read(), ignore_unknown_fields=True)
+    return manifest_from_document(split_document)
+
+def split_pdf_sections(manifest, pdf, pdf_name, section_types=None):
+    """
+    Splits a PDF in memory and yields (file name, PDF bytes) per section, named like split_pdf_from_json.
+
+    :param pdf: Path, bytes or UploadBuffer of the original PDF
+    :param section_types: Only yield sections whose type ends with one of these, e.g. ('schedule_C',)
+    """
+    import fitz  # PyMuPDF
+    input_filename, input_extension = os.path.splitext(pdf_name)
+    with open_pdf(pdf) as source:
+        for section in manifest:
+            if section_types is not None and not section['type'].endswith(tuple(section_types)):
+                continue
+            start_page, end_page = section['start_page'], section['end_page']
+            page_range = f"pg{start_page + 1}" if start_page == end_page else f"pg{start_page + 1}-{end_page + 1}"
+            output_filename = f"{input_filename}_{page_range}_{section['type']}{input_extension}"
+            with fitz.open() as subdoc:
+                subdoc.insert_pdf(source, from_page=start_page, to_page=end_page)
+                yield output_filename, subdoc.tobytes(garbage=3, deflate=True)
+
+def split_pdf_from_manifest(manifest, pdf_path, output_folder, pdf_name=None, section_types=None):
+    """Splits a local PDF with PyMuPDF using a split manifest and writes the sections to output_folder."""
+    output_files = []
+    for output_filename, content in split_pdf_sections(
+        manifest, pdf_path, pdf_name or os.path.basename(pdf_path), section_types
+    ):
+        with open(os.path.join(output_folder, output_filename), 'wb') as f:
+            f.write(content)
+        output_files.append(output_filename)
+    return output_files
@@ -0,0 +1,103 @@
+import os
+import threading
+from ..config import get_config
+
+config = get_config(os.getenv('APP_ENV', 'default'))
+
+# Process-wide clients, created lazily on first use and shared by all request threads
+_clients = {}
+_lock = threading.Lock()
+# pygsheets sits on httplib2, which is not thread-safe, so Sheets clients are per thread
+_thread_clients = threading.local()
+
+
+def _reset_after_fork():
+    """gRPC channels and HTTP sessions must not cross a fork, so a forked worker starts empty."""
+    global _lock, _thread_clients
+    _clients.clear()
+    _lock = threading.Lock()
+    _thread_clients = threading.local()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_client(key, factory):
+    """Return the client registered under key, creating it with factory() the first time."""
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = factory()
+                _clients[key] = client
+    return client
+
+
+def set_client(key, client):
+    """Register an existing client under key, e.g. to swap in a stand-in."""
+    with _lock:
+        _clients[key] = client
+
+
+def clear_clients():
+    with _lock:
+        _clients.clear()
+
+
+# The Google SDKs are imported by the factories below rather than at module import, so a
+# cold start only pays for the SDKs the first requests actually use (see app.warmup)
+
+def get_documentai_client(location):
+    def create():
+        from google.api_core.client_options import ClientOptions
+        from google.cloud import documentai_v1 as documentai
+        return documentai.DocumentProcessorServiceClient(
+            client_options=ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
+        )
+    return get_client(('documentai', location), create)
+
+
+def get_documentai_async_client(location):
+    """DocumentProcessorServiceAsyncClient for the asyncio pipeline; its channel serves one event loop."""
+    def create():
+        from google.api_core.client_options import ClientOptions
+        from google.cloud import documentai_v1 as documentai
+        return documentai.DocumentProcessorServiceAsyncClient(
+            client_options=ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
+        )
+    return get_client(('documentai_async', location), create)
+
+
+def get_storage_client():
+    def create():
+        from google.cloud import storage
+        from google.oauth2 import service_account
+        credentials = service_account.Credentials.from_service_account_file(os.getenv('GOOGLE_STORAGE_CREDENTIALS'))
+        return storage.Client(credentials=credentials, project=config.PROJECT_ID)
+    return get_client('storage', create)
+
+
+def get_firestore_client():
+    def create():
+        from firebase_admin import firestore
+        from .firestore_util import initialize_firestore
+        initialize_firestore()
+        return firestore.client()
+    return get_client('firestore', create)
+
+
+def get_sheets_client(service_account_file):
+    # A client registered with set_client('sheets', ...) is shared by all threads instead
+    shared = _clients.get('sheets')
+    if shared is not None:
+        return shared
+    clients = getattr(_thread_clients, 'sheets', None)
+    if clients is None:
+        clients = _thread_clients.sheets = {}
+    client = clients.get(service_account_file)
+    if client is None:
+        import pygsheets
+        client = clients[service_account_file] = pygsheets.authorize(service_account_file=service_account_file)
+    return client
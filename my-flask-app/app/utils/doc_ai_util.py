@@ -1,11 +1,30 @@
-from google.cloud import documentai_v1 as documentai
+import asyncio
+from .clients_util import get_documentai_client, get_documentai_async_client
+from .outbound_util import call_api, call_api_async
+from .upload_buffer_util import UploadBuffer, read_document
 
-def online_process(project_id, location, processor_id, file_path, mime_type):
-    opts = {"api_endpoint": f"{location}-documentai.googleapis.com"}
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
+def process_request(client, project_id, location, processor_id, file_path, mime_type):
+    """ProcessRequest for a document given as a local path, bytes or an UploadBuffer."""
+    from google.cloud import documentai_v1 as documentai
     resource_name = client.processor_path(project_id, location, processor_id)
-    with open(file_path, "rb") as file:
-        file_content = file.read()
+    file_content = read_document(file_path)
     raw_document = documentai.RawDocument(content=file_content, mime_type=mime_type)
-    request = documentai.ProcessRequest(name=resource_name, raw_document=raw_document)
-    return client.process_document(request=request)
+    return documentai.ProcessRequest(name=resource_name, raw_document=raw_document)
+
+def online_process(project_id, location, processor_id, file_path, mime_type):
+    """Processes a document given as a local path, bytes or an UploadBuffer with online processing."""
+    client = get_documentai_client(location)
+    request = process_request(client, project_id, location, processor_id, file_path, mime_type)
+    return call_api('documentai', 'process_document', client.process_document, request=request, quota=processor_id)
+
+async def online_process_async(project_id, location, processor_id, file_path, mime_type):
+    """online_process on the asyncio Document AI client, without holding a thread while waiting."""
+    client = get_documentai_async_client(location)
+    if isinstance(file_path, (bytes, bytearray)) or (isinstance(file_path, UploadBuffer) and file_path.in_memory):
+        request = process_request(client, project_id, location, processor_id, file_path, mime_type)
+    else:
+        # Reading a spilled upload or a local file would block the event loop
+        request = await asyncio.to_thread(
+            process_request, client, project_id, location, processor_id, file_path, mime_type)
+    return await call_api_async('documentai', 'process_document', client.process_document,
+                                request=request, quota=processor_id)
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from .outbound_util import call_api
+from .upload_buffer_util import read_document
+from ..config import get_config
+
+config = get_config(os.getenv('APP_ENV', 'default'))
+
+
+def make_cache_key(content, processor_id, processor_version=None):
+    """Content-addressed key: SHA-256 of the PDF bytes plus the processor that handled them."""
+    if processor_version is None:
+        processor_version = config.DOCAI_PROCESSOR_VERSION
+    digest = hashlib.sha256(content).hexdigest()
+    return f"{digest}-{processor_id}-{processor_version}"
+
+
+def file_cache_key(file_path, processor_id, processor_version=None):
+    """Cache key for a document given as a local path or an UploadBuffer."""
+    return make_cache_key(read_document(file_path), processor_id, processor_version)
+
+
+class MemoryCacheBackend:
+    """In-process LRU that evicts least recently used entries once max_bytes is exceeded."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+            return payload
+
+    def set(self, key, payload):
+        with self._lock:
+            if key in self._entries:
+                self.size -= len(self._entries.pop(key))
+            if len(payload) > self.max_bytes:
+                return
+            self._entries[key] = payload
+            self.size += len(payload)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def delete(self, key):
+        with self._lock:
+            payload = self._entries.pop(key, None)
+            if payload is not None:
+                self.size -= len(payload)
+
+
+class DiskCacheBackend:
+    """One JSON file per key in a local directory."""
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, payload):
+        # Write to a temporary file first so readers never see a partial entry
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class GCSCacheBackend:
+    """Objects under a prefix in a GCS bucket, shared by every instance."""
+    def __init__(self, bucket_name, prefix='docai-cache/'):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+
+    def _blob(self, key):
+        from .clients_util import get_storage_client
+        return get_storage_client().bucket(self.bucket_name).blob(f"{self.prefix}{key}.json")
+
+    def get(self, key):
+        from google.api_core.exceptions import NotFound
+        try:
+            return call_api('gcs', 'download', self._blob(key).download_as_bytes)
+        except NotFound:
+            return None
+
+    def set(self, key, payload):
+        call_api('gcs', 'upload', self._blob(key).upload_from_string, payload, content_type='application/json')
+
+    def delete(self, key):
+        from google.api_core.exceptions import NotFound
+        try:
+            call_api('gcs', 'delete', self._blob(key).delete)
+        except NotFound:
+            pass
+
+
+class DocumentCache:
+    """
+    Cache of Document AI results (entity lists or split manifests) in front of a backend.
+
+    :param backend: Object with get(key), set(key, payload) and delete(key) over bytes payloads
+    :param ttl: Seconds an entry stays valid, or None to keep entries until evicted
+    """
+    def __init__(self, backend, ttl=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = None
+        try:
+            payload = self.backend.get(key)
+        except Exception as e:
+            print(f"Document AI cache read failed for {key}: {e}")
+            payload = None
+        if payload is not None:
+            try:
+                entry = json.loads(payload)
+                if entry['expires_at'] is None or entry['expires_at'] > time.time():
+                    value = entry['value']
+                else:
+                    self.backend.delete(key)
+            except Exception as e:
+                # Corrupt or written by something else: a miss, and dropped so it is written again
+                print(f"Document AI cache entry {key} is unusable: {e}")
+                try:
+                    self.backend.delete(key)
+                except Exception as e:
+                    print(f"Document AI cache delete failed for {key}: {e}")
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        payload = json.dumps({'expires_at': expires_at, 'value': value}).encode('utf-8')
+        try:
+            self.backend.set(key, payload)
+        except Exception as e:
+            print(f"Document AI cache write failed for {key}: {e}")
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / lookups, 3) if lookups else None,
+        }
+
+
+def create_cache_backend(name):
+    if name == 'memory':
+        return MemoryCacheBackend(config.DOCAI_CACHE_MAX_BYTES)
+    elif name == 'disk':
+        return DiskCacheBackend(config.DOCAI_CACHE_DIR)
+    elif name == 'gcs':
+        return GCSCacheBackend(config.DOCAI_CACHE_BUCKET, config.DOCAI_CACHE_PREFIX)
+    raise ValueError(f"Unsupported Document AI cache backend: {name}")
+
+
+_document_cache = None
+_document_cache_lock = threading.Lock()
+
+
+def get_document_cache():
+    """Return the process-wide DocumentCache, or None when DOCAI_CACHE_BACKEND is 'none'."""
+    global _document_cache
+    if config.DOCAI_CACHE_BACKEND == 'none':
+        return None
+    if _document_cache is None:
+        with _document_cache_lock:
+            if _document_cache is None:
+                _document_cache = DocumentCache(create_cache_backend(config.DOCAI_CACHE_BACKEND), config.DOCAI_CACHE_TTL)
+    return _document_cache
@@ -0,0 +1,202 @@
+"""
+Size-aware routing of documents to Document AI.
+
+Online processing answers in seconds but rejects documents above the processor's online
+page and size limits; batch processing takes any document but costs a GCS round trip and a
+long-running operation measured in minutes. In between, a document is cut into page-range
+shards that fit the online limits, the shards are processed online concurrently and their
+results merged back into one Document, as if it had been processed whole.
+
+ - online: page count and size within the online limits
+ - sharded: up to SHARDED_MAX_PAGES pages
+ - batch: anything larger
+"""
+import asyncio
+import contextvars
+import os
+import tempfile
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from .batch_processing_util import setup_documentai_processing_batch, get_output_paths
+from .doc_ai_util import online_process, online_process_async
+from .gcs_transfer_util import download_many, upload_object
+from .upload_buffer_util import open_pdf, document_size
+from ..config import get_config
+
+config = get_config(os.getenv('APP_ENV', 'default'))
+
+ONLINE = 'online'
+SHARDED = 'sharded'
+BATCH = 'batch'
+
+# shards: (first page, last page) of each shard, 0-based and inclusive; None unless sharded
+RoutePlan = namedtuple('RoutePlan', ['route', 'page_count', 'bytes', 'shards'])
+
+_shard_executor = ThreadPoolExecutor(max_workers=config.DOCAI_SHARD_WORKERS, thread_name_prefix='docai-shard')
+
+
+def shard_ranges(page_count, shard_pages):
+    """Consecutive (first page, last page) ranges of at most shard_pages pages covering the document."""
+    return [(start, min(start + shard_pages, page_count) - 1) for start in range(0, page_count, shard_pages)]
+
+
+def plan_route(source, mime_type='application/pdf', max_pages=None, max_bytes=None, mode='auto'):
+    """
+    Choose how to process a document given as an UploadBuffer, bytes or local path.
+
+    :param max_pages: Online page limit of the processor (default: DOCAI_ONLINE_MAX_PAGES)
+    :param max_bytes: Online request size limit (default: DOCAI_ONLINE_MAX_BYTES)
+    :param mode: 'auto', or ONLINE, SHARDED or BATCH to force a route
+    """
+    max_pages = max_pages or config.DOCAI_ONLINE_MAX_PAGES
+    max_bytes = max_bytes or config.DOCAI_ONLINE_MAX_BYTES
+    size = document_size(source)
+    if mime_type != 'application/pdf':
+        # Images are a single page and cannot be cut up
+        return RoutePlan(BATCH if mode == BATCH else ONLINE, 1, size, None)
+    with open_pdf(source) as pdf:
+        page_count = pdf.page_count
+
+    if mode == 'auto':
+        if page_count <= max_pages and size <= max_bytes:
+            mode = ONLINE
+        elif page_count <= config.SHARDED_MAX_PAGES:
+            mode = SHARDED
+        else:
+            mode = BATCH
+    if mode != SHARDED:
+        return RoutePlan(mode, page_count, size, None)
+    # Shards are cut by page count, and smaller when pages are heavy enough that a full shard
+    # would likely exceed the size limit
+    pages_by_size = int(max_bytes * config.DOCAI_SHARD_SIZE_MARGIN / max(size / max(page_count, 1), 1))
+    shard_pages = max(1, min(max_pages, pages_by_size))
+    return RoutePlan(SHARDED, page_count, size, shard_ranges(page_count, shard_pages))
+
+
+def build_shards(source, shards):
+    """PDF bytes of each (first page, last page) shard of the source PDF."""
+    import fitz  # PyMuPDF
+    contents = []
+    with open_pdf(source) as pdf:
+        for first_page, last_page in shards:
+            with fitz.open() as shard:
+                shard.insert_pdf(pdf, from_page=first_page, to_page=last_page)
+                contents.append(shard.tobytes(garbage=3, deflate=True))
+    return contents
+
+
+def _shift(message, text_offset, page_offset):
+    """Move every text anchor of message text_offset characters and every page reference page_offset pages on."""
+    from google.protobuf.descriptor import FieldDescriptor
+    for field, value in message.ListFields():
+        if field.type != FieldDescriptor.TYPE_MESSAGE:
+            continue
+        for item in (value if field.label == FieldDescriptor.LABEL_REPEATED else (value,)):
+            name = item.DESCRIPTOR.name
+            if name == 'TextSegment':
+                item.start_index += text_offset
+                item.end_index += text_offset
+            elif name == 'PageRef':
+                item.page += page_offset
+            else:
+                _shift(item, text_offset, page_offset)
+
+
+def merge_documents(documents, page_offsets=None):
+    """
+    Merge the Documents of consecutive shards into one: text concatenated, pages renumbered,
+    and the text anchors and page references of pages and entities moved to match.
+
+    :param page_offsets: First page of each shard in the whole document (default: the pages of
+                         the shards before it)
+    """
+    from google.cloud import documentai_v1 as documentai
+    if len(documents) == 1:
+        return documents[0]
+    merged = documentai.Document.pb(documentai.Document(mime_type=documents[0].mime_type))
+    text_offset, pages_before = 0, 0
+    for index, document in enumerate(documents):
+        raw = documentai.Document.pb(document)
+        page_offset = page_offsets[index] if page_offsets is not None else pages_before
+        for page in raw.pages:
+            merged_page = merged.pages.add()
+            merged_page.CopyFrom(page)
+            merged_page.page_number = page.page_number + page_offset
+            _shift(merged_page, text_offset, page_offset)
+        for entity in raw.entities:
+            merged_entity = merged.entities.add()
+            merged_entity.CopyFrom(entity)
+            _shift(merged_entity, text_offset, page_offset)
+        merged.text += raw.text
+        text_offset += len(raw.text)
+        pages_before = page_offset + len(raw.pages)
+    return documentai.Document.wrap(merged)
+
+
+def _process_shard(project_id, location, processor_id, content, mime_type):
+    return online_process(project_id, location, processor_id, content, mime_type).document
+
+
+def process_sharded(project_id, location, processor_id, source, shards):
+    """Process the shards of a PDF online and concurrently; returns the merged Document."""
+    contents = build_shards(source, shards)
+    # Each shard runs in a copy of the caller's context so its API call is counted on the current job
+    futures = [
+        _shard_executor.submit(contextvars.copy_context().run, _process_shard,
+                               project_id, location, processor_id, content, 'application/pdf')
+        for content in contents
+    ]
+    print(f"Processing {len(shards)} shards of pages {shards} online")
+    return merge_documents([future.result() for future in futures], [first_page for first_page, _ in shards])
+
+
+def process_batch(project_id, location, processor_id, source, mime_type):
+    """Process a document with a batch job through the input and output buckets; returns its Document."""
+    from google.cloud import documentai_v1 as documentai
+    name = f"routed/{uuid.uuid4().hex}{'.pdf' if mime_type == 'application/pdf' else ''}"
+    upload_object(source, config.INPUT_BUCKET, name, content_type=mime_type)
+    operation = setup_documentai_processing_batch(project_id, location, processor_id, name, mime_type)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        downloads = [
+            (f"{directory}output-document.json", os.path.join(tmpdir, f"output-document-{index}.json"))
+            for index, directory in enumerate(get_output_paths(operation))
+        ]
+        download_many(downloads)
+        documents = []
+        for _, local_json_path in downloads:
+            with open(local_json_path, 'r') as f:
+                documents.append(documentai.Document.from_json(f.read(), ignore_unknown_fields=True))
+    if not documents:
+        raise RuntimeError(f"Batch processing of {name} produced no output")
+    return merge_documents(documents)
+
+
+def process_document(project_id, location, processor_id, source, mime_type, plan=None):
+    """
+    Process a document (UploadBuffer, bytes or local path) on the route plan_route chooses,
+    or on plan; returns the Document.
+    """
+    plan = plan or plan_route(source, mime_type)
+    if plan.route == SHARDED:
+        return process_sharded(project_id, location, processor_id, source, plan.shards)
+    if plan.route == BATCH:
+        return process_batch(project_id, location, processor_id, source, mime_type)
+    return online_process(project_id, location, processor_id, source, mime_type).document
+
+
+async def process_document_async(project_id, location, processor_id, source, mime_type):
+    """process_document on the asyncio Document AI client; shards are sent concurrently on the loop."""
+    plan = await asyncio.to_thread(plan_route, source, mime_type)
+    if plan.route == SHARDED:
+        contents = await asyncio.to_thread(build_shards, source, plan.shards)
+        responses = await asyncio.gather(*(
+            online_process_async(project_id, location, processor_id, content, 'application/pdf')
+            for content in contents
+        ))
+        return merge_documents([response.document for response in responses],
+                               [first_page for first_page, _ in plan.shards])
+    if plan.route == BATCH:
+        return await asyncio.to_thread(process_batch, project_id, location, processor_id, source, mime_type)
+    response = await online_process_async(project_id, location, processor_id, source, mime_type)
+    return response.document
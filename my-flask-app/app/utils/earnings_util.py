@@ -0,0 +1,140 @@
+import json
+import os
+import re
+import threading
+from bisect import bisect_right
+from collections import namedtuple
+from ..config import get_config
+
+# Get the configuration for the current environment
+config = get_config(os.getenv('APP_ENV', 'default'))
+
+# Earning type -> keywords found in the earning line description (case-insensitive). When a
+# line contains keywords of several types, the keyword listed first wins, as in the original
+# chain of ifs: "regular overtime" is Bonus. Commission lines only update the YTD cell,
+# Bonus (which includes overtime) is summed, and Regular feeds the hourly rows.
+DEFAULT_EARNINGS_TAXONOMY = {
+    "Commission": ["commission"],
+    "Bonus": ["bonus", "overtime"],
+    "Regular": ["regular", "base", "paid time off", "pto", "holiday", "vacation", "personal", "sick"],
+}
+
+_AMOUNT_PATTERN = re.compile(r'^\(?-?\$?-?([0-9][0-9,]*(?:\.[0-9]+)?|\.[0-9]+)\)?-?$')
+
+# An earning item split into what populate_sheet uses. amount is the last column parsed as a
+# float (None when it is not a number) and amount_text the column as printed. rate and hours
+# are the printed columns of an hourly line; a three-column line is a salary line without them.
+EarningLine = namedtuple('EarningLine', ['description', 'earning_type', 'amount', 'amount_text',
+                                         'rate', 'hours', 'is_salary'])
+
+
+def parse_amount(text):
+    """Parse a printed amount such as "$1,234.50" or "(12.00)" into a float, or None."""
+    match = _AMOUNT_PATTERN.match(text.strip())
+    if match is None:
+        return None
+    amount = float(match.group(1).replace(',', ''))
+    return -amount if '(' in text or '-' in text else amount
+
+
+def load_earnings_taxonomy(path):
+    """
+    Read an earnings taxonomy from a JSON file of {"Earning type": ["keyword", ...]} and put its
+    keywords ahead of the defaults, so employer-specific codes (e.g. "Regular": ["reg hrly"]) are
+    added without restating the built-in keywords and take precedence over them. Returns a list
+    of (earning type, keywords): one group per custom entry, then the defaults in their built-in
+    order, so the defaults still rank against each other as before.
+    """
+    with open(path) as f:
+        custom = json.load(f)
+    return list(custom.items()) + list(DEFAULT_EARNINGS_TAXONOMY.items())
+
+
+class EarningsClassifier:
+    """
+    Classifies earning item lines by the keywords of an earnings taxonomy, compiled once into a
+    single regular expression. A batch of lines is matched in one pass over the joined text.
+
+    :param taxonomy: Mapping of earning type to keywords, or a list of (earning type, keywords)
+                     in which a type may appear more than once; see DEFAULT_EARNINGS_TAXONOMY
+    """
+    def __init__(self, taxonomy=None):
+        taxonomy = DEFAULT_EARNINGS_TAXONOMY if taxonomy is None else taxonomy
+        groups = taxonomy.items() if hasattr(taxonomy, 'items') else taxonomy
+        # Priority of a keyword is its position across all types; first occurrence wins
+        self.keywords = {}
+        for earning_type, keywords in groups:
+            for keyword in keywords:
+                keyword = keyword.lower()
+                if keyword and keyword not in self.keywords:
+                    self.keywords[keyword] = (len(self.keywords), earning_type)
+        if self.keywords:
+            # The lookahead reports a match at every position, so overlapping keywords are all
+            # seen; at one position the alternation takes the highest-priority keyword
+            alternation = '|'.join(re.escape(keyword) for keyword in self.keywords)
+            self.pattern = re.compile(f"(?=({alternation}))")
+        else:
+            self.pattern = None
+
+    def classify(self, description):
+        """Earning type of one description, or None when no keyword matches."""
+        return self.classify_batch([description])[0]
+
+    def classify_batch(self, descriptions):
+        """Earning types of many descriptions, in order."""
+        best = [None] * len(descriptions)
+        if self.pattern is None or not descriptions:
+            return best
+        lines = [description.lower().replace('\n', ' ') for description in descriptions]
+        starts = []
+        offset = 0
+        for line in lines:
+            starts.append(offset)
+            offset += len(line) + 1
+        for match in self.pattern.finditer('\n'.join(lines)):
+            index = bisect_right(starts, match.start()) - 1
+            priority = self.keywords[match.group(1)]
+            if best[index] is None or priority < best[index]:
+                best[index] = priority
+        return [None if priority is None else priority[1] for priority in best]
+
+    def parse_batch(self, descriptions):
+        """Classify and split many earning item lines; returns a list of EarningLine."""
+        earning_lines = []
+        for description, earning_type in zip(descriptions, self.classify_batch(descriptions)):
+            parts = description.split()
+            amount_text = parts[-1] if parts else ''
+            is_salary = len(parts) == 3
+            has_rate = len(parts) >= 4
+            earning_lines.append(EarningLine(
+                description=description,
+                earning_type=earning_type,
+                amount=parse_amount(amount_text) if amount_text else None,
+                amount_text=amount_text,
+                rate=parts[-4] if has_rate else None,
+                hours=parts[-3] if has_rate else None,
+                is_salary=is_salary,
+            ))
+        return earning_lines
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_earnings_classifier():
+    """Process-wide classifier for EARNINGS_TAXONOMY_PATH (or the defaults), compiled on first use."""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                path = config.EARNINGS_TAXONOMY_PATH
+                _classifier = EarningsClassifier(load_earnings_taxonomy(path) if path else None)
+    return _classifier
+
+
+def reset_earnings_classifier():
+    """Drop the compiled classifier so the next call reloads the taxonomy (e.g. after editing the file)."""
+    global _classifier
+    with _classifier_lock:
+        _classifier = None
@@ -1,7 +1,12 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+from .clients_util import get_firestore_client
+from .outbound_util import call_api
+from . import metrics_util
 from ..config import get_config
+import atexit
 import os
+import queue
+import threading
+import time
 import json
 import base64
 
@@ -9,14 +14,190 @@ config = get_config(os.getenv('APP_ENV', 'default'))
 
 
 def initialize_firestore():
+    import firebase_admin
+    from firebase_admin import credentials
+    # Only parse the certificate the first time; the app is process-wide after that
+    if firebase_admin._apps:
+        return
     service_account_path = os.getenv('GOOGLE_FIRESTORE_CREDENTIALS')
     cred = credentials.Certificate(service_account_path)
-    if not firebase_admin._apps:
-        firebase_admin.initialize_app(cred)
-    else:
-        print("Firebase app already initialized.")
+    firebase_admin.initialize_app(cred)
 
-def store_data_in_firestore(data, collection_name):
-    db = firestore.client()
+
+def write_to_firestore(data, collection_name):
+    """Synchronously store one document with an auto-generated id."""
+    db = get_firestore_client()
     doc_ref = db.collection(collection_name).document()
-    doc_ref.set({"entities": data})
+    call_api('firestore', 'set', doc_ref.set, {"entities": data})
+
+
+def store_data_in_firestore(data, collection_name):
+    """
+    Store extraction records. With FIRESTORE_ASYNC_WRITES the write is queued on the
+    background FirestoreWriter and this returns immediately.
+    """
+    if config.FIRESTORE_ASYNC_WRITES:
+        get_firestore_writer().submit(collection_name, {"entities": data})
+    else:
+        write_to_firestore(data, collection_name)
+
+
+class FirestoreWriter:
+    """
+    Background writer that commits queued documents in Firestore WriteBatches.
+
+    A batch is committed once it holds max_batch writes (Firestore allows at most 500) or
+    flush_interval seconds after its first write was queued. Failed commits are retried with
+    exponential backoff; a batch that still fails after max_retries is dropped and logged.
+
+    :param client_factory: Callable returning a Firestore client
+    :param max_queue: Maximum number of queued writes; submit() blocks for up to
+                      put_timeout seconds when full, then writes synchronously
+    """
+    def __init__(self, client_factory=get_firestore_client, max_batch=500, flush_interval=1.0,
+                 max_queue=10000, max_retries=5, initial_backoff=0.5, max_backoff=30.0, put_timeout=1.0):
+        self.client_factory = client_factory
+        self.max_batch = min(max_batch, 500)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.put_timeout = put_timeout
+        self.written = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='firestore-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, collection_name, document):
+        with self._lock:
+            self._pending += 1
+        try:
+            self._queue.put((collection_name, document), timeout=self.put_timeout)
+        except queue.Full:
+            print(f"Firestore write queue is full, writing to {collection_name} synchronously")
+            self._commit([(collection_name, document)])
+            self._done(1)
+
+    def depth(self):
+        """Writes queued or in a batch that has not been committed yet."""
+        with self._lock:
+            return self._pending
+
+    def stats(self):
+        return {'queue_depth': self.depth(), 'written': self.written, 'failed': self.failed}
+
+    def flush(self, timeout=None):
+        """Wait until every write queued so far has been committed (or dropped)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.depth():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout=30.0):
+        """Commit whatever is queued and stop the writer thread."""
+        self._stopping.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._commit(batch)
+                self._done(len(batch))
+            elif self._stopping.is_set():
+                return
+
+    def _done(self, count):
+        with self._lock:
+            self._pending -= count
+
+    def _next_batch(self):
+        """Block for the first write, then collect more until the batch is full or flush_interval passes."""
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0 or self._stopping.is_set():
+                    # Take whatever is already queued without waiting any longer
+                    batch.append(self._queue.get_nowait())
+                else:
+                    # Short waits so close() is noticed without waiting out flush_interval
+                    batch.append(self._queue.get(timeout=min(remaining, 0.1)))
+            except queue.Empty:
+                if remaining <= 0 or self._stopping.is_set():
+                    break
+        return batch
+
+    def _commit(self, writes):
+        delay = self.initial_backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                client = self.client_factory()
+                batch = client.batch()
+                for collection_name, document in writes:
+                    batch.set(client.collection(collection_name).document(), document)
+                # Retried below with this writer's own backoff
+                call_api('firestore', 'batch_commit', batch.commit, retry=False)
+                with self._lock:
+                    self.written += len(writes)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    with self._lock:
+                        self.failed += len(writes)
+                    print(f"Dropping {len(writes)} Firestore writes after {attempt + 1} attempts: {e}")
+                    return False
+                print(f"Firestore batch commit failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+
+_firestore_writer = None
+_firestore_writer_lock = threading.Lock()
+
+
+def get_firestore_writer():
+    """Return the process-wide FirestoreWriter, starting it on first use. It is flushed at exit."""
+    global _firestore_writer
+    if _firestore_writer is None:
+        with _firestore_writer_lock:
+            if _firestore_writer is None:
+                _firestore_writer = FirestoreWriter(
+                    max_batch=config.FIRESTORE_BATCH_SIZE,
+                    flush_interval=config.FIRESTORE_FLUSH_INTERVAL,
+                    max_queue=config.FIRESTORE_WRITER_QUEUE_SIZE,
+                    max_retries=config.FIRESTORE_MAX_RETRIES,
+                )
+                atexit.register(_firestore_writer.close)
+    return _firestore_writer
+
+
+def _reset_after_fork():
+    # The writer thread does not survive fork(); a child starts its own on first use
+    global _firestore_writer, _firestore_writer_lock
+    _firestore_writer = None
+    _firestore_writer_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def firestore_writer_stats():
+    """Stats of the background writer, or None if it has not been started."""
+    return _firestore_writer.stats() if _firestore_writer is not None else None
+
+
+metrics_util.gauge(
+    'docproc_firestore_queue_depth', 'Firestore writes queued on the background writer.'
+).set_function(lambda: _firestore_writer.depth() if _firestore_writer is not None else 0)
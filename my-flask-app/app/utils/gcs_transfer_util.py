@@ -0,0 +1,162 @@
+import contextlib
+import contextvars
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .clients_util import get_storage_client
+from .outbound_util import call_api
+from .upload_buffer_util import UploadBuffer
+from ..config import get_config
+
+config = get_config(os.getenv('APP_ENV', 'default'))
+
+# Transfers of one batch run concurrently here, all on the process-wide storage client
+_transfer_executor = ThreadPoolExecutor(max_workers=config.GCS_TRANSFER_WORKERS, thread_name_prefix='gcs-transfer')
+
+
+def parse_gcs_uri(uri):
+    """gs://bucket/path/to/blob -> ('bucket', 'path/to/blob')."""
+    bucket_name, _, blob_name = uri.replace('gs://', '', 1).partition('/')
+    return bucket_name, blob_name
+
+
+def _chunked(size):
+    threshold = config.GCS_CHUNKED_TRANSFER_THRESHOLD
+    return bool(threshold) and size is not None and size >= threshold
+
+
+def _source_size(source):
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    if isinstance(source, UploadBuffer):
+        return len(source)
+    return os.path.getsize(source)
+
+
+@contextlib.contextmanager
+def _local_path(source):
+    """
+    A local path holding source, for the chunked upload, which reads ranges of a file: a path as
+    is, a spilled UploadBuffer's temporary file, otherwise a temporary copy.
+    """
+    if isinstance(source, str):
+        yield source
+    elif isinstance(source, UploadBuffer) and not source.in_memory:
+        source.flush()
+        yield source.path
+    else:
+        content = source.getvalue() if isinstance(source, UploadBuffer) else source
+        with tempfile.NamedTemporaryFile(suffix='.upload') as copy:
+            copy.write(content)
+            copy.flush()
+            yield copy.name
+
+
+def upload_object(source, bucket_name, blob_name, content_type=None):
+    """
+    Upload a local path, bytes or UploadBuffer to gs://bucket_name/blob_name on the shared client.
+    Objects of GCS_CHUNKED_TRANSFER_THRESHOLD bytes or more are sent as concurrent XML multipart
+    chunks, from a temporary file when they are not on disk yet. Returns the manifest entry of
+    the object.
+    """
+    from google.cloud.storage import transfer_manager
+    blob = get_storage_client().bucket(bucket_name).blob(blob_name)
+    size = _source_size(source)
+    chunked = _chunked(size)
+    start = time.perf_counter()
+    if chunked:
+        with _local_path(source) as path:
+            call_api('gcs', 'upload', transfer_manager.upload_chunks_concurrently,
+                     path, blob, content_type=content_type, chunk_size=config.GCS_TRANSFER_CHUNK_SIZE,
+                     worker_type=transfer_manager.THREAD, max_workers=config.GCS_TRANSFER_WORKERS)
+    elif isinstance(source, (bytes, bytearray)):
+        call_api('gcs', 'upload', blob.upload_from_string, bytes(source), content_type=content_type)
+    elif isinstance(source, UploadBuffer):
+        # Stream the request buffer itself rather than a copy on disk; rewind makes retries resend it all
+        call_api('gcs', 'upload', blob.upload_from_file, source, rewind=True, size=size, content_type=content_type)
+    else:
+        call_api('gcs', 'upload', blob.upload_from_filename, source, content_type=content_type)
+    return {
+        'uri': f"gs://{bucket_name}/{blob_name}",
+        'local': source if isinstance(source, str) else None,
+        'bytes': size,
+        'seconds': round(time.perf_counter() - start, 3),
+        'chunked': chunked,
+    }
+
+
+def download_object(bucket_name, blob_name, destination, size=None):
+    """
+    Download gs://bucket_name/blob_name to the local path destination on the shared client.
+    Objects of GCS_CHUNKED_TRANSFER_THRESHOLD bytes or more are downloaded as concurrent ranged
+    requests; unless size is passed, it is read from the object's metadata first.
+    Returns the manifest entry of the object.
+    """
+    from google.cloud.storage import transfer_manager
+    blob = get_storage_client().bucket(bucket_name).blob(blob_name)
+    if size is None and config.GCS_CHUNKED_TRANSFER_THRESHOLD:
+        call_api('gcs', 'reload', blob.reload)
+        size = blob.size
+    chunked = _chunked(size)
+    start = time.perf_counter()
+    if chunked:
+        call_api('gcs', 'download', transfer_manager.download_chunks_concurrently,
+                 blob, destination, chunk_size=config.GCS_TRANSFER_CHUNK_SIZE,
+                 worker_type=transfer_manager.THREAD, max_workers=config.GCS_TRANSFER_WORKERS)
+    else:
+        call_api('gcs', 'download', blob.download_to_filename, destination)
+    return {
+        'uri': f"gs://{bucket_name}/{blob_name}",
+        'local': destination,
+        'bytes': os.path.getsize(destination),
+        'seconds': round(time.perf_counter() - start, 3),
+        'chunked': chunked,
+    }
+
+
+def _run_all(func, calls, raise_on_error):
+    # Each transfer runs in a copy of the caller's context so it is counted on the current job
+    futures = [
+        (uri, _transfer_executor.submit(contextvars.copy_context().run, func, *args))
+        for uri, args in calls
+    ]
+    manifest, first_error = [], None
+    for uri, future in futures:
+        try:
+            entry = future.result()
+            entry['error'] = None
+        except Exception as e:
+            first_error = first_error or e
+            entry = {'uri': uri, 'local': None, 'bytes': None, 'seconds': None, 'chunked': False,
+                     'error': f"{type(e).__name__}: {e}"}
+        manifest.append(entry)
+    if first_error is not None and raise_on_error:
+        raise first_error
+    return manifest
+
+
+def upload_many(items, bucket_name, raise_on_error=True):
+    """
+    Upload many objects concurrently. items yields (source, blob name, content type) and may be a
+    generator: each upload starts as soon as its item is produced.
+    Returns the manifest, one entry per object in order: {'uri', 'local', 'bytes', 'seconds',
+    'chunked', 'error'}. With raise_on_error the first failure is raised once all have finished.
+    """
+    calls = ((f"gs://{bucket_name}/{blob_name}", (source, bucket_name, blob_name, content_type))
+             for source, blob_name, content_type in items)
+    return _run_all(upload_object, calls, raise_on_error)
+
+
+def download_many(items, raise_on_error=True):
+    """
+    Download many objects concurrently. items yields (gs:// URI, local path) or
+    (gs:// URI, local path, size in bytes); without a size it is looked up as in download_object.
+    Returns the manifest like upload_many.
+    """
+    calls = []
+    for item in items:
+        uri, destination = item[0], item[1]
+        size = item[2] if len(item) > 2 else None
+        calls.append((uri, (*parse_gcs_uri(uri), destination, size)))
+    return _run_all(download_object, calls, raise_on_error)
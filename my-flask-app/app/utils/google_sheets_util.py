@@ -1,9 +1,12 @@
 import os
 from ..config import get_config
-import pygsheets
+from .clients_util import get_sheets_client
+from .earnings_util import get_earnings_classifier
+from .outbound_util import call_api
 from datetime import datetime
 import calendar
-import pygsheets
+from collections import OrderedDict
+import re
 
 # Get the current environment ('development', 'testing', 'production')
 env = os.getenv('APP_ENV', 'default')
@@ -11,23 +14,173 @@ env = os.getenv('APP_ENV', 'default')
 # Get the configuration for the current environment
 config = get_config(env)
 
-google_sheets_credentials_path = os.getenv('GOOGLE_SHEETS_CREDENTIALS')
-if google_sheets_credentials_path is None:
-    raise ValueError("GOOGLE_SHEETS_CREDENTIALS is not set in the environment variables")
+# Worksheet the paystub and W-2 populators write to
+INCOME_WORKSHEET_TITLE = "Income Calculation Worksheet"
 
+_CELL_PATTERN = re.compile(r'^([A-Z]+)([0-9]+)$')
+
+def google_sheets_credentials_path():
+    """Resolved when a populator is created, so importing this module has no side effects."""
+    path = os.getenv('GOOGLE_SHEETS_CREDENTIALS')
+    if path is None:
+        raise ValueError("GOOGLE_SHEETS_CREDENTIALS is not set in the environment variables")
+    return path
+
+
+def as_cell_text(value):
+    """Render a written value the way Sheets reports it back (e.g. 0.0 -> "0")."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def cell_position(cell):
+    """Zero-based (row, column) of an A1 cell reference, e.g. "C10" -> (9, 2)."""
+    match = _CELL_PATTERN.match(cell.upper())
+    if match is None:
+        raise ValueError(f"Not an A1 cell reference: {cell}")
+    column = 0
+    for letter in match.group(1):
+        column = column * 26 + ord(letter) - ord('A') + 1
+    return int(match.group(2)) - 1, column - 1
+
+
+class SheetSnapshot:
+    """
+    Values of one rectangular range (e.g. C10:I90) read in a single request, answering
+    get_value() for any cell inside it. Reads outside the range raise KeyError rather than
+    guessing, so a populator that starts reading new cells fails loudly.
+
+    :param cell_range: A1 range the rows were read from
+    :param rows: Formatted values as returned by the Sheets API (trailing empty cells omitted)
+    """
+    def __init__(self, cell_range, rows):
+        start, end = cell_range.upper().split(':')
+        self.cell_range = cell_range
+        self.top, self.left = cell_position(start)
+        self.bottom, self.right = cell_position(end)
+        self.rows = [list(row) for row in rows]
+
+    def __contains__(self, cell):
+        row, column = cell_position(cell)
+        return self.top <= row <= self.bottom and self.left <= column <= self.right
+
+    def get_value(self, cell):
+        if cell not in self:
+            raise KeyError(f"{cell} is outside the snapshot range {self.cell_range}")
+        row, column = cell_position(cell)
+        row, column = row - self.top, column - self.left
+        if row < len(self.rows) and column < len(self.rows[row]):
+            return str(self.rows[row][column])
+        return ''
+
+    def set_value(self, cell, value):
+        """Record a written value so later reads of the snapshot see it."""
+        if cell not in self:
+            return
+        row, column = cell_position(cell)
+        row, column = row - self.top, column - self.left
+        while len(self.rows) <= row:
+            self.rows.append([])
+        cells = self.rows[row]
+        cells.extend([''] * (column + 1 - len(cells)))
+        cells[column] = as_cell_text(value)
+
+
+def load_snapshot(worksheet, cell_range):
+    """Read cell_range of a pygsheets worksheet in one values.batchGet call."""
+    rows, = call_api('sheets', 'get_values_batch', worksheet.get_values_batch, [cell_range], quota='read')
+    return SheetSnapshot(cell_range, rows or [])
+
+
+class SheetWriteBuffer:
+    """
+    Collects the cell updates for one document and sends them in a single values.batchUpdate.
+    Repeated writes to the same cell are last-write-wins, and reads of a pending cell
+    return the buffered value so the populators see their own writes before flush().
+
+    :param snapshot: Optional SheetSnapshot answering reads inside its range without an API
+                     call; flushed writes are applied to it so later reads stay consistent
+    """
+    def __init__(self, worksheet, snapshot=None):
+        self.worksheet = worksheet
+        self.snapshot = snapshot
+        self.pending = OrderedDict()
+
+    def set(self, cell, value):
+        self.pending[cell.upper()] = value
+
+    def get(self, cell):
+        cell = cell.upper()
+        if cell in self.pending:
+            return as_cell_text(self.pending[cell])
+        if self.snapshot is not None and (self.worksheet is None or cell in self.snapshot):
+            return self.snapshot.get_value(cell)
+        return call_api('sheets', 'get_value', self.worksheet.get_value, cell, quota='read')
+
+    def flush(self):
+        """Write all pending cells in one API call and return how many were written."""
+        if not self.pending:
+            return 0
+        ranges = list(self.pending.keys())
+        values = [[[value]] for value in self.pending.values()]
+        call_api('sheets', 'update_values_batch', self.worksheet.update_values_batch, ranges, values, quota='write')
+        count = len(self.pending)
+        self._write_through()
+        self.pending.clear()
+        return count
+
+    def _write_through(self):
+        if self.snapshot is not None:
+            for cell, value in self.pending.items():
+                self.snapshot.set_value(cell, value)
+
+
+class SnapshotWriteBuffer(SheetWriteBuffer):
+    """
+    Write buffer over a SheetSnapshot instead of a live worksheet: reads are answered from the
+    snapshot and flush() only moves the pending cells to written, for the caller to send
+    (e.g. with worksheet.update_values_batch).
+    """
+    def __init__(self, snapshot):
+        super().__init__(None, snapshot)
+        self.written = OrderedDict()
+
+    def flush(self):
+        count = len(self.pending)
+        self._write_through()
+        self.written.update(self.pending)
+        self.pending.clear()
+        return count
+
+
+def open_income_worksheet(client_secret=None, sheet_url=None):
+    """Open the Income Calculation Worksheet of sheet_url (default: the income analyser sheet)."""
+    if client_secret is None:
+        client_secret = google_sheets_credentials_path()
+    if sheet_url is None:
+        sheet_url = config.GOOGLE_SHEETS_URL_INCOME_ANALYSER
+    client = get_sheets_client(client_secret)
+    spreadsheet = call_api('sheets', 'open_by_url', client.open_by_url, sheet_url, quota='read')
+    return spreadsheet.worksheet("title", INCOME_WORKSHEET_TITLE)
 
 
 class SheetPopulator:
-    def __init__(self, client_secret=None, sheet_url=None):
-        if client_secret is None:
-            client_secret = google_sheets_credentials_path
-        if sheet_url is None:
-            google_sheets_url = config.GOOGLE_SHEETS_URL_INCOME_ANALYSER
-            sheet_url = google_sheets_url
-        self.client = pygsheets.authorize(service_account_file=client_secret)
-        self.spreadsheet = self.client.open_by_url(sheet_url)
-        self.worksheet = self.spreadsheet.worksheet("title", "Income Calculation Worksheet")
-    
+    """
+    Writes paystub and W-2 entities to the Income Calculation Worksheet.
+
+    :param buffer: Write buffer to use instead of opening sheet_url, e.g. a SnapshotWriteBuffer
+    """
+    def __init__(self, client_secret=None, sheet_url=None, buffer=None):
+        if buffer is not None:
+            self.buffer = buffer
+            self.worksheet = buffer.worksheet
+            return
+        self.worksheet = open_income_worksheet(client_secret, sheet_url)
+        # Every cell populate_sheet reads is fetched up front in one call
+        snapshot = load_snapshot(self.worksheet, config.SHEETS_SNAPSHOT_RANGE) if config.SHEETS_SNAPSHOT_RANGE else None
+        self.buffer = SheetWriteBuffer(self.worksheet, snapshot)
+
     def parse_date(self, date_str):
         try:
             return datetime.strptime(date_str, "%m/%d/%Y")
@@ -61,34 +214,17 @@ class SheetPopulator:
         return month, day, days_in_month
 
     def update_value(self, cell, value):
-        self.worksheet.update_value(cell, value)
-
-    def get_earning_type(description):
-        # Assume description might have some indicator of type
-        if "commission" in description:
-            return "Commission"
-        elif "bonus" in description:
-            return "Bonus"
-        elif "overtime" in description:
-            return "Bonus"
-        elif "regular" in description:
-            return "Regular"
-        elif "base" in description:
-            return "Regular"
-        elif "paid time off" in description:
-            return "Regular"
-        elif "pto" in description:
-            return "Regular"
-        elif "holiday" in description:
-            return "Regular"
-        elif "vacation" in description:
-            return "Regular"
-        elif "personal" in description:
-            return "Regular"
-        elif "sick" in description:
-            return "Regular"
-        
-        return None  # Default to None if no specific type is identified
+        self.buffer.set(cell, value)
+
+    def get_value(self, cell):
+        return self.buffer.get(cell)
+
+    def flush(self):
+        return self.buffer.flush()
+
+    def get_earning_type(self, description):
+        # "Commission", "Bonus" (incl. overtime), "Regular" or None, per the earnings taxonomy
+        return get_earnings_classifier().classify(description)
     
     def populate_sheet(self, is_w2, data, general_cell_map=None, earnings_cell_map=None):
         if not is_w2:
@@ -102,38 +238,41 @@ class SheetPopulator:
 
             # Find the first empty row
             row_offset = 0
-            while self.worksheet.get_value(f"H{11 + row_offset}") != "":
+            while self.get_value(f"H{11 + row_offset}") != "":
                 row_offset += 1
             if row_offset == 4:
                 eoy_paystub = True # Check if all spaces for regular paystubs are taken, if it is, then this paystub is an End of Year Paystub
 
+            # Classify and parse every earning line of the stub in one batch
+            earning_lines = iter(get_earnings_classifier().parse_batch(
+                [entity.raw_value for entity in data if entity.type == "earning_item"]))
+
             for entity in data:
-                type = entity['Type']
-                value = entity['Raw Value']
+                type = entity.type
+                value = entity.raw_value
 
                 if not eoy_paystub:
                     if type in general_cell_map:
                         self.update_value(general_cell_map[type], value)
 
                     elif type == "earning_item":
-                        parts = value.split()
-                        earning_type = self.get_earning_type(value.lower())
-                        
-                        if earning_type == "Regular":
-                            regular_earnings += float(parts[-1].replace(',', '').replace('$', ''))
+                        line = next(earning_lines)
+
+                        if line.earning_type == "Regular":
+                            regular_earnings += line.amount or 0
                             if not first_earning_processed:
-                                if len(parts) == 3:
+                                if line.is_salary:
                                     is_salary = True
-                                else:
-                                    self.worksheet.update_value(f"E{11+row_offset}", parts[-4]) # Rate
-                                    self.worksheet.update_value(f"F{11+row_offset}", parts[-3]) # Hours
+                                elif line.rate is not None:
+                                    self.update_value(f"E{11+row_offset}", line.rate) # Rate
+                                    self.update_value(f"F{11+row_offset}", line.hours) # Hours
                                 first_earning_processed = True
-                        elif earning_type == "Commission":
+                        elif line.earning_type == "Commission":
                             # Update only YTD for Commission
-                            self.worksheet.update_value("C62", parts[-1])
-                        elif earning_type == "Bonus":
+                            self.update_value("C62", line.amount_text)
+                        elif line.earning_type == "Bonus":
                             # Summation for Overtime and Bonus
-                            combined_earnings += float(parts[-1].replace(',', '').replace('$', ''))
+                            combined_earnings += line.amount or 0
                     
                     elif type == "start_date":
                         start_date = value
@@ -149,38 +288,37 @@ class SheetPopulator:
                 # End of Year Paystub
                 else:
                     if type == "earning_item":
-                        parts = value.split()
-                        earning_type = self.get_earning_type(value.lower())
-                        if earning_type == "Regular":
-                            eoy_regular_earnings += float(parts[-1].replace(',', '').replace('$', ''))
+                        line = next(earning_lines)
+                        if line.earning_type == "Regular":
+                            eoy_regular_earnings += line.amount or 0
                     elif type == "pay_date":
                         eoy_paydate = value
                         eoy_month, eoy_day, eoy_month_days, eoy_year = self.get_number_of_days_in_this_month(eoy_paydate)
-                        self.worksheet.update_value(f"F24", eoy_year)
+                        self.update_value(f"F24", eoy_year)
 
             if start_date and end_date and paydate:
                 period_cell, delta = self.determine_period_type(start_date, end_date)
                 if is_salary:
                     if period_cell:
-                        self.worksheet.update_value(period_cell, gross_earnings)
-                        self.worksheet.update_value("C39", gross_earnings_ytd)
+                        self.update_value(period_cell, gross_earnings)
+                        self.update_value("C39", gross_earnings_ytd)
                 else:
                     if delta == 7:
-                        self.worksheet.update_value(f"G{11 + row_offset}", "TRUE" ) # Weekly
+                        self.update_value(f"G{11 + row_offset}", "TRUE" ) # Weekly
                     elif delta == 14:
-                        self.worksheet.update_value(f"G{11 + row_offset}", "FALSE" ) # Bi-weekly
+                        self.update_value(f"G{11 + row_offset}", "FALSE" ) # Bi-weekly
                     month, day, month_days = self.get_number_of_days_in_this_month(paydate)
                     cell_value = round(day/month_days, 2) + month - 1  # Normalize to a value between 0 and 1
-                    self.worksheet.update_value(f"I{11 + row_offset}", cell_value)
-                    self.worksheet.update_value(f"G39", cell_value)
-                    self.worksheet.update_value(f"G49", cell_value)
-                    self.worksheet.update_value(f"G67", cell_value)
-                    self.worksheet.update_value(f"G82", cell_value)
+                    self.update_value(f"I{11 + row_offset}", cell_value)
+                    self.update_value(f"G39", cell_value)
+                    self.update_value(f"G49", cell_value)
+                    self.update_value(f"G67", cell_value)
+                    self.update_value(f"G82", cell_value)
         
             if regular_earnings > 0:
-                self.worksheet.update_value(f"H{11 + row_offset}", f"${regular_earnings:,.2f}")
+                self.update_value(f"H{11 + row_offset}", f"${regular_earnings:,.2f}")
             if eoy_regular_earnings > 0:
-                self.worksheet.update_value("C24", f"${eoy_regular_earnings:,.2f}")
+                self.update_value("C24", f"${eoy_regular_earnings:,.2f}")
 
             # if combined_earnings > 0:
             #     current_value = self.worksheet.get_value('C39').replace('$', '').replace(',', '')
@@ -192,47 +330,53 @@ class SheetPopulator:
             wages_tips_other_compensation = 0
 
             for entity in data:
-                if entity['Type'] == 'WagesTipsOtherCompensation':
-                    wages_tips_other_compensation += float(entity['Raw Value'].replace(',', '').replace('$', ''))
-                    #print(f"found value: {entity['Raw Value']} for {entity['Type']}")
-                if entity['Type'] == 'FormYear':
-                    cell = self.worksheet.cell("E19")
-                    #print(f"cell value: {cell.value}")
-                    if cell.value == "" or cell.value == "0":
-                        self.worksheet.update_value("E19", entity['Raw Value'])
-                        self.worksheet.update_value("E40", entity['Raw Value'])
-                        self.worksheet.update_value("E83", entity['Raw Value'])
+                if entity.type == 'WagesTipsOtherCompensation':
+                    wages_tips_other_compensation += float(entity.raw_value.replace(',', '').replace('$', ''))
+                    #print(f"found value: {entity.raw_value} for {entity.type}")
+                if entity.type == 'FormYear':
+                    cell_value = self.get_value("E19")
+                    #print(f"cell value: {cell_value}")
+                    if cell_value == "" or cell_value == "0":
+                        self.update_value("E19", entity.raw_value)
+                        self.update_value("E40", entity.raw_value)
+                        self.update_value("E83", entity.raw_value)
                     else:
-                        self.worksheet.update_value("E20", entity['Raw Value'])
-                        self.worksheet.update_value("E41", entity['Raw Value'])
-                        self.worksheet.update_value("E84", entity['Raw Value'])
+                        self.update_value("E20", entity.raw_value)
+                        self.update_value("E41", entity.raw_value)
+                        self.update_value("E84", entity.raw_value)
                     
-                if self.worksheet.cell("C19").value == "" or self.worksheet.cell("C19").value == "0":
-                    self.worksheet.update_value("C19", wages_tips_other_compensation)
-                    self.worksheet.update_value("C40", wages_tips_other_compensation)
-                    self.worksheet.update_value("C83", wages_tips_other_compensation)
+                if self.get_value("C19") == "" or self.get_value("C19") == "0":
+                    self.update_value("C19", wages_tips_other_compensation)
+                    self.update_value("C40", wages_tips_other_compensation)
+                    self.update_value("C83", wages_tips_other_compensation)
                 else:
-                    self.worksheet.update_value("C20", wages_tips_other_compensation)
-                    self.worksheet.update_value("C41", wages_tips_other_compensation)
-                    self.worksheet.update_value("C84", wages_tips_other_compensation)
+                    self.update_value("C20", wages_tips_other_compensation)
+                    self.update_value("C41", wages_tips_other_compensation)
+                    self.update_value("C84", wages_tips_other_compensation)
+
+        self.flush()
 
 
 class SheetPopulatorWithoutAI:
     def __init__(self, client_secret=None, sheet_url=None):
         if client_secret is None:
-            client_secret = google_sheets_credentials_path
+            client_secret = google_sheets_credentials_path()
         if sheet_url is None:
             google_sheets_url = config.GOOGLE_SHEETS_URL_FANNIE_MAE
             sheet_url = google_sheets_url
-        self.client = pygsheets.authorize(service_account_file=client_secret)
-        self.spreadsheet = self.client.open_by_url(sheet_url)
+        self.client = get_sheets_client(client_secret)
+        self.spreadsheet = call_api('sheets', 'open_by_url', self.client.open_by_url, sheet_url, quota='read')
         self.worksheet = self.spreadsheet.worksheet("title", "Sheet1")
+        self.buffer = SheetWriteBuffer(self.worksheet)
 
     def update_value(self, cell_name, value):
-        cell = self.worksheet.cell(cell_name)
-        cell.value = value
+        self.buffer.set(cell_name, value)
+
+    def flush(self):
+        return self.buffer.flush()
 
-    def populate_sheet_without_ai(self, data, cell_map):
-        for key, value in data.items():
-            if key in cell_map and value is not None:
-                self.update_value(cell_map[key], value)
\ No newline at end of file
+    def populate_cells(self, values):
+        """Write {cell: value} in one update, e.g. the merged sections of a 1040 package."""
+        for cell, value in values.items():
+            self.update_value(cell, value)
+        self.flush()
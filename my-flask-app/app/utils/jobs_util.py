@@ -0,0 +1,294 @@
+import contextvars
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from ..config import get_config
+from . import metrics_util
+
+config = get_config(os.getenv('APP_ENV', 'default'))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+# The job the current thread or asyncio task is running, used by track_stage(). A context
+# variable rather than a thread-local so asyncio tasks (and asyncio.to_thread) see their own job.
+_current = contextvars.ContextVar('current_job', default=None)
+
+# Label used when work runs outside a job, e.g. on the Firestore writer thread
+UNKNOWN_DOCUMENT_TYPE = 'unknown'
+
+STAGE_SECONDS = metrics_util.histogram(
+    'docproc_stage_seconds', 'Time spent in each pipeline stage.', ('stage', 'document_type'))
+STAGES_IN_FLIGHT = metrics_util.gauge(
+    'docproc_stages_in_flight', 'Pipeline stages currently running.', ('stage',))
+API_CALL_SECONDS = metrics_util.histogram(
+    'docproc_api_call_seconds', 'Latency of outbound Google API calls.', ('service', 'method', 'document_type'))
+API_CALLS = metrics_util.counter(
+    'docproc_api_calls', 'Outbound Google API calls.', ('service', 'method', 'document_type'))
+API_CALL_ERRORS = metrics_util.counter(
+    'docproc_api_call_errors', 'Outbound Google API calls that raised.', ('service', 'method'))
+API_CALLS_IN_FLIGHT = metrics_util.gauge(
+    'docproc_api_calls_in_flight', 'Outbound Google API calls currently waiting on a response.', ('service',))
+API_CALLS_PER_JOB = metrics_util.histogram(
+    'docproc_api_calls_per_job', 'Outbound Google API calls made while processing one document.',
+    ('document_type',), buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89))
+JOBS_FINISHED = metrics_util.counter(
+    'docproc_jobs_finished', 'Documents processed, by outcome.', ('document_type', 'state'))
+JOBS_PENDING = metrics_util.gauge(
+    'docproc_async_jobs_pending', 'Unfinished jobs in the async job queue.')
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the job queue already holds its maximum number of pending jobs."""
+
+
+class Job:
+    def __init__(self, document_type=None, filename=None):
+        self.id = uuid.uuid4().hex
+        self.document_type = document_type
+        self.filename = filename
+        self.state = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stages = OrderedDict()
+        self.api_calls = Counter()
+        self.error = None
+        self._lock = threading.Lock()
+
+    def record_stage(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def record_api_call(self, service, method):
+        with self._lock:
+            self.api_calls[f"{service}.{method}"] += 1
+
+    @property
+    def finished(self):
+        return self.state in (SUCCEEDED, FAILED)
+
+    def to_dict(self):
+        with self._lock:
+            stages = {name: round(seconds, 3) for name, seconds in self.stages.items()}
+            api_calls = dict(self.api_calls)
+        total = None
+        if self.started_at is not None:
+            total = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            'job_id': self.id,
+            'state': self.state,
+            'document_type': self.document_type,
+            'filename': self.filename,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'queued_seconds': round((self.started_at or time.time()) - self.created_at, 3),
+            'total_seconds': total,
+            'stages': stages,
+            'api_calls': api_calls,
+            'error': self.error,
+        }
+
+
+class JobQueue:
+    """
+    Bounded in-process worker pool for document processing jobs.
+
+    :param max_workers: Number of jobs processed concurrently
+    :param max_pending: Maximum number of unfinished jobs (queued, running or waiting on a
+                        long-running operation) before submit() is rejected
+    :param max_retained: Number of finished jobs kept around for status lookups
+    """
+    def __init__(self, max_workers=2, max_pending=16, max_retained=500):
+        self.max_pending = max_pending
+        self.max_retained = max_retained
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, document_type=None, filename=None, **kwargs):
+        """Queue func(*args, **kwargs) and return its Job, or raise QueueFullError."""
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(f"Job queue is full ({self.max_pending} pending jobs)")
+        job = Job(document_type=document_type, filename=filename)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict_finished()
+        try:
+            self._executor.submit(self._run, job, func, args, kwargs)
+        except RuntimeError:
+            self._slots.release()
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job, func, args, kwargs):
+        job.state = RUNNING
+        job.started_at = time.time()
+        try:
+            with job_context(job):
+                result = func(*args, **kwargs)
+        except Exception as e:
+            self._finish(job, e)
+            return
+        if isinstance(result, Future):
+            # The rest of the work finishes elsewhere (e.g. a batch operation callback),
+            # so free this worker and complete the job when the future resolves
+            result.add_done_callback(lambda future: self._finish(job, future.exception()))
+        else:
+            self._finish(job, None)
+
+    def _finish(self, job, error):
+        if error is not None:
+            job.error = f"{type(error).__name__}: {error}"
+            job.state = FAILED
+            print(f"Job {job.id} failed: {job.error}")
+            traceback.print_exception(error)
+        else:
+            job.state = SUCCEEDED
+        job.finished_at = time.time()
+        record_job_metrics(job)
+        self._slots.release()
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_retained)]:
+            del self._jobs[job_id]
+
+
+def current_job():
+    """Return the Job being run by the calling thread or task, if any."""
+    return _current.get()
+
+
+@contextmanager
+def job_context(job):
+    """Make job the current job of the calling thread, e.g. in a callback that continues its work."""
+    token = _current.set(job)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def _document_type_label(job, document_type=None):
+    if document_type is None and job is not None:
+        document_type = job.document_type
+    return document_type or UNKNOWN_DOCUMENT_TYPE
+
+
+def observe_stage(name, seconds, document_type=None):
+    """
+    Record a stage duration on the current job and in the stage histogram.
+    document_type defaults to the current job's; stages outside a job only go to the histogram.
+    """
+    job = current_job()
+    if job is not None:
+        job.record_stage(name, seconds)
+    STAGE_SECONDS.observe(seconds, stage=name, document_type=_document_type_label(job, document_type))
+
+
+@contextmanager
+def track_stage(name, document_type=None):
+    """Time a pipeline stage and record it on the current job and in the stage histogram."""
+    STAGES_IN_FLIGHT.inc(stage=name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGES_IN_FLIGHT.dec(stage=name)
+        observe_stage(name, time.perf_counter() - start, document_type)
+
+
+@contextmanager
+def track_api_call(service, method):
+    """
+    Time one outbound API call (e.g. 'sheets', 'update_values_batch') and count it, both
+    globally and on the current job, so the per-document call count can be reported.
+    """
+    job = current_job()
+    if job is not None:
+        job.record_api_call(service, method)
+    document_type = _document_type_label(job)
+    API_CALLS.inc(service=service, method=method, document_type=document_type)
+    API_CALLS_IN_FLIGHT.inc(service=service)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        API_CALL_ERRORS.inc(service=service, method=method)
+        raise
+    finally:
+        API_CALLS_IN_FLIGHT.dec(service=service)
+        API_CALL_SECONDS.observe(time.perf_counter() - start, service=service, method=method,
+                                 document_type=document_type)
+
+
+@contextmanager
+def run_inline(job):
+    """Run the body as job on the calling thread (e.g. a synchronous request) and record its outcome."""
+    job.state = RUNNING
+    job.started_at = time.time()
+    try:
+        with job_context(job):
+            yield job
+    except Exception as e:
+        job.error = f"{type(e).__name__}: {e}"
+        job.state = FAILED
+        raise
+    else:
+        job.state = SUCCEEDED
+    finally:
+        job.finished_at = time.time()
+        record_job_metrics(job)
+
+
+def record_job_metrics(job):
+    """Count a finished job and how many API calls it made."""
+    document_type = _document_type_label(job)
+    JOBS_FINISHED.inc(document_type=document_type, state=job.state)
+    with job._lock:
+        calls = sum(job.api_calls.values())
+    API_CALLS_PER_JOB.observe(calls, document_type=document_type)
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide JobQueue, creating it on first use."""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue(
+                    max_workers=config.ASYNC_JOB_WORKERS,
+                    max_pending=config.ASYNC_JOB_QUEUE_SIZE,
+                    max_retained=config.ASYNC_JOB_RETENTION,
+                )
+    return _job_queue
+
+
+JOBS_PENDING.set_function(lambda: _job_queue.pending() if _job_queue is not None else 0)
@@ -0,0 +1,325 @@
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from .jobs_util import current_job, job_context
+from .outbound_util import call_api
+from ..config import get_config
+
+config = get_config(os.getenv('APP_ENV', 'default'))
+
+# Completion callbacks by kind. Callbacks are looked up by name so operations
+# resumed after a restart can still be handed to the right pipeline step.
+_callbacks = {}
+
+
+def register_operation_callback(kind):
+    """Decorator registering callback(operation, context) to run when an operation of this kind completes."""
+    def decorator(callback):
+        _callbacks[kind] = callback
+        return callback
+    return decorator
+
+
+def fetch_documentai_operation(name, location):
+    """Fetch the current state of a Document AI batch operation by name."""
+    from google.api_core import operation as operation_module
+    from google.cloud import documentai_v1 as documentai
+    from .clients_util import get_documentai_client
+    client = get_documentai_client(location)
+    raw_operation = call_api('documentai', 'get_operation', client.get_operation, request={'name': name},
+                             quota='operations')
+    return operation_module.from_gapic(
+        raw_operation,
+        client.transport.operations_client,
+        documentai.BatchProcessResponse,
+        metadata_type=documentai.BatchProcessMetadata,
+    )
+
+
+class TrackedOperation:
+    def __init__(self, name, kind, context, location, submitted_at=None):
+        self.name = name
+        self.kind = kind
+        self.context = context or {}
+        self.location = location
+        self.submitted_at = submitted_at or time.time()
+        self.delay = None
+        self.next_poll = 0.0
+        self.future = Future()
+        self.job = None
+
+    def to_state(self):
+        return {
+            'kind': self.kind,
+            'context': self.context,
+            'location': self.location,
+            'submitted_at': self.submitted_at,
+        }
+
+
+class OperationManager:
+    """
+    Tracks many long-running operations from one background poller thread.
+
+    Each operation is polled with its own exponential backoff. Operation names are
+    persisted so a restarted process can resume() waiting instead of re-submitting, and
+    completed operations are handed to the callback registered for their kind on a small
+    callback pool.
+
+    Every manager persists only its own operations, to <state_path root>.<owner>.json, where
+    owner is the pid and a random suffix, and holds an flock on <root>.<owner>.lock for as
+    long as its process lives. resume() takes over the files of owners that are gone (their
+    lock is free); a file is claimed by renaming it, so with several gunicorn workers each
+    orphaned operation is resumed by exactly one of them.
+
+    :param state_path: Base path of the JSON files in-flight operations are persisted to, or None
+    :param fetch_operation: Callable(name, location) returning an api_core Operation
+    """
+    def __init__(self, state_path=None, initial_delay=5.0, max_delay=60.0, multiplier=1.5,
+                 timeout=900, callback_workers=4, fetch_operation=fetch_documentai_operation):
+        self.state_path = state_path
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.timeout = timeout
+        self.fetch_operation = fetch_operation
+        self._operations = {}
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=callback_workers, thread_name_prefix='lro-callback')
+        self._thread = None
+        self._stopped = False
+        self._owner = None
+        self._owner_pid = None
+        self._lock_file = None
+        self._state_lock = threading.Lock()
+
+    def _state_name(self, owner, suffix='.json'):
+        root, _ = os.path.splitext(self.state_path)
+        return f"{root}.{owner}{suffix}"
+
+    @property
+    def state_file(self):
+        """This manager's state file; its lock is taken on first use, and again in a forked child."""
+        with self._state_lock:
+            if self._owner_pid != os.getpid():
+                import fcntl
+                directory = os.path.dirname(self.state_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+                lock_file = open(self._state_name(owner, '.lock'), 'w')
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._owner, self._owner_pid, self._lock_file = owner, os.getpid(), lock_file
+            return self._state_name(self._owner)
+
+    def _owner_alive(self, owner):
+        """True while the manager that wrote owner's state files holds its lock."""
+        import fcntl
+        try:
+            lock_file = open(self._state_name(owner, '.lock'), 'r')
+        except OSError:
+            return False
+        with lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return False
+
+    def _orphaned_state_files(self):
+        """(path, owner) of the state files of owners that are gone."""
+        directory = os.path.dirname(self.state_path) or '.'
+        root, ext = os.path.splitext(os.path.basename(self.state_path))
+        pattern = re.compile(rf"{re.escape(root)}\.(\d+-[0-9a-f]+)(\.claimed-[0-9a-f]+)?{re.escape(ext)}$")
+        own = os.path.basename(self.state_file)
+        orphaned = []
+        for name in sorted(os.listdir(directory)):
+            match = pattern.match(name)
+            if match and name != own and match.group(1) != self._owner and not self._owner_alive(match.group(1)):
+                orphaned.append((os.path.join(directory, name), match.group(1)))
+        return orphaned
+
+    def _claim(self, path):
+        """
+        Take over a state file by renaming it to one of ours; returns (state, claimed path), or
+        (None, None) when another process claimed it first.
+        """
+        claimed = self._state_name(self._owner, f".claimed-{uuid.uuid4().hex}.json")
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None, None
+        with open(claimed, 'r') as f:
+            try:
+                return json.load(f), claimed
+            except ValueError:
+                print(f"Ignoring unreadable operation state {path}")
+                return {}, claimed
+
+    def track(self, name, kind, context=None, location=None, submitted_at=None):
+        """Start tracking an operation; returns a Future resolved with the callback's result."""
+        if kind not in _callbacks:
+            raise ValueError(f"No operation callback registered for {kind}")
+        tracked = TrackedOperation(name, kind, context, location, submitted_at)
+        tracked.job = current_job()
+        if submitted_at is None:
+            # A freshly submitted operation won't be done yet; resumed ones are polled right away
+            tracked.delay = self.initial_delay
+            tracked.next_poll = time.time() + self.initial_delay
+        with self._condition:
+            self._operations[name] = tracked
+            self._persist()
+            self._condition.notify()
+        self.start()
+        return tracked.future
+
+    def resume(self):
+        """Resume tracking operations persisted by processes that are gone. Returns how many were resumed."""
+        if not self.state_path:
+            return 0
+        resumed = 0
+        for path, owner in self._orphaned_state_files():
+            state, claimed = self._claim(path)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._state_name(owner, '.lock'))
+            if claimed is None:
+                continue
+            for name, entry in state.items():
+                if name in self._operations:
+                    continue
+                if entry['kind'] not in _callbacks:
+                    print(f"Skipping operation {name}: no callback registered for {entry['kind']}")
+                    continue
+                self.track(name, entry['kind'], entry['context'], entry['location'], entry['submitted_at'])
+                resumed += 1
+            # The operations are in our own state file now
+            os.remove(claimed)
+        print(f"Resumed {resumed} long-running operations")
+        return resumed
+
+    def in_flight(self):
+        with self._condition:
+            return len(self._operations)
+
+    def start(self):
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, name='lro-poller', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    now = time.time()
+                    due = [op for op in self._operations.values() if op.next_poll <= now]
+                    if due:
+                        break
+                    wait = min((op.next_poll for op in self._operations.values()), default=now + 60) - now
+                    self._condition.wait(timeout=wait)
+                if self._stopped:
+                    return
+            for tracked in due:
+                self._poll(tracked)
+
+    def _poll(self, tracked):
+        try:
+            operation = self.fetch_operation(tracked.name, tracked.location)
+            # Read the fetched state directly; operation.done() would issue a second RPC
+            done = operation.operation.done
+        except Exception as e:
+            print(f"Error polling operation {tracked.name}: {e}")
+            operation, done = None, False
+
+        if done:
+            self._complete(tracked, operation)
+        elif time.time() - tracked.submitted_at > self.timeout:
+            self._remove(tracked)
+            tracked.future.set_exception(TimeoutError(f"Operation {tracked.name} did not finish in {self.timeout}s"))
+        else:
+            tracked.delay = self.initial_delay if tracked.delay is None else min(tracked.delay * self.multiplier, self.max_delay)
+            tracked.next_poll = time.time() + tracked.delay
+
+    def _complete(self, tracked, operation):
+        self._remove(tracked)
+        error = operation.exception()
+        if error is not None:
+            tracked.future.set_exception(error)
+            return
+        self._executor.submit(self._run_callback, tracked, operation)
+
+    def _run_callback(self, tracked, operation):
+        try:
+            with job_context(tracked.job):
+                result = _callbacks[tracked.kind](operation, tracked.context)
+        except Exception as e:
+            print(f"Callback for operation {tracked.name} failed: {e}")
+            tracked.future.set_exception(e)
+        else:
+            tracked.future.set_result(result)
+
+    def _remove(self, tracked):
+        with self._condition:
+            self._operations.pop(tracked.name, None)
+            self._persist()
+
+    def _persist(self):
+        if not self.state_path:
+            return
+        state = {name: tracked.to_state() for name, tracked in self._operations.items()}
+        state_file = self.state_file
+        if not state:
+            if os.path.exists(state_file):
+                os.remove(state_file)
+            return
+        tmp_path = f"{state_file}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_file)
+
+
+_operation_manager = None
+_operation_manager_lock = threading.Lock()
+
+
+def get_operation_manager():
+    """Return the process-wide OperationManager, creating it on first use."""
+    global _operation_manager
+    if _operation_manager is None:
+        with _operation_manager_lock:
+            if _operation_manager is None:
+                _operation_manager = OperationManager(
+                    state_path=config.LRO_STATE_PATH,
+                    initial_delay=config.LRO_POLL_INITIAL_DELAY,
+                    max_delay=config.LRO_POLL_MAX_DELAY,
+                    timeout=config.LRO_TIMEOUT,
+                )
+    return _operation_manager
+
+
+def _reset_after_fork():
+    # The poller thread does not survive fork(); a forked worker resumes from the state files.
+    # The child drops its copy of the parent's state file lock, which is still held by the parent
+    global _operation_manager, _operation_manager_lock
+    if _operation_manager is not None and _operation_manager._lock_file is not None:
+        _operation_manager._lock_file.close()
+    _operation_manager = None
+    _operation_manager_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
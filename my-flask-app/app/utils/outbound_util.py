@@ -0,0 +1,279 @@
+"""
+Rate limiting and retries shared by every outbound Google API call.
+
+Calls go through call_api() (or call_api_async()), which
+ - takes a token from the bucket of the call's quota (e.g. Sheets reads, Document AI requests
+   per processor) before sending, so bursts queue up here instead of exceeding the quota,
+ - retries 429 / RESOURCE_EXHAUSTED and transient 5xx errors with full-jitter exponential backoff,
+ - halves the bucket's rate on every 429 and grows it back additively on success (AIMD), so the
+   rate settles just under what the quota actually allows.
+
+Limits come from OUTBOUND_RATE_LIMITS and are per process; with several gunicorn workers, divide
+the quota between them. limit_concurrency() additionally caps the calls of a service in flight at
+once with a semaphore, which may be shared by several processes (see app/bulk.py).
+"""
+import asyncio
+import contextlib
+import os
+import random
+import threading
+import time
+from . import metrics_util
+from .jobs_util import track_api_call
+from ..config import get_config
+
+config = get_config(os.getenv('APP_ENV', 'default'))
+
+THROTTLED = 'throttled'
+UNAVAILABLE = 'unavailable'
+
+_THROTTLED_STATUSES = {429}
+_UNAVAILABLE_STATUSES = {500, 502, 503, 504}
+
+TOKEN_WAIT_SECONDS = metrics_util.histogram(
+    'docproc_outbound_token_wait_seconds', 'Time outbound calls waited for a rate-limit token.',
+    ('service', 'quota'), buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+THROTTLED_RESPONSES = metrics_util.counter(
+    'docproc_outbound_throttled', 'Outbound calls rejected with 429 / RESOURCE_EXHAUSTED.', ('service', 'quota'))
+RETRIES = metrics_util.counter(
+    'docproc_outbound_retries', 'Outbound calls retried after a retryable error.', ('service', 'method', 'reason'))
+RATE = metrics_util.gauge(
+    'docproc_outbound_rate', 'Current rate limit of an outbound quota, in calls per second.', ('service', 'quota'))
+
+
+def error_status(error):
+    """HTTP status of an API error from google-api-core or googleapiclient (pygsheets), or None."""
+    for get_status in (lambda: error.resp.status, lambda: error.code):
+        try:
+            return int(get_status())
+        except (AttributeError, TypeError, ValueError):
+            continue
+    return None
+
+
+def retry_reason(error):
+    """THROTTLED, UNAVAILABLE or None when the call should not be retried."""
+    status = error_status(error)
+    if status in _THROTTLED_STATUSES:
+        return THROTTLED
+    if status in _UNAVAILABLE_STATUSES or isinstance(error, (ConnectionError, TimeoutError)):
+        return UNAVAILABLE
+    return None
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations: reserve() takes a token, possibly one that is only
+    refilled in the future, and returns how long to wait for it. That works the same for threads
+    (time.sleep) and coroutines (asyncio.sleep).
+
+    :param rate: Tokens per second, and the most the rate grows back to after throttling
+    :param burst: Bucket size, i.e. calls that may go out at once after a quiet period
+    """
+    def __init__(self, rate, burst, min_rate=0.1, decrease_factor=0.5, increase_fraction=0.05):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min(min_rate, rate)
+        self.decrease_factor = decrease_factor
+        self.increase_fraction = increase_fraction
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Take a token and return the seconds to wait before using it."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def throttled(self):
+        """The quota rejected a call: multiplicative decrease, and no burst until the bucket refills."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self.tokens = min(self.tokens, 0.0)
+            return self.rate
+
+    def succeeded(self):
+        """Additive increase back towards the configured rate."""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * self.increase_fraction)
+            return self.rate
+
+
+class OutboundScheduler:
+    """
+    :param limits: {"service" or "service:quota": [calls per second, burst]}; calls without a
+                   matching entry are not rate limited
+    :param max_attempts: Attempts per call, including the first
+    """
+    def __init__(self, limits, max_attempts=5, initial_backoff=0.5, max_backoff=30.0):
+        self.limits = limits
+        self.max_attempts = max_attempts
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self._buckets = {}
+        self._gates = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, service, quota=None):
+        """The TokenBucket of one quota, e.g. ('documentai', processor id), or None if unlimited."""
+        key = (service, quota)
+        bucket = self._buckets.get(key, False)
+        if bucket is False:
+            with self._lock:
+                bucket = self._buckets.get(key, False)
+                if bucket is False:
+                    limit = self.limits.get(f"{service}:{quota}") or self.limits.get(service)
+                    bucket = TokenBucket(*limit) if limit else None
+                    self._buckets[key] = bucket
+                    if bucket is not None:
+                        RATE.set(bucket.rate, service=service, quota=quota or '')
+        return bucket
+
+    def limit_concurrency(self, service, semaphore):
+        """Hold semaphore around every call of service (None removes the limit); it may be shared between processes."""
+        if semaphore is None:
+            self._gates.pop(service, None)
+        else:
+            self._gates[service] = semaphore
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff before retry number attempt + 1."""
+        return random.uniform(0, min(self.max_backoff, self.initial_backoff * 2 ** attempt))
+
+    def _reserve(self, bucket, service, quota):
+        delay = bucket.reserve() if bucket is not None else 0.0
+        TOKEN_WAIT_SECONDS.observe(delay, service=service, quota=quota or '')
+        return delay
+
+    def _failed(self, error, bucket, service, method, quota, attempt, attempts, retry=True):
+        """Seconds to wait before retrying, or None to give up on the call."""
+        reason = retry_reason(error)
+        if reason == THROTTLED:
+            THROTTLED_RESPONSES.inc(service=service, quota=quota or '')
+            if bucket is not None:
+                RATE.set(bucket.throttled(), service=service, quota=quota or '')
+        if reason is None or attempt + 1 >= attempts or (retry is not True and reason not in retry):
+            return None
+        RETRIES.inc(service=service, method=method, reason=reason)
+        delay = self.backoff(attempt)
+        print(f"{service}.{method} failed ({type(error).__name__}: {error}), retrying in {delay:.2f}s")
+        return delay
+
+    def _succeeded(self, bucket, service, quota):
+        if bucket is not None and bucket.rate < bucket.max_rate:
+            RATE.set(bucket.succeeded(), service=service, quota=quota or '')
+
+    def call(self, service, method, func, args, kwargs, quota=None, retry=True):
+        bucket = self.bucket(service, quota)
+        gate = self._gates.get(service)
+        attempts = self.max_attempts if retry else 1
+        for attempt in range(attempts):
+            delay = self._reserve(bucket, service, quota)
+            if delay:
+                time.sleep(delay)
+            try:
+                with gate if gate is not None else contextlib.nullcontext(), track_api_call(service, method):
+                    result = func(*args, **kwargs)
+            except Exception as e:
+                delay = self._failed(e, bucket, service, method, quota, attempt, attempts, retry)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self._succeeded(bucket, service, quota)
+            return result
+
+    @staticmethod
+    async def _gated_call_async(gate, service, method, func, args, kwargs):
+        if gate is not None:
+            # The semaphore may be a process-shared one, which only has a blocking acquire
+            await asyncio.to_thread(gate.acquire)
+        try:
+            with track_api_call(service, method):
+                return await func(*args, **kwargs)
+        finally:
+            if gate is not None:
+                gate.release()
+
+    async def call_async(self, service, method, func, args, kwargs, quota=None, retry=True):
+        bucket = self.bucket(service, quota)
+        gate = self._gates.get(service)
+        attempts = self.max_attempts if retry else 1
+        for attempt in range(attempts):
+            delay = self._reserve(bucket, service, quota)
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                result = await self._gated_call_async(gate, service, method, func, args, kwargs)
+            except Exception as e:
+                delay = self._failed(e, bucket, service, method, quota, attempt, attempts, retry)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._succeeded(bucket, service, quota)
+            return result
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_outbound_scheduler():
+    """Return the process-wide OutboundScheduler, creating it on first use."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = OutboundScheduler(
+                    limits=config.OUTBOUND_RATE_LIMITS,
+                    max_attempts=config.OUTBOUND_MAX_ATTEMPTS,
+                    initial_backoff=config.OUTBOUND_INITIAL_BACKOFF,
+                    max_backoff=config.OUTBOUND_MAX_BACKOFF,
+                )
+    return _scheduler
+
+
+def reset_outbound_scheduler():
+    """Drop the scheduler and its buckets, e.g. after changing OUTBOUND_RATE_LIMITS."""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = None
+
+
+def limit_concurrency(service, semaphore):
+    """Cap the calls of service in flight at once by semaphore on the process-wide scheduler."""
+    get_outbound_scheduler().limit_concurrency(service, semaphore)
+
+
+def _reset_after_fork():
+    global _scheduler, _scheduler_lock
+    _scheduler = None
+    _scheduler_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def call_api(service, method, func, *args, quota=None, retry=True, **kwargs):
+    """
+    Call func(*args, **kwargs) as one outbound API call of service.method: wait for a token of
+    the service's quota, time and count it like track_api_call, and retry retryable errors.
+    Pass retry=False for calls that must not be repeated or are retried by the caller, or a
+    tuple of reasons (e.g. (THROTTLED,)) to retry only those errors.
+    """
+    return get_outbound_scheduler().call(service, method, func, args, kwargs, quota, retry)
+
+
+async def call_api_async(service, method, func, *args, quota=None, retry=True, **kwargs):
+    """call_api for a coroutine function; waits for tokens and backoffs without blocking the loop."""
+    return await get_outbound_scheduler().call_async(service, method, func, args, kwargs, quota, retry)
@@ -1,8 +1,9 @@
-import fitz  # PyMuPDF
 import re
+from collections import defaultdict
 
 def extract_text(pdf_path, coords, page_number):
     """Extract text from specified coordinates and page."""
+    import fitz  # PyMuPDF
     document = fitz.open(pdf_path)
     page = document.load_page(page_number)
     rect = fitz.Rect(coords)
@@ -22,3 +23,81 @@ def extract_amortization_value(text_block):
                 if matches:
                     return matches[0].replace(',', '').replace('.', '')
     return None
+
+def _overlaps(a, b):
+    return not (a[0] >= b[2] or a[1] >= b[3] or a[2] <= b[0] or a[3] <= b[1])
+
+class PageTextIndex:
+    """
+    Spatial index over one page's text layer. The page is read once with get_text("rawdict");
+    lines are bucketed into horizontal bands so a rectangle query only looks at nearby lines.
+    text_in(rect) returns the same text as page.get_textbox(rect).
+    """
+    BAND_HEIGHT = 16
+
+    def __init__(self, page):
+        self.lines = []
+        self.bands = defaultdict(list)
+        for block in page.get_text("rawdict")["blocks"]:
+            if block["type"] != 0:
+                continue
+            for line in block["lines"]:
+                chars = [(char["bbox"], char["c"]) for span in line["spans"] for char in span["chars"]]
+                if not chars:
+                    continue
+                bbox = line["bbox"]
+                line_number = len(self.lines)
+                self.lines.append((bbox, chars))
+                for band in range(int(bbox[1] // self.BAND_HEIGHT), int(bbox[3] // self.BAND_HEIGHT) + 1):
+                    self.bands[band].append(line_number)
+
+    def text_in(self, rect):
+        rect = tuple(rect)
+        candidates = set()
+        for band in range(int(rect[1] // self.BAND_HEIGHT), int(rect[3] // self.BAND_HEIGHT) + 1):
+            candidates.update(self.bands.get(band, ()))
+        lines = []
+        # Line numbers follow reading order, so sorting keeps get_textbox's ordering
+        for line_number in sorted(candidates):
+            bbox, chars = self.lines[line_number]
+            if not _overlaps(bbox, rect):
+                continue
+            text = "".join(c for char_bbox, c in chars if _overlaps(char_bbox, rect))
+            if text:
+                lines.append(text)
+        return "\n".join(lines)
+
+class RegionTemplate:
+    """
+    Declarative set of named rectangles per page, answered with one open of the PDF
+    and one text-layer read per page.
+
+    :param pages: {page_number: {field_name: (x0, y0, x1, y1)}}
+    :param postprocess: Optional {field_name: callable} applied to the extracted text
+    """
+    def __init__(self, pages, postprocess=None):
+        self.pages = pages
+        self.postprocess = postprocess or {}
+
+    def extract(self, pdf):
+        """Extract every field from a PDF path, bytes or open fitz.Document."""
+        import fitz  # PyMuPDF
+        if isinstance(pdf, fitz.Document):
+            return self._extract(pdf)
+        if isinstance(pdf, (bytes, bytearray, memoryview)):
+            document = fitz.open(stream=pdf, filetype="pdf")
+        else:
+            document = fitz.open(pdf)
+        with document:
+            return self._extract(document)
+
+    def _extract(self, document):
+        extracted_data = {}
+        for page_number, fields in self.pages.items():
+            index = PageTextIndex(document.load_page(page_number))
+            for key, rect in fields.items():
+                text = index.text_in(rect).strip()
+                if key in self.postprocess:
+                    text = self.postprocess[key](text)
+                extracted_data[key] = text
+        return extracted_data
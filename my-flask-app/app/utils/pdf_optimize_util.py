@@ -0,0 +1,222 @@
+"""
+Shrinks a paystub or W-2 PDF before it is sent to Document AI.
+
+ 1. page selection: blank pages, exact duplicates and, when the PDF has a text layer, pages
+    that do not look like the document type (e.g. the cover letter around a paystub, or the
+    copies C and 2 next to W-2 copy B) are dropped
+ 2. image downsampling: images rendered above PDF_OPTIMIZE_TARGET_DPI are resampled to it
+    and stored as JPEG
+ 3. cleanup: metadata, embedded files and unused objects are removed and streams compressed
+
+The bytes saved by each stage are reported, and the original is sent whenever optimizing
+fails or does not make it smaller.
+"""
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from . import metrics_util
+from .jobs_util import track_stage
+from .upload_buffer_util import UploadBuffer, open_pdf, document_size
+from ..config import get_config
+
+config = get_config(os.getenv('APP_ENV', 'default'))
+
+# Phrases that mark a page as the document itself; a page matching none of them is dropped
+# when another page of the PDF matches
+RELEVANT_PHRASES = {
+    'paystub': ('earnings', 'net pay', 'gross pay', 'pay date', 'pay period', 'year to date', 'ytd',
+                'deductions', 'pay statement', 'earnings statement'),
+    'w2': ('wage and tax statement', 'w-2', 'employer identification number', 'wages, tips'),
+}
+# Of a W-2 printed as several copies, only copy B (filed with the federal return) is kept
+PREFERRED_PHRASES = {
+    'w2': ('copy b',),
+}
+
+# A textless page is blank when less than this fraction of a thumbnail is darker than BLANK_LEVEL
+BLANK_INK_FRACTION = 0.002
+BLANK_LEVEL = 200
+THUMBNAIL_SCALE = 0.1
+
+BYTES_SAVED = metrics_util.counter(
+    'docproc_pdf_optimize_bytes_saved', 'Bytes removed from PDFs before Document AI, by stage.', ('stage',))
+PAGES_DROPPED = metrics_util.counter(
+    'docproc_pdf_optimize_pages_dropped', 'Pages removed from PDFs before Document AI, by reason.', ('reason',))
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _thumbnail(page):
+    import fitz  # PyMuPDF
+    return page.get_pixmap(matrix=fitz.Matrix(THUMBNAIL_SCALE, THUMBNAIL_SCALE), colorspace=fitz.csGRAY, alpha=False)
+
+
+def _is_blank(page, text):
+    if text:
+        return False
+    if not page.get_images() and not page.get_drawings():
+        return True
+    samples = _thumbnail(page).samples
+    ink = sum(1 for value in samples if value < BLANK_LEVEL)
+    return ink < BLANK_INK_FRACTION * max(len(samples), 1)
+
+
+def _fingerprint(page, text):
+    if text:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    # Quantized so re-encoding noise in an otherwise identical scan does not matter
+    return hashlib.sha256(bytes(value >> 4 for value in _thumbnail(page).samples)).hexdigest()
+
+
+def select_pages(pdf, document_type=None):
+    """
+    Page numbers to keep, and {reason: pages dropped} with reasons 'blank', 'duplicate' and
+    'irrelevant'. At least one page is always kept.
+    """
+    dropped = OrderedDict((reason, 0) for reason in ('blank', 'duplicate', 'irrelevant'))
+    candidates, texts, seen = [], {}, set()
+    for page in pdf:
+        text = _WHITESPACE.sub(' ', page.get_text('text')).strip().lower()
+        if _is_blank(page, text):
+            dropped['blank'] += 1
+            continue
+        fingerprint = _fingerprint(page, text)
+        if fingerprint in seen:
+            dropped['duplicate'] += 1
+            continue
+        seen.add(fingerprint)
+        candidates.append(page.number)
+        texts[page.number] = text
+    if not candidates:
+        return [0], dropped
+
+    phrases = RELEVANT_PHRASES.get(document_type)
+    if phrases:
+        # Pages without a text layer (scans) cannot be judged and are kept
+        relevant = [number for number in candidates
+                    if not texts[number] or any(phrase in texts[number] for phrase in phrases)]
+        preferred = [number for number in relevant
+                     if any(phrase in texts[number] for phrase in PREFERRED_PHRASES.get(document_type, ()))]
+        keep = preferred or relevant
+        if keep and any(texts[number] for number in keep):
+            dropped['irrelevant'] = len(candidates) - len(keep)
+            candidates = keep
+    return candidates, dropped
+
+
+def _image_dpi(page, xref, width):
+    """Lowest resolution the image is shown at on the page, in dots per inch, or None."""
+    dpi = None
+    for info in page.get_image_info(xrefs=True):
+        if info.get('xref') != xref:
+            continue
+        x0, y0, x1, y1 = info['bbox']
+        shown_inches = max(abs(x1 - x0), 1e-3) / 72
+        placed_dpi = width / shown_inches
+        dpi = placed_dpi if dpi is None else min(dpi, placed_dpi)
+    return dpi
+
+
+def downsample_images(pdf, target_dpi, jpeg_quality):
+    """Resample images shown above target_dpi to it, stored as JPEG; returns how many were replaced."""
+    import fitz  # PyMuPDF
+    replaced, done = 0, set()
+    for page in pdf:
+        for image in page.get_images(full=True):
+            xref, smask, width, height, bpc = image[0], image[1], image[2], image[3], image[4]
+            # Masks, 1-bit scans and images already handled on an earlier page are left alone
+            if xref in done or smask or bpc == 1:
+                continue
+            done.add(xref)
+            dpi = _image_dpi(page, xref, width)
+            if dpi is None or dpi <= target_dpi:
+                continue
+            scale = target_dpi / dpi
+            pixmap = fitz.Pixmap(pdf, xref)
+            if pixmap.alpha or pixmap.colorspace is None or pixmap.colorspace.n not in (1, 3):
+                pixmap = fitz.Pixmap(fitz.csRGB, pixmap, 0)
+            resized = fitz.Pixmap(pixmap, max(1, int(width * scale)), max(1, int(height * scale)), None)
+            content = resized.tobytes('jpeg', jpg_quality=jpeg_quality)
+            if len(content) < len(pdf.xref_stream_raw(xref) or b''):
+                page.replace_image(xref, stream=content)
+                replaced += 1
+    return replaced
+
+
+def _serialize(pdf, **options):
+    return pdf.tobytes(garbage=3, deflate=True, **options)
+
+
+def optimize_pdf(source, document_type=None):
+    """
+    Optimize a PDF given as an UploadBuffer, bytes or local path.
+    Returns (optimized PDF bytes, report); the report holds the byte size before and after
+    each stage, the bytes saved per stage and the pages dropped per reason.
+    """
+    import fitz  # PyMuPDF
+    original_bytes = document_size(source)
+    report = OrderedDict([('original_bytes', original_bytes), ('stages', OrderedDict())])
+
+    def record(stage, previous_bytes, content=None):
+        size = previous_bytes if content is None else len(content)
+        report['stages'][stage] = {'bytes': size, 'saved': previous_bytes - size}
+        return size
+
+    with open_pdf(source) as original:
+        report['pages_in'] = original.page_count
+        keep, dropped = select_pages(original, document_type)
+        report['pages_dropped'] = dropped
+        pdf = fitz.open()
+        for number in keep:
+            pdf.insert_pdf(original, from_page=number, to_page=number)
+    try:
+        # Serializing is a good part of the cost, so a stage that changed nothing is not serialized
+        # again; re-serializing alone saves a little, which then counts towards cleanup
+        report['pages_out'] = pdf.page_count
+        size = record('page_selection', original_bytes,
+                      _serialize(pdf) if len(keep) < report['pages_in'] else None)
+
+        report['images_downsampled'] = downsample_images(pdf, config.PDF_OPTIMIZE_TARGET_DPI,
+                                                         config.PDF_OPTIMIZE_JPEG_QUALITY)
+        size = record('image_downsampling', size, _serialize(pdf) if report['images_downsampled'] else None)
+
+        pdf.set_metadata({})
+        pdf.del_xml_metadata()
+        for name in pdf.embfile_names():
+            pdf.embfile_del(name)
+        content = pdf.tobytes(garbage=4, deflate=True, deflate_images=True, deflate_fonts=True, clean=True)
+        record('cleanup', size, content)
+    finally:
+        pdf.close()
+    report['optimized_bytes'] = len(content)
+    return content, report
+
+
+def prepare_document(source, mime_type, document_type=None):
+    """
+    The document to send to Document AI: an UploadBuffer of the optimized PDF when PDF_OPTIMIZE is
+    set and that made it smaller, otherwise source itself.
+    """
+    if not config.PDF_OPTIMIZE or mime_type != 'application/pdf':
+        return source
+    with track_stage('pdf_optimize'):
+        try:
+            content, report = optimize_pdf(source, document_type)
+        except Exception as e:
+            print(f"PDF optimization failed, sending the original: {e}")
+            return source
+
+    saved = report['original_bytes'] - report['optimized_bytes']
+    print(f"Optimized PDF: {report['original_bytes']} -> {report['optimized_bytes']} bytes, "
+          f"{report['pages_in']} -> {report['pages_out']} pages, saved per stage "
+          + ", ".join(f"{stage}={stage_report['saved']}" for stage, stage_report in report['stages'].items()))
+    if saved <= 0:
+        return source
+    for reason, pages in report['pages_dropped'].items():
+        if pages:
+            PAGES_DROPPED.inc(pages, reason=reason)
+    for stage, stage_report in report['stages'].items():
+        if stage_report['saved'] > 0:
+            BYTES_SAVED.inc(stage_report['saved'], stage=stage)
+    return UploadBuffer.from_bytes(content, filename=getattr(source, 'filename', None))
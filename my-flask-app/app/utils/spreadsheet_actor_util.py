@@ -0,0 +1,135 @@
+"""
+Per-spreadsheet serialization of paystub and W-2 populations.
+
+Paystub rows and W-2 year slots are chosen from what is already in the sheet, so two
+documents for one spreadsheet populated at the same time would pick the same row. Every
+population for a spreadsheet goes through its SpreadsheetActor instead, which runs them one
+after another against a single in-memory snapshot of the worksheet and sends the writes of
+all documents queued at that moment in one values.batchUpdate.
+
+There is no actor thread: whichever caller finds the actor idle drains the queue on its own
+thread (pygsheets clients are per thread) while the others wait for their result.
+"""
+import contextvars
+import os
+import threading
+import weakref
+from collections import deque
+from .google_sheets_util import (
+    SheetPopulator, SheetWriteBuffer, SnapshotWriteBuffer, load_snapshot, open_income_worksheet
+)
+from ..config import get_config
+
+config = get_config(os.getenv('APP_ENV', 'default'))
+
+
+class QueuedPopulation:
+    """One population waiting on a SpreadsheetActor; populate(populator) runs in the caller's context."""
+    def __init__(self, populate):
+        self.populate = populate
+        self.context = contextvars.copy_context()
+        self.done = False
+        self.result = None
+        self.error = None
+
+
+class SpreadsheetActor:
+    """
+    :param sheet_url: URL of the spreadsheet whose Income Calculation Worksheet is populated
+    :param client_secret: Sheets service account file (default: GOOGLE_SHEETS_CREDENTIALS)
+    :param max_batch: Most queued documents coalesced into one read and one write
+    """
+    def __init__(self, sheet_url, client_secret=None, max_batch=20):
+        self.sheet_url = sheet_url
+        self.client_secret = client_secret
+        self.max_batch = max_batch
+        self._queue = deque()
+        self._draining = False
+        self._condition = threading.Condition()
+
+    def enqueue(self, populate):
+        """Queue populate(populator) without waiting; pass the result to wait()."""
+        item = QueuedPopulation(populate)
+        with self._condition:
+            self._queue.append(item)
+        return item
+
+    def wait(self, item):
+        """Wait for a queued population, draining the queue if no other thread is; returns its result."""
+        while True:
+            with self._condition:
+                while not item.done and self._draining:
+                    self._condition.wait()
+                if item.done:
+                    break
+                self._draining = True
+                batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            try:
+                self._run_batch(batch)
+            finally:
+                with self._condition:
+                    self._draining = False
+                    self._condition.notify_all()
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def submit(self, populate):
+        """Run populate(populator) once every population queued before it has been written."""
+        return self.wait(self.enqueue(populate))
+
+    def _run_batch(self, batch):
+        try:
+            if config.SHEETS_SNAPSHOT_RANGE:
+                self._populate_from_snapshot(batch)
+            else:
+                for item in batch:
+                    self._run(item, SheetPopulator(self.client_secret, self.sheet_url))
+        except Exception as e:
+            # Opening, reading or writing the sheet failed, so no document of the batch was written
+            for item in batch:
+                if not item.done:
+                    item.result, item.error = None, e
+        finally:
+            for item in batch:
+                item.done = True
+
+    def _populate_from_snapshot(self, batch):
+        worksheet = open_income_worksheet(self.client_secret, self.sheet_url)
+        snapshot = load_snapshot(worksheet, config.SHEETS_SNAPSHOT_RANGE)
+        combined = SheetWriteBuffer(worksheet, snapshot)
+        for item in batch:
+            # A document's writes reach the snapshot (and so the documents after it) only when
+            # its population finished; a failed document leaves no partial writes behind
+            buffer = SnapshotWriteBuffer(snapshot)
+            if self._run(item, SheetPopulator(buffer=buffer)):
+                for cell, value in buffer.written.items():
+                    combined.set(cell, value)
+        combined.flush()
+
+    def _run(self, item, populator):
+        try:
+            item.result = item.context.run(item.populate, populator)
+            return True
+        except Exception as e:
+            item.error = e
+            item.done = True
+            return False
+
+
+_actors = weakref.WeakValueDictionary()
+_actors_lock = threading.Lock()
+
+
+def get_spreadsheet_actor(sheet_url, client_secret=None):
+    """The actor of sheet_url, shared by every thread populating that spreadsheet right now."""
+    with _actors_lock:
+        actor = _actors.get(sheet_url)
+        if actor is None:
+            actor = _actors[sheet_url] = SpreadsheetActor(sheet_url, client_secret, config.SHEETS_COALESCE_MAX_DOCUMENTS)
+        return actor
+
+
+def populate_spreadsheet(sheet_url, populate, client_secret=None):
+    """Run populate(populator) for the Income Calculation Worksheet of sheet_url through its actor."""
+    return get_spreadsheet_actor(sheet_url, client_secret).submit(populate)
@@ -0,0 +1,168 @@
+import io
+import os
+import tempfile
+from flask import Request, current_app
+from ..config import get_config
+
+config = get_config(os.getenv('APP_ENV', 'default'))
+
+
+class UploadBuffer:
+    """
+    Spooled buffer for an uploaded PDF. Bytes are kept in memory until spill_threshold is
+    exceeded, then moved to a temporary file in directory (deleted on close).
+
+    UploadRequest makes Werkzeug parse uploads straight into an UploadBuffer, and the same
+    buffer is then handed to Document AI, PyMuPDF and GCS, so small uploads never touch disk.
+    """
+    def __init__(self, spill_threshold=None, directory=None, filename=None):
+        self.spill_threshold = config.UPLOAD_SPOOL_MAX_BYTES if spill_threshold is None else spill_threshold
+        self.directory = directory
+        self.filename = filename
+        self._file = io.BytesIO()
+        self._spilled = None
+
+    @classmethod
+    def from_bytes(cls, content, filename=None, spill_threshold=None, directory=None):
+        buffer = cls(spill_threshold, directory, filename)
+        buffer.write(content)
+        buffer.seek(0)
+        return buffer
+
+    @property
+    def in_memory(self):
+        return self._spilled is None
+
+    @property
+    def path(self):
+        """Path of the spilled temporary file, or None while the upload is in memory."""
+        return self._spilled.name if self._spilled is not None else None
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def __len__(self):
+        if self.in_memory:
+            return self._file.getbuffer().nbytes
+        return os.fstat(self._file.fileno()).st_size
+
+    def __repr__(self):
+        where = 'memory' if self.in_memory else self.path
+        return f"<UploadBuffer {self.filename or ''} ({len(self) if not self.closed else 0} bytes, {where})>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # File-like interface used by Werkzeug's form parser and blob.upload_from_file
+    def write(self, data):
+        written = self._file.write(data)
+        if self.in_memory and self._file.tell() > self.spill_threshold:
+            self._spill()
+        return written
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        self._file.flush()
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        self._file.close()
+
+    def _spill(self):
+        spilled = tempfile.NamedTemporaryFile(dir=self.directory, suffix='.pdf')
+        spilled.write(self._file.getbuffer())
+        spilled.seek(self._file.tell())
+        self._file.close()
+        self._spilled = spilled
+        self._file = spilled
+
+    def getvalue(self):
+        """
+        The upload as bytes. For in-memory uploads this is BytesIO's own buffer, shared
+        rather than copied; spilled uploads are read from their temporary file.
+        """
+        if self.in_memory:
+            return self._file.getvalue()
+        self._file.flush()
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+    def open_pdf(self):
+        """Open the upload with PyMuPDF without copying it."""
+        import fitz  # PyMuPDF
+        if self.in_memory:
+            return fitz.open(stream=self._file.getvalue(), filetype='pdf')
+        self._file.flush()
+        return fitz.open(self.path)
+
+
+class UploadRequest(Request):
+    """Flask request class that parses uploaded files into UploadBuffers."""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadBuffer(
+            spill_threshold=current_app.config['UPLOAD_SPOOL_MAX_BYTES'],
+            directory=current_app.config.get('UPLOAD_FOLDER') or None,
+            filename=filename,
+        )
+
+
+def take_upload(file):
+    """
+    Take ownership of an uploaded file's buffer, e.g. to process it after the request ends.
+    The FileStorage is left with an empty stream so request teardown does not close the buffer;
+    the caller must close it.
+    """
+    buffer = file.stream
+    if not isinstance(buffer, UploadBuffer):
+        buffer = UploadBuffer(directory=current_app.config.get('UPLOAD_FOLDER') or None)
+        file.save(buffer)
+        buffer.seek(0)
+    buffer.filename = file.filename
+    file.stream = io.BytesIO()
+    return buffer
+
+
+def read_document(source):
+    """Bytes of a document given as an UploadBuffer, bytes or a local path."""
+    if isinstance(source, UploadBuffer):
+        return source.getvalue()
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    with open(source, 'rb') as file:
+        return file.read()
+
+
+def open_pdf(source):
+    """Open a PDF given as an UploadBuffer, bytes or a local path with PyMuPDF."""
+    import fitz  # PyMuPDF
+    if isinstance(source, UploadBuffer):
+        return source.open_pdf()
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype='pdf')
+    return fitz.open(source)
+
+
+def document_size(source):
+    if isinstance(source, (UploadBuffer, bytes, bytearray)):
+        return len(source)
+    return os.path.getsize(source)
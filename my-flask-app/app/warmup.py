@@ -0,0 +1,47 @@
+import importlib
+import threading
+import time
+from collections import OrderedDict
+
+# Imported lazily by the pipeline; warm_up() loads them before the first request needs them
+SDK_MODULES = (
+    'google.cloud.documentai_v1',
+    'google.cloud.storage',
+    'google.oauth2.service_account',
+    'firebase_admin.firestore',
+    'pygsheets',
+    'fitz',
+)
+
+
+def warm_up(modules=SDK_MODULES):
+    """
+    Import the heavy SDKs and return the seconds spent per module.
+    Creates no clients, threads or sockets, so it is safe before fork (gunicorn --preload).
+    """
+    timings = OrderedDict()
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Warm-up could not import {name}: {e}")
+        timings[name] = time.perf_counter() - start
+    print(f"Warm-up imported {len(timings)} modules in {sum(timings.values()):.2f}s")
+    return timings
+
+
+def start_warm_up(mode):
+    """Run warm_up() according to the WARM_UP setting ('background', 'eager' or 'off')."""
+    if mode == 'eager':
+        warm_up()
+    elif mode == 'background':
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+
+def start_background_services(lro_manager_enabled=True):
+    """Start the per-process background threads; must run in the process that serves requests."""
+    if lro_manager_enabled:
+        # Pick up Document AI batch operations a previous process was still waiting on
+        from .utils.lro_util import get_operation_manager
+        get_operation_manager().resume()
@@ -0,0 +1,14 @@
+from app.asgi import create_asgi_app
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+print("Creating ASGI app...")
+app_env = os.environ.get('APP_ENV', 'production')
+application = create_asgi_app(app_env)
+print(f"ASGI app created with environment: {app_env}")
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(application, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
@@ -0,0 +1,393 @@
+"""
+Local stand-ins for the Google backends the pipeline talks to, with injected latency and errors.
+
+Each fake is registered in app.utils.clients_util, so the application code runs unchanged.
+Document AI replays Document JSON (as written by Document.to_json) per processor id, from
+benchmarks/fixtures or from a directory of recorded responses.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from types import SimpleNamespace
+from google.api_core import exceptions
+from google.cloud import documentai_v1 as documentai
+from app.utils import clients_util
+from app.utils.google_sheets_util import cell_position
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class Latency:
+    """
+    Delay of one simulated API call: uniformly mean +/- jitter seconds, multiplied by scale.
+    With probability error_rate the call fails with ServiceUnavailable after the delay.
+    """
+    def __init__(self, mean=0.0, jitter=0.0, error_rate=0.0, scale=1.0):
+        self.mean = mean
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.scale = scale
+
+    def delay(self, rng):
+        return max(0.0, self.mean + rng.uniform(-self.jitter, self.jitter)) * self.scale
+
+    def check(self, rng, name):
+        if self.error_rate and rng.random() < self.error_rate:
+            raise exceptions.ServiceUnavailable(f"Injected failure in {name}")
+
+    def apply(self, rng, name):
+        delay = self.delay(rng)
+        if delay:
+            time.sleep(delay)
+        self.check(rng, name)
+
+    async def apply_async(self, rng, name):
+        delay = self.delay(rng)
+        if delay:
+            await asyncio.sleep(delay)
+        self.check(rng, name)
+
+
+class CallCounter:
+    """Thread-safe count of simulated API calls, keyed like 'sheets.update_values_batch'."""
+    def __init__(self):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+
+class FakeBackend:
+    def __init__(self, service, latency, calls, seed=None):
+        self.service = service
+        self.latency = latency or Latency()
+        self.calls = calls
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def _call_rng(self, method):
+        self.calls.add(f"{self.service}.{method}")
+        with self._rng_lock:
+            # Draw from the shared generator under a lock, then sleep without holding it
+            return random.Random(self._rng.random())
+
+    def call(self, method, latency=None):
+        rng = self._call_rng(method)
+        (latency or self.latency).apply(rng, f"{self.service}.{method}")
+
+    async def call_async(self, method, latency=None):
+        """call() for the asyncio fakes: sleeps without blocking the event loop."""
+        rng = self._call_rng(method)
+        await (latency or self.latency).apply_async(rng, f"{self.service}.{method}")
+
+
+# Document AI
+
+def load_documents(directory=FIXTURES_DIR):
+    """{name: Document} for every <name>.json in directory."""
+    documents = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith('.json'):
+            with open(os.path.join(directory, filename)) as f:
+                documents[filename[:-5]] = documentai.Document.from_json(f.read(), ignore_unknown_fields=True)
+    return documents
+
+
+class FakeOperation:
+    """Blocking batch operation: result() waits out the batch latency."""
+    def __init__(self, backend, name, output_gcs_destination):
+        self._backend = backend
+        # Mirrors api_core Operation.operation, the raw google.longrunning Operation
+        self.operation = SimpleNamespace(name=name, done=False)
+        self.metadata = documentai.BatchProcessMetadata(
+            state=documentai.BatchProcessMetadata.State.SUCCEEDED,
+            individual_process_statuses=[documentai.BatchProcessMetadata.IndividualProcessStatus(
+                output_gcs_destination=output_gcs_destination)],
+        )
+
+    def result(self, timeout=None):
+        if not self.operation.done:
+            # The real client polls GetOperation until the batch job is done
+            self._backend.call('get_operation', self._backend.batch_latency)
+            self.operation.done = True
+        return documentai.BatchProcessResponse()
+
+    def done(self):
+        return self.operation.done
+
+    def exception(self):
+        return None
+
+
+class FakeDocumentAI(FakeBackend):
+    """
+    Stand-in for DocumentProcessorServiceClient.
+
+    :param documents: {processor_id: Document} returned by process_document and written to the
+                      output bucket by batch_process_documents
+    :param storage: FakeStorage the batch output is written to
+    """
+    def __init__(self, documents, storage, latency=None, batch_latency=None, calls=None, seed=None):
+        super().__init__('documentai', latency, calls or CallCounter(), seed)
+        self.documents = documents
+        self.storage = storage
+        self.batch_latency = batch_latency or Latency()
+
+    @staticmethod
+    def processor_path(project, location, processor):
+        return f"projects/{project}/locations/{location}/processors/{processor}"
+
+    def _document_for(self, name):
+        processor_id = name.rsplit('/', 1)[-1]
+        if processor_id not in self.documents:
+            raise exceptions.NotFound(f"No recorded response for processor {processor_id}")
+        return self.documents[processor_id]
+
+    def process_document(self, request=None):
+        self.call('process_document')
+        return documentai.ProcessResponse(document=self._document_for(request.name))
+
+    def batch_process_documents(self, request=None):
+        self.call('batch_process_documents')
+        document = self._document_for(request.name)
+        operation_id = uuid.uuid4().hex
+        output_uri = f"{request.document_output_config.gcs_output_config.gcs_uri.rstrip('/')}/{operation_id}/0/"
+        bucket_name, prefix = output_uri[len('gs://'):].split('/', 1)
+        self.storage.put(bucket_name, prefix + 'output-document.json',
+                         documentai.Document.to_json(document).encode('utf-8'))
+        return FakeOperation(self, f"projects/bench/locations/us/operations/{operation_id}", output_uri)
+
+
+class FakeDocumentAIAsync(FakeDocumentAI):
+    """Stand-in for DocumentProcessorServiceAsyncClient (online processing only)."""
+    async def process_document(self, request=None):
+        await self.call_async('process_document')
+        return documentai.ProcessResponse(document=self._document_for(request.name))
+
+
+# Cloud Storage
+
+class FakeBlob:
+    def __init__(self, storage, bucket_name, name):
+        self.storage = storage
+        self.bucket_name = bucket_name
+        self.name = name
+        self.size = None
+
+    def reload(self):
+        self.storage.call('reload')
+        self.size = len(self.storage.get(self.bucket_name, self.name))
+
+    def upload_from_filename(self, filename, content_type=None):
+        with open(filename, 'rb') as f:
+            self.upload_from_string(f.read(), content_type)
+
+    def upload_from_file(self, file_obj, rewind=False, size=None, content_type=None):
+        if rewind:
+            file_obj.seek(0)
+        self.upload_from_string(file_obj.read() if size is None else file_obj.read(size), content_type)
+
+    def upload_from_string(self, data, content_type=None):
+        self.storage.call('upload')
+        self.storage.put(self.bucket_name, self.name, data if isinstance(data, bytes) else data.encode('utf-8'))
+
+    def download_as_bytes(self):
+        self.storage.call('download')
+        return self.storage.get(self.bucket_name, self.name)
+
+    def download_to_filename(self, filename):
+        data = self.download_as_bytes()
+        with open(filename, 'wb') as f:
+            f.write(data)
+
+    def exists(self):
+        self.storage.call('exists')
+        return self.storage.get(self.bucket_name, self.name, missing_ok=True) is not None
+
+
+class FakeBucket:
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+
+    def blob(self, name):
+        return FakeBlob(self.storage, self.name, name)
+
+
+class FakeStorage(FakeBackend):
+    """Stand-in for storage.Client holding objects in memory."""
+    def __init__(self, latency=None, calls=None, seed=None):
+        super().__init__('gcs', latency, calls or CallCounter(), seed)
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, name):
+        return FakeBucket(self, name)
+
+    def put(self, bucket_name, name, data):
+        with self._lock:
+            self.objects[(bucket_name, name)] = data
+
+    def get(self, bucket_name, name, missing_ok=False):
+        with self._lock:
+            data = self.objects.get((bucket_name, name))
+        if data is None and not missing_ok:
+            raise exceptions.NotFound(f"gs://{bucket_name}/{name}")
+        return data
+
+
+# Firestore
+
+class FakeDocumentReference:
+    def __init__(self, firestore, collection_name):
+        self.firestore = firestore
+        self.collection_name = collection_name
+        self.id = uuid.uuid4().hex
+
+    def set(self, document):
+        self.firestore.call('set')
+        self.firestore.store(self.collection_name, self.id, document)
+
+
+class FakeCollection:
+    def __init__(self, firestore, name):
+        self.firestore = firestore
+        self.name = name
+
+    def document(self):
+        return FakeDocumentReference(self.firestore, self.name)
+
+
+class FakeWriteBatch:
+    def __init__(self, firestore):
+        self.firestore = firestore
+        self.writes = []
+
+    def set(self, doc_ref, document):
+        self.writes.append((doc_ref, document))
+
+    def commit(self):
+        self.firestore.call('batch_commit')
+        for doc_ref, document in self.writes:
+            self.firestore.store(doc_ref.collection_name, doc_ref.id, document)
+
+
+class FakeFirestore(FakeBackend):
+    """Stand-in for the firebase_admin Firestore client."""
+    def __init__(self, latency=None, calls=None, seed=None):
+        super().__init__('firestore', latency, calls or CallCounter(), seed)
+        self.collections = {}
+        self._lock = threading.Lock()
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def store(self, collection_name, document_id, document):
+        with self._lock:
+            self.collections.setdefault(collection_name, {})[document_id] = document
+
+
+# Google Sheets (pygsheets)
+
+class FakeWorksheet:
+    def __init__(self, sheets, title):
+        self.sheets = sheets
+        self.title = title
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def get_value(self, addr):
+        self.sheets.call('get_value')
+        with self._lock:
+            return self.values.get(addr.upper(), '')
+
+    def get_values_batch(self, ranges):
+        self.sheets.call('get_values_batch')
+        results = []
+        with self._lock:
+            values = {cell_position(addr): value for addr, value in self.values.items()}
+            for cell_range in ranges:
+                (top, left), (bottom, right) = (cell_position(cell) for cell in cell_range.upper().split(':'))
+                results.append([[values.get((row, column), '') for column in range(left, right + 1)]
+                                for row in range(top, bottom + 1)])
+        return results
+
+    def update_value(self, addr, val):
+        self.sheets.call('update_value')
+        with self._lock:
+            self.values[addr.upper()] = str(val)
+
+    def update_values_batch(self, ranges, values):
+        self.sheets.call('update_values_batch')
+        with self._lock:
+            for addr, value in zip(ranges, values):
+                self.values[addr.upper()] = str(value[0][0])
+
+
+class FakeSpreadsheet:
+    def __init__(self, sheets):
+        self.sheets = sheets
+        self.worksheets = {}
+        self._lock = threading.Lock()
+
+    def worksheet(self, property='title', value=None):
+        with self._lock:
+            if value not in self.worksheets:
+                self.worksheets[value] = FakeWorksheet(self.sheets, value)
+            return self.worksheets[value]
+
+
+class FakeSheets(FakeBackend):
+    """Stand-in for a pygsheets client; every spreadsheet URL gets its own empty spreadsheet."""
+    def __init__(self, latency=None, calls=None, seed=None):
+        super().__init__('sheets', latency, calls or CallCounter(), seed)
+        self.spreadsheets = {}
+        self._lock = threading.Lock()
+
+    def open_by_url(self, url):
+        self.call('open_by_url')
+        with self._lock:
+            if url not in self.spreadsheets:
+                self.spreadsheets[url] = FakeSpreadsheet(self)
+            return self.spreadsheets[url]
+
+
+class FakeBackends:
+    """All fakes sharing one CallCounter, registered with install() and removed with uninstall()."""
+    def __init__(self, documents, location='us', docai=None, batch=None, gcs=None,
+                 firestore=None, sheets=None, seed=None):
+        self.location = location
+        self.calls = CallCounter()
+        self.storage = FakeStorage(gcs, self.calls, seed)
+        self.documentai = FakeDocumentAI(documents, self.storage, docai, batch, self.calls, seed)
+        self.firestore = FakeFirestore(firestore, self.calls, seed)
+        self.sheets = FakeSheets(sheets, self.calls, seed)
+        self.documentai_async = FakeDocumentAIAsync(documents, self.storage, docai, batch, self.calls, seed)
+
+    def install(self):
+        clients_util.set_client(('documentai', self.location), self.documentai)
+        clients_util.set_client('storage', self.storage)
+        clients_util.set_client('firestore', self.firestore)
+        clients_util.set_client('sheets', self.sheets)
+        clients_util.set_client(('documentai_async', self.location), self.documentai_async)
+        return self
+
+    def uninstall(self):
+        clients_util.clear_clients()
@@ -0,0 +1,251 @@
+"""
+Offline pipeline benchmark: runs the paystub, W-2 and 1040 flows against the fakes in
+benchmarks/fakes.py and reports per-stage and end-to-end p50/p95/p99 plus API-call counts.
+
+Run from my-flask-app:
+
+    python -m benchmarks.pipeline [--scenario w2 --scenario 1040-batch] [--iterations 20]
+        [--concurrency 4] [--time-scale 0.1] [--error-rate 0.01] [--no-rate-limits] [--json results.json]
+
+Latencies default to rough production figures; --time-scale shrinks them (0 disables sleeping)
+so a run finishes quickly while keeping their proportions.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# create_app is not used, but the Sheets populators read this variable
+for _env_var in ['GOOGLE_APPLICATION_CREDENTIALS', 'GOOGLE_STORAGE_CREDENTIALS',
+                 'GOOGLE_SHEETS_CREDENTIALS', 'GOOGLE_FIRESTORE_CREDENTIALS']:
+    os.environ.setdefault(_env_var, 'benchmark-credentials.json')
+
+from app.config import get_config
+from app.utils.jobs_util import Job, job_context
+from app.utils.outbound_util import reset_outbound_scheduler
+from app.utils.upload_buffer_util import UploadBuffer
+from .fakes import FakeBackends, Latency, load_documents, FIXTURES_DIR
+
+DEFAULT_PDF = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'tests', 'test.pdf')
+
+# Settings applied to the shared app config for every run
+BENCHMARK_CONFIG = {
+    'PROJECT_ID': 'bench-project',
+    'LOCATION': 'us',
+    'PAYSTUB_PROCESSOR_ID': 'paystub',
+    'W2_PROCESSOR_ID': 'w2',
+    'SPLITTER_PROCESSOR_ID': 'splitter',
+    'INPUT_BUCKET': 'bench-input',
+    'OUTPUT_BUCKET': 'bench-output',
+    'INPUT_URI': 'gs://bench-input/',
+    'OUTPUT_URI': 'gs://bench-output/',
+    # Every iteration should pay for Document AI, not hit the cache
+    'DOCAI_CACHE_BACKEND': 'none',
+    # Batch splits wait on the operation in the request rather than through the poller
+    'LRO_MANAGER_ENABLED': False,
+}
+
+
+class Scenario:
+    def __init__(self, name, document_type, config=None):
+        self.name = name
+        self.document_type = document_type
+        self.config = config or {}
+
+
+SCENARIOS = OrderedDict((scenario.name, scenario) for scenario in [
+    Scenario('paystub', 'paystub'),
+    Scenario('w2', 'w2'),
+    Scenario('1040-online', '1040', {'SPLIT_MODE': 'online'}),
+    Scenario('1040-batch', '1040', {'SPLIT_MODE': 'batch'}),
+])
+
+
+def sample_pdf(document_type):
+    """A one-page PDF; the fakes answer from fixtures, so only its size matters."""
+    import fitz  # PyMuPDF
+    with fitz.open() as pdf:
+        page = pdf.new_page()
+        page.insert_text((72, 72), f"Benchmark {document_type} {uuid.uuid4().hex}")
+        return pdf.tobytes()
+
+
+def percentile(values, fraction):
+    """Linearly interpolated percentile of a non-empty list."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50': round(percentile(values, 0.50), 4),
+        'p95': round(percentile(values, 0.95), 4),
+        'p99': round(percentile(values, 0.99), 4),
+    }
+
+
+def run_once(scenario, pdf_bytes, pdf_name):
+    """Run one document through the pipeline; returns (stage seconds, end-to-end seconds, error)."""
+    from app.services.document_processing_w2_paystub import process_document_w2_paystub
+    from app.services.document_processing_fannie_mae import process_document_fannie_mae
+
+    job = Job(document_type=scenario.document_type, filename=pdf_name)
+    spreadsheet_id = uuid.uuid4().hex
+    error = None
+    start = time.perf_counter()
+    with job_context(job), UploadBuffer.from_bytes(pdf_bytes, filename=pdf_name) as upload:
+        try:
+            if scenario.document_type == '1040':
+                process_document_fannie_mae(upload, '1040', pdf_name, spreadsheet_id)
+            else:
+                process_document_w2_paystub(upload, 'application/pdf', scenario.document_type, spreadsheet_id)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    return dict(job.stages), time.perf_counter() - start, error
+
+
+def run_scenario(scenario, backends, iterations, concurrency, pdf_path):
+    config = get_config(os.getenv('APP_ENV', 'default'))
+    previous = {key: getattr(config, key) for key in scenario.config}
+    for key, value in scenario.config.items():
+        setattr(config, key, value)
+
+    if scenario.document_type == '1040':
+        with open(pdf_path, 'rb') as f:
+            inputs = [(f.read(), os.path.basename(pdf_path))] * iterations
+    else:
+        inputs = [(sample_pdf(scenario.document_type), f"{scenario.document_type}_{i}.pdf") for i in range(iterations)]
+
+    backends.calls.reset()
+    start = time.perf_counter()
+    try:
+        # The pipeline logs with print(); keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=concurrency) as executor:
+            runs = list(executor.map(lambda item: run_once(scenario, *item), inputs))
+            wait_for_background_work()
+    finally:
+        for key, value in previous.items():
+            setattr(config, key, value)
+    wall_seconds = time.perf_counter() - start
+
+    stages = OrderedDict()
+    for stage_seconds, _, _ in runs:
+        for stage, seconds in stage_seconds.items():
+            stages.setdefault(stage, []).append(seconds)
+    errors = [error for _, _, error in runs if error]
+    return {
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'throughput_per_second': round(iterations / wall_seconds, 3) if wall_seconds else None,
+        'end_to_end': summarize([seconds for _, seconds, _ in runs]),
+        'stages': {stage: summarize(values) for stage, values in stages.items()},
+        'api_calls': backends.calls.snapshot(),
+        'api_calls_per_document': {name: round(count / iterations, 2)
+                                   for name, count in backends.calls.snapshot().items()},
+    }
+
+
+def wait_for_background_work():
+    """Let queued Firestore writes and split-PDF archival finish so their API calls are counted."""
+    from app.models.fannie_mae_operations.splitter import wait_for_archives
+    from app.utils import firestore_util
+    wait_for_archives(timeout=60)
+    if firestore_util.firestore_writer_stats() is not None:
+        firestore_util.get_firestore_writer().flush(timeout=60)
+
+
+def build_backends(args):
+    scale = args.time_scale
+
+    def latency(mean, jitter):
+        return Latency(mean, jitter, args.error_rate, scale)
+
+    documents = load_documents(args.recordings or FIXTURES_DIR)
+    return FakeBackends(
+        documents,
+        location=BENCHMARK_CONFIG['LOCATION'],
+        docai=latency(args.docai_latency, args.docai_latency / 4),
+        batch=latency(args.batch_latency, args.batch_latency / 4),
+        gcs=latency(args.gcs_latency, args.gcs_latency / 2),
+        firestore=latency(args.firestore_latency, args.firestore_latency / 2),
+        sheets=latency(args.sheets_latency, args.sheets_latency / 2),
+        seed=args.seed,
+    )
+
+
+def print_report(name, result):
+    print(f"\n{name}: {result['iterations']} documents, concurrency {result['concurrency']}, "
+          f"{result['errors']} errors, {result['throughput_per_second']} documents/s")
+    if result['first_error']:
+        print(f"  first error: {result['first_error']}")
+    print(f"  {'stage':24} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    rows = list(result['stages'].items()) + [('end_to_end', result['end_to_end'])]
+    for stage, summary in rows:
+        print(f"  {stage:24} {summary['p50'] * 1000:10.1f} {summary['p95'] * 1000:10.1f} {summary['p99'] * 1000:10.1f}")
+    print("  API calls per document: " + ", ".join(
+        f"{name}={count}" for name, count in sorted(result['api_calls_per_document'].items())))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), help='default: all scenarios')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--pdf', default=DEFAULT_PDF, help='1040 package used by the 1040 scenarios')
+    parser.add_argument('--recordings', help='directory of recorded Document JSON named <processor id>.json')
+    parser.add_argument('--time-scale', type=float, default=0.1)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probability that any API call fails')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--docai-latency', type=float, default=2.0)
+    parser.add_argument('--batch-latency', type=float, default=30.0)
+    parser.add_argument('--gcs-latency', type=float, default=0.08)
+    parser.add_argument('--firestore-latency', type=float, default=0.05)
+    parser.add_argument('--sheets-latency', type=float, default=0.3)
+    parser.add_argument('--no-rate-limits', action='store_true',
+                        help='disable OUTBOUND_RATE_LIMITS to measure the pipeline without quota throttling')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    config = get_config(os.getenv('APP_ENV', 'default'))
+    settings = dict(BENCHMARK_CONFIG,
+                    # Retry backoff shrinks with the simulated latencies
+                    OUTBOUND_INITIAL_BACKOFF=config.OUTBOUND_INITIAL_BACKOFF * args.time_scale,
+                    OUTBOUND_MAX_BACKOFF=config.OUTBOUND_MAX_BACKOFF * args.time_scale)
+    if args.no_rate_limits:
+        settings['OUTBOUND_RATE_LIMITS'] = {}
+    previous = {key: getattr(config, key) for key in settings}
+    for key, value in settings.items():
+        setattr(config, key, value)
+    reset_outbound_scheduler()
+
+    backends = build_backends(args).install()
+    results = OrderedDict()
+    try:
+        for name in args.scenario or list(SCENARIOS):
+            results[name] = run_scenario(SCENARIOS[name], backends, args.iterations, args.concurrency, args.pdf)
+            print_report(name, results[name])
+    finally:
+        backends.uninstall()
+        for key, value in previous.items():
+            setattr(config, key, value)
+        reset_outbound_scheduler()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=4)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Cold-start benchmark: import time per module and time until /api/health first answers.
+
+Every measurement runs in a fresh interpreter, so results reflect a scale-from-zero start.
+Run from my-flask-app:
+
+    python -m benchmarks.startup [--runs 5] [--json startup.json]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+MODULES = (
+    'app',
+    'app.api.document_routes',
+    'app.utils.google_sheets_util',
+    'app.models.fannie_mae_1040_extraction',
+    'google.cloud.documentai_v1',
+    'google.cloud.documentai_toolbox',
+    'google.cloud.storage',
+    'firebase_admin.firestore',
+    'pygsheets',
+    'fitz',
+)
+
+# create_app refuses to start without these; the benchmark never calls Google APIs
+CREDENTIAL_VARS = ('GOOGLE_APPLICATION_CREDENTIALS', 'GOOGLE_STORAGE_CREDENTIALS',
+                   'GOOGLE_SHEETS_CREDENTIALS', 'GOOGLE_FIRESTORE_CREDENTIALS')
+
+
+def benchmark_env():
+    env = dict(os.environ)
+    for name in CREDENTIAL_VARS:
+        env.setdefault(name, 'benchmark-credentials.json')
+    env.setdefault('LRO_MANAGER_ENABLED', 'false')
+    return env
+
+
+def import_seconds(module, env):
+    """Cumulative import time of module in a fresh interpreter, from -X importtime."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    for line in reversed(result.stderr.splitlines()):
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e6
+    return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def time_to_healthy(env, timeout=60):
+    """Seconds from spawning a server process until GET /api/health returns 200."""
+    port = free_port()
+    url = f'http://127.0.0.1:{port}/api/health'
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.startup', '--serve', str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f'{url} did not become healthy within {timeout}s')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def serve(port):
+    from werkzeug.serving import make_server
+    from app import create_app
+    make_server('127.0.0.1', port, create_app(os.getenv('APP_ENV', 'production'))).serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes per measurement (median is reported)')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    env = benchmark_env()
+    results = {'python': sys.version.split()[0], 'runs': args.runs, 'import_seconds': {}}
+    for module in MODULES:
+        samples = [import_seconds(module, env) for _ in range(args.runs)]
+        samples = [sample for sample in samples if sample is not None]
+        results['import_seconds'][module] = round(statistics.median(samples), 4) if samples else None
+        print(f"{module:45} {results['import_seconds'][module]}s")
+
+    for warm_up in ('off', 'background'):
+        samples = [time_to_healthy(dict(env, WARM_UP=warm_up)) for _ in range(args.runs)]
+        results[f'time_to_healthy_seconds_warm_up_{warm_up}'] = round(statistics.median(samples), 4)
+        print(f"time to healthy /api/health (WARM_UP={warm_up}): {statistics.median(samples):.3f}s")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
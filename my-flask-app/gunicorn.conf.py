@@ -0,0 +1,18 @@
+import os
+
+# Picked up automatically by gunicorn from the working directory; command-line flags still apply.
+# GUNICORN_PRELOAD=true loads the app (and, with WARM_UP=eager, the Google SDKs) once in the
+# master so every worker forks with the imports already done.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'false').lower() in ['true', '1', 't']
+
+if preload_app:
+    # create_app runs in the master; background threads would not survive the fork
+    os.environ.setdefault('START_BACKGROUND_SERVICES', 'false')
+    os.environ.setdefault('WARM_UP', 'eager')
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app.config import get_config
+        from app.warmup import start_background_services
+        start_background_services(get_config(os.getenv('APP_ENV', 'default')).LRO_MANAGER_ENABLED)
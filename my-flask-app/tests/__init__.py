@@ -0,0 +1,6 @@
+import os
+
+# The app reads these at import time; the clients are replaced by fakes or mocks in the tests
+for _env_var in ['GOOGLE_APPLICATION_CREDENTIALS', 'GOOGLE_STORAGE_CREDENTIALS',
+                 'GOOGLE_SHEETS_CREDENTIALS', 'GOOGLE_FIRESTORE_CREDENTIALS']:
+    os.environ.setdefault(_env_var, 'test-credentials.json')
@@ -0,0 +1,156 @@
+import asyncio
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+import uuid
+from unittest import mock
+
+from werkzeug.test import EnvironBuilder
+from app.asgi import create_asgi_app
+from app.config import get_config
+from app.utils.google_sheets_util import INCOME_WORKSHEET_TITLE
+from app.utils.outbound_util import reset_outbound_scheduler
+from benchmarks.fakes import FakeBackends, Latency, load_documents
+
+with open('tests/test.pdf', 'rb') as _f:
+    PDF_BYTES = _f.read()
+
+TEST_CONFIG = {
+    'PROJECT_ID': 'test-project',
+    'LOCATION': 'us',
+    'W2_PROCESSOR_ID': 'w2',
+    'DOCAI_CACHE_BACKEND': 'none',
+    'FIRESTORE_ASYNC_WRITES': False,
+    # The fakes have no quotas to protect
+    'OUTBOUND_RATE_LIMITS': {},
+    # test.pdf stands in for a W-2 but is a 30-page 1040; neither optimize nor shard it
+    'PDF_OPTIMIZE': False,
+    'DOCAI_ONLINE_MAX_PAGES': 30,
+}
+
+
+def sheet_cells(backends, spreadsheet_id):
+    """Cells written to the Income Calculation Worksheet of a fake spreadsheet."""
+    url = f'https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit?usp=sharing'
+    return backends.sheets.spreadsheets[url].worksheet(value=INCOME_WORKSHEET_TITLE).values
+
+
+def multipart(data):
+    environ = EnvironBuilder(method='POST', data=data).get_environ()
+    return environ['wsgi.input'].read(), environ['CONTENT_TYPE']
+
+
+async def call(app, method, path, body=b'', content_type=None, query_string=b'', chunk_size=4096):
+    """Drive the ASGI app like a server would, delivering the body in chunks; returns (status, headers, body)."""
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b'']
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    headers = [(b'content-type', content_type.encode())] if content_type else []
+    scope = {'type': 'http', 'method': method, 'path': path, 'root_path': '', 'query_string': query_string,
+             'headers': headers, 'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80)}
+    await app(scope, receive, send)
+    start = sent[0]
+    return start['status'], dict(start['headers']), b''.join(m['body'] for m in sent[1:])
+
+
+class TestAsgiApp(unittest.TestCase):
+    def setUp(self):
+        self.config = get_config(os.getenv('APP_ENV', 'default'))
+        patcher = mock.patch.multiple(self.config, **TEST_CONFIG)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        reset_outbound_scheduler()
+        self.addCleanup(reset_outbound_scheduler)
+        self.backends = FakeBackends(load_documents(), location='us',
+                                     docai=Latency(0.2), sheets=Latency(0.01)).install()
+        self.addCleanup(self.backends.uninstall)
+        self.app = create_asgi_app('testing')
+        self.app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+
+    def post_w2(self, spreadsheet_id, **extra):
+        return call(self.app, 'POST', '/api/process', *multipart({
+            'document_type': 'w2', 'spreadsheetId': spreadsheet_id,
+            'file': (io.BytesIO(PDF_BYTES), 'w2.pdf'), **extra}))
+
+    def test_processes_w2_on_the_event_loop(self):
+        status, headers, body = asyncio.run(self.post_w2('sheet-1'))
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {'message': 'Document processed successfully'})
+        self.assertIn('E19', sheet_cells(self.backends, 'sheet-1'))
+        calls = self.backends.calls.snapshot()
+        self.assertEqual(calls['documentai.process_document'], 1)
+        self.assertEqual(calls['sheets.get_values_batch'], 1)
+        self.assertEqual(calls['sheets.update_values_batch'], 1)
+
+    def test_second_w2_uses_next_year_slot(self):
+        async def two_documents():
+            return await asyncio.gather(self.post_w2('sheet-2'), self.post_w2('sheet-2'))
+
+        results = asyncio.run(two_documents())
+
+        self.assertEqual([status for status, _, _ in results], [200, 200])
+        cells = sheet_cells(self.backends, 'sheet-2')
+        self.assertIn('E19', cells)
+        self.assertIn('E20', cells)
+
+    def test_shares_the_spreadsheet_actor_with_the_sync_pipeline(self):
+        from app.services.document_processing_w2_paystub import process_document_w2_paystub
+
+        async def both_paths():
+            sync = asyncio.to_thread(process_document_w2_paystub, PDF_BYTES, 'application/pdf', 'w2', 'sheet-3')
+            return await asyncio.gather(self.post_w2('sheet-3'), sync)
+
+        for snapshot_range in ('C10:I90', ''):
+            with self.subTest(snapshot_range=snapshot_range), \
+                    mock.patch.object(self.config, 'SHEETS_SNAPSHOT_RANGE', snapshot_range):
+                self.backends.sheets.spreadsheets.clear()
+                (status, _, _), _ = asyncio.run(both_paths())
+                self.assertEqual(status, 200)
+                cells = sheet_cells(self.backends, 'sheet-3')
+                self.assertIn('E19', cells)
+                self.assertIn('E20', cells)
+
+    def test_documents_wait_on_document_ai_concurrently(self):
+        async def many_documents():
+            return await asyncio.gather(*(self.post_w2(uuid.uuid4().hex) for _ in range(100)))
+
+        start = time.perf_counter()
+        results = asyncio.run(many_documents())
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual({status for status, _, _ in results}, {200})
+        # 100 documents one after another would spend 20s in Document AI alone
+        self.assertLess(elapsed, 5)
+
+    def test_validation_matches_flask_route(self):
+        body, content_type = multipart({'document_type': 'bogus', 'file': (io.BytesIO(PDF_BYTES), 'w2.pdf')})
+        status, _, response = asyncio.run(call(self.app, 'POST', '/api/process', body, content_type))
+        self.assertEqual(status, 400)
+        self.assertEqual(json.loads(response), {'error': 'Invalid document type'})
+
+        body, content_type = multipart({'document_type': 'w2'})
+        status, _, response = asyncio.run(call(self.app, 'POST', '/api/process', body, content_type))
+        self.assertEqual(status, 400)
+        self.assertEqual(json.loads(response), {'error': 'No file part'})
+
+    def test_other_routes_are_served_by_flask(self):
+        status, headers, body = asyncio.run(call(self.app, 'GET', '/api/health'))
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {'status': 'healthy'})
+
+
+if __name__ == '__main__':
+    unittest.main()
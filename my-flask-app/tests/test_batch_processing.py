@@ -0,0 +1,121 @@
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import Future, ThreadPoolExecutor
+from unittest import mock
+
+from app import create_app
+from app.services import document_processing_batch
+from app.services.document_processing_batch import process_documents_batch
+from app.utils.jobs_util import track_stage
+
+
+class TestProcessDocumentsBatch(unittest.TestCase):
+    def setUp(self):
+        worksheet = mock.Mock()
+        worksheet.get_values_batch.return_value = [[]]
+        patcher = mock.patch('app.utils.spreadsheet_actor_util.open_income_worksheet', return_value=worksheet)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_extracts_concurrently_and_writes_in_upload_order(self):
+        uploads = [('a.pdf', 'paystub', 'a.pdf'), ('b.pdf', 'w2', 'b.pdf'), ('c.pdf', 'paystub', 'c.pdf')]
+        # Later uploads finish extracting first; writes must still follow upload order
+        delays = {'a.pdf': 0.3, 'b.pdf': 0.2, 'c.pdf': 0.1}
+        running = []
+        peak = []
+        lock = threading.Lock()
+        writes = []
+
+        def extract(file_path, mime_type, document_type):
+            with lock:
+                running.append(file_path)
+                peak.append(len(running))
+            with track_stage('document_ai'):
+                time.sleep(delays[file_path])
+            with lock:
+                running.remove(file_path)
+            return file_path
+
+        def population(document_type, data):
+            return lambda populator: writes.append((document_type, data))
+
+        start = time.perf_counter()
+        with mock.patch.object(document_processing_batch, 'extract_document_w2_paystub', extract), \
+                mock.patch.object(document_processing_batch, 'document_population', population):
+            results = process_documents_batch(uploads, 'sheet')
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(writes, [('paystub', 'a.pdf'), ('w2', 'b.pdf'), ('paystub', 'c.pdf')])
+        self.assertGreater(max(peak), 1)
+        self.assertLess(elapsed, sum(delays.values()))
+        self.assertEqual([result['state'] for result in results], ['succeeded'] * 3)
+        self.assertGreaterEqual(results[0]['stages']['document_ai'], 0.3)
+
+    def test_failure_is_reported_per_file(self):
+        def extract(file_path, mime_type, document_type):
+            if file_path == 'bad.pdf':
+                raise ValueError('unreadable')
+            return file_path
+
+        with mock.patch.object(document_processing_batch, 'extract_document_w2_paystub', extract), \
+                mock.patch.object(document_processing_batch, 'document_population'):
+            results = process_documents_batch([('bad.pdf', 'w2', 'bad.pdf'), ('ok.pdf', 'w2', 'ok.pdf')], 'sheet')
+
+        self.assertEqual([result['state'] for result in results], ['failed', 'succeeded'])
+        self.assertEqual(results[0]['error'], 'ValueError: unreadable')
+
+    def test_batch_split_1040_does_not_hold_a_worker(self):
+        operation = Future()
+        # Fails the operation if the W-2 never gets the only worker
+        timeout = threading.Timer(2, lambda: operation.done() or operation.set_exception(TimeoutError()))
+        timeout.start()
+        self.addCleanup(timeout.cancel)
+
+        def extract(file_path, mime_type, document_type):
+            operation.set_result(None)
+            return file_path
+
+        with mock.patch.object(document_processing_batch, '_executor', ThreadPoolExecutor(max_workers=1)), \
+                mock.patch.object(document_processing_batch, 'process_document_fannie_mae', return_value=operation), \
+                mock.patch.object(document_processing_batch, 'extract_document_w2_paystub', extract), \
+                mock.patch.object(document_processing_batch, 'document_population'):
+            results = process_documents_batch([('a.pdf', '1040', 'a.pdf'), ('b.pdf', 'w2', 'b.pdf')], 'sheet')
+
+        self.assertEqual([result['state'] for result in results], ['succeeded', 'succeeded'])
+
+
+class TestBatchRoute(unittest.TestCase):
+    def setUp(self):
+        self.upload_folder = tempfile.mkdtemp()
+        app = create_app('testing')
+        app.config['UPLOAD_FOLDER'] = self.upload_folder
+        self.client = app.test_client()
+
+    def post(self, files, document_types):
+        data = {'files': [(io.BytesIO(b'%PDF-1.4'), name) for name in files],
+                'document_type': document_types, 'spreadsheetId': 'sheet'}
+        return self.client.post('/api/process/batch', data=data, content_type='multipart/form-data')
+
+    def test_mismatched_document_types_are_rejected(self):
+        response = self.post(['a.pdf', 'b.pdf'], ['w2'])
+        self.assertEqual(response.status_code, 400)
+
+    def test_partial_failure_returns_multi_status_and_cleans_up(self):
+        results = [{'filename': 'a.pdf', 'state': 'succeeded'}, {'filename': 'b.pdf', 'state': 'failed'}]
+        with mock.patch('app.api.document_routes.process_documents_batch', return_value=results) as batch:
+            response = self.post(['a.pdf', 'b.pdf'], ['paystub', 'w2'])
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.get_json(), {'results': results})
+        uploads, spreadsheet_id = batch.call_args.args
+        self.assertEqual([(document_type, name) for _, document_type, name in uploads],
+                         [('paystub', 'a.pdf'), ('w2', 'b.pdf')])
+        self.assertEqual(os.listdir(self.upload_folder), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
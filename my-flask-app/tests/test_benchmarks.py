@@ -0,0 +1,37 @@
+import contextlib
+import io
+import unittest
+
+from benchmarks.pipeline import main, percentile
+
+
+class TestPipelineBenchmark(unittest.TestCase):
+    def test_scenarios_run_against_fakes(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = main(['--scenario', 'w2', '--scenario', '1040-batch',
+                            '--iterations', '2', '--concurrency', '2', '--time-scale', '0'])
+
+        w2 = results['w2']
+        self.assertEqual(w2['errors'], 0)
+        self.assertEqual(w2['api_calls']['documentai.process_document'], 2)
+        self.assertEqual(w2['api_calls']['sheets.update_values_batch'], 2)
+        self.assertIn('document_ai', w2['stages'])
+
+        batch = results['1040-batch']
+        self.assertEqual(batch['errors'], 0)
+        self.assertEqual(batch['api_calls']['documentai.batch_process_documents'], 2)
+        self.assertEqual(set(batch['stages']), {'split', 'document_ai_batch', 'schedule_c', 'region_extraction', 'sheets'})
+
+    def test_injected_errors_are_reported(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = main(['--scenario', 'w2', '--iterations', '3', '--time-scale', '0', '--error-rate', '1'])
+        self.assertEqual(results['w2']['errors'], 3)
+        self.assertIn('ServiceUnavailable', results['w2']['first_error'])
+
+    def test_percentile(self):
+        self.assertEqual(percentile([1, 2, 3, 4], 0.5), 2.5)
+        self.assertEqual(percentile([5], 0.99), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
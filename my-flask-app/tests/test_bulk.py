@@ -0,0 +1,135 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from app import bulk
+from app.bulk import JsonlSink, ParquetSink, collect_items, run, share_rate_limits
+from app.utils.outbound_util import call_api, get_outbound_scheduler, reset_outbound_scheduler
+from benchmarks.fakes import FakeBackends, load_documents
+from benchmarks.pipeline import BENCHMARK_CONFIG, sample_pdf
+
+TEST_PDF = os.path.join(os.path.dirname(__file__), 'test.pdf')
+
+TEST_CONFIG = dict(BENCHMARK_CONFIG, FIRESTORE_ASYNC_WRITES=False, ARCHIVE_SPLIT_PDFS=False,
+                   OUTBOUND_RATE_LIMITS={}, SPLIT_MODE='online', PDF_OPTIMIZE=False)
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+class TestBulk(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.input = os.path.join(self.root, 'input')
+        write_file(os.path.join(self.input, 'W-2s', 'a.pdf'), sample_pdf('w2'))
+        write_file(os.path.join(self.input, 'paystubs', '2024', 'b.pdf'), sample_pdf('paystub'))
+        with open(TEST_PDF, 'rb') as f:
+            write_file(os.path.join(self.input, '1040', 'c.pdf'), f.read())
+        write_file(os.path.join(self.input, 'other', 'd.pdf'), sample_pdf('other'))
+
+        patcher = mock.patch.multiple(bulk.config, **TEST_CONFIG)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        reset_outbound_scheduler()
+        self.addCleanup(reset_outbound_scheduler)
+        self.backends = FakeBackends(load_documents(), location='us').install()
+        self.addCleanup(self.backends.uninstall)
+
+    def run_bulk(self, sink, items=None):
+        items = items or collect_items(self.input)
+        return run(items, sink, workers=0, threads=2, docai_concurrency=2)
+
+    def test_document_types_from_directories_and_manifests(self):
+        items = collect_items(self.input)
+        self.assertEqual([(os.path.relpath(item.path, self.input), item.document_type) for item in items], [
+            (os.path.join('1040', 'c.pdf'), '1040'),
+            (os.path.join('W-2s', 'a.pdf'), 'w2'),
+            (os.path.join('paystubs', '2024', 'b.pdf'), 'paystub'),
+        ])
+        manifest = os.path.join(self.input, 'manifest.csv')
+        with open(manifest, 'w') as f:
+            f.write("path,document_type\nother/d.pdf,schedule_c\n1040/c.pdf,\n")
+        self.assertEqual([item.document_type for item in collect_items(manifest)], ['schedule_c'])
+        self.assertEqual([item.document_type for item in collect_items(manifest, 'w2')], ['w2', 'w2'])
+
+    def test_records_are_written_and_a_rerun_resumes(self):
+        output = os.path.join(self.root, 'results.jsonl')
+        summary = self.run_bulk(JsonlSink(output))
+        self.assertEqual((summary['processed'], summary['errors']), (3, 0))
+
+        with open(output) as f:
+            records = {record['document_type']: record for record in map(json.loads, f)}
+        self.assertTrue(records['w2']['result']['entities'])
+        self.assertEqual(records['w2']['api_calls']['documentai.process_document'], 1)
+        sections = records['1040']['result']['sections']
+        self.assertEqual([section['section'] for section in sections], ['schedule_C'])
+        self.assertIn('line31', sections[0]['values'])
+        self.assertIn('split', records['1040']['stages'])
+
+        self.assertEqual(self.run_bulk(JsonlSink(output))['skipped'], 3)
+        # An interrupted run: the last record cut short, and one that failed
+        with open(output) as f:
+            lines = f.readlines()
+        failed = dict(json.loads(lines[1]), status='error', error='ServiceUnavailable: down')
+        with open(output, 'w') as f:
+            f.write(lines[0] + json.dumps(failed) + '\n' + lines[2][:20])
+        summary = self.run_bulk(JsonlSink(output))
+        self.assertEqual((summary['skipped'], summary['processed']), (1, 2))
+        self.assertEqual(JsonlSink(output).completed(), {item.key for item in collect_items(self.input)})
+
+    def test_parquet_output(self):
+        try:
+            import pyarrow.parquet as parquet
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+        output = os.path.join(self.root, 'results.parquet')
+        items = collect_items(self.input)[1:]
+        self.run_bulk(ParquetSink(output, batch_rows=1), items)
+
+        self.assertEqual(len(os.listdir(output)), 2)
+        table = parquet.read_table(output)
+        self.assertEqual(sorted(table.column('document_type').to_pylist()), ['paystub', 'w2'])
+        self.assertTrue(json.loads(table.column('result')[0].as_py())['entities'])
+        self.assertEqual(self.run_bulk(ParquetSink(output), items)['skipped'], 2)
+
+    def test_rate_limits_are_shared_between_workers(self):
+        self.assertEqual(share_rate_limits({'documentai': [10, 20], 'documentai:batch': [0.5, 5]}, 4),
+                         {'documentai': [2.5, 5], 'documentai:batch': [0.125, 1]})
+
+
+class TestConcurrencyLimit(unittest.TestCase):
+    def setUp(self):
+        reset_outbound_scheduler()
+        self.addCleanup(reset_outbound_scheduler)
+
+    def test_calls_in_flight_are_capped(self):
+        active, peak, lock = [0], [0], threading.Lock()
+
+        def slow_call():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+
+        get_outbound_scheduler().limit_concurrency('docs', threading.BoundedSemaphore(2))
+        threads = [threading.Thread(target=call_api, args=('docs', 'process', slow_call)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
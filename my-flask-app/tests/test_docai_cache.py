@@ -0,0 +1,80 @@
+import os
+import tempfile
+import time
+import unittest
+
+import fitz  # PyMuPDF
+
+from app.utils.docai_cache_util import (
+    DocumentCache, MemoryCacheBackend, DiskCacheBackend, make_cache_key
+)
+from app.utils.batch_processing_util import split_pdf_from_manifest
+
+
+class TestDocumentCache(unittest.TestCase):
+    def test_key_depends_on_content_and_processor(self):
+        key = make_cache_key(b"%PDF-1", "paystub-processor", "v1")
+        self.assertEqual(key, make_cache_key(b"%PDF-1", "paystub-processor", "v1"))
+        self.assertNotEqual(key, make_cache_key(b"%PDF-2", "paystub-processor", "v1"))
+        self.assertNotEqual(key, make_cache_key(b"%PDF-1", "w2-processor", "v1"))
+        self.assertNotEqual(key, make_cache_key(b"%PDF-1", "paystub-processor", "v2"))
+
+    def test_hits_misses_and_ttl(self):
+        cache = DocumentCache(MemoryCacheBackend(max_bytes=10_000), ttl=0.05)
+        entities = [{'Type': 'FormYear', 'Raw Value': '2023'}]
+        self.assertIsNone(cache.get('key'))
+        cache.set('key', entities)
+        self.assertEqual(cache.get('key'), entities)
+        time.sleep(0.06)
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_memory_backend_evicts_least_recently_used(self):
+        backend = MemoryCacheBackend(max_bytes=10)
+        backend.set('a', b'1234')
+        backend.set('b', b'1234')
+        backend.get('a')
+        backend.set('c', b'1234')
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('a'), b'1234')
+        self.assertEqual(backend.size, 8)
+
+    def test_disk_backend_round_trip(self):
+        cache = DocumentCache(DiskCacheBackend(tempfile.mkdtemp()))
+        cache.set('key', [{'type': 'schedule_C', 'start_page': 2, 'end_page': 3}])
+        self.assertEqual(cache.get('key')[0]['type'], 'schedule_C')
+
+    def test_unusable_entries_are_misses_and_dropped(self):
+        backend = MemoryCacheBackend(max_bytes=10_000)
+        cache = DocumentCache(backend)
+        for payload in (b'not json', b'{"value": []}', b'[1, 2]'):
+            backend.set('key', payload)
+            self.assertIsNone(cache.get('key'))
+            self.assertIsNone(backend.get('key'))
+        self.assertEqual(cache.stats()['misses'], 3)
+
+
+class TestSplitFromManifest(unittest.TestCase):
+    def test_split_names_match_splitter_output(self):
+        tmpdir = tempfile.mkdtemp()
+        pdf_path = os.path.join(tmpdir, 'upload.pdf')
+        with fitz.open() as pdf:
+            for _ in range(4):
+                pdf.new_page()
+            pdf.save(pdf_path)
+        output_dir = tempfile.mkdtemp()
+
+        manifest = [
+            {'type': '1040', 'start_page': 0, 'end_page': 1},
+            {'type': 'schedule_C', 'start_page': 2, 'end_page': 2},
+        ]
+        files = split_pdf_from_manifest(manifest, pdf_path, output_dir, 'return.pdf')
+
+        self.assertEqual(files, ['return_pg1-2_1040.pdf', 'return_pg3_schedule_C.pdf'])
+        with fitz.open(os.path.join(output_dir, files[0])) as part:
+            self.assertEqual(part.page_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
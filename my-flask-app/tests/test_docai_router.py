@@ -0,0 +1,101 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import fitz  # PyMuPDF
+from google.cloud import documentai_v1 as documentai
+
+from app.utils import docai_router_util
+from app.utils.docai_router_util import (
+    BATCH, ONLINE, SHARDED, merge_documents, plan_route, process_document, shard_ranges
+)
+
+
+def build_pdf(page_count):
+    with fitz.open() as pdf:
+        for number in range(page_count):
+            pdf.new_page().insert_text((72, 72), f"Page {number + 1}")
+        return pdf.tobytes()
+
+
+def shard_document(text, page_count):
+    """A shard's Document: one page per page of the shard and an entity on its last page."""
+    anchor = documentai.Document.TextAnchor(
+        text_segments=[documentai.Document.TextAnchor.TextSegment(start_index=0, end_index=len(text))])
+    pages = [
+        documentai.Document.Page(page_number=number + 1, layout=documentai.Document.Page.Layout(text_anchor=anchor))
+        for number in range(page_count)
+    ]
+    entity = documentai.Document.Entity(
+        type_='Wages', mention_text=text, text_anchor=anchor,
+        page_anchor=documentai.Document.PageAnchor(
+            page_refs=[documentai.Document.PageAnchor.PageRef(page=page_count - 1)]),
+    )
+    return documentai.Document(text=text, pages=pages, entities=[entity])
+
+
+class TestDocaiRouter(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.multiple(docai_router_util.config, DOCAI_ONLINE_MAX_PAGES=4,
+                                      DOCAI_ONLINE_MAX_BYTES=20 * 1024 * 1024, SHARDED_MAX_PAGES=12)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_shard_ranges(self):
+        self.assertEqual(shard_ranges(10, 4), [(0, 3), (4, 7), (8, 9)])
+        self.assertEqual(shard_ranges(4, 4), [(0, 3)])
+
+    def test_routes_by_page_count(self):
+        self.assertEqual(plan_route(build_pdf(3)), (ONLINE, 3, mock.ANY, None))
+        self.assertEqual(plan_route(build_pdf(10)), (SHARDED, 10, mock.ANY, [(0, 3), (4, 7), (8, 9)]))
+        self.assertEqual(plan_route(build_pdf(13)).route, BATCH)
+        self.assertEqual(plan_route(build_pdf(3), mode=BATCH).route, BATCH)
+        self.assertEqual(plan_route(b'\x89PNG', mime_type='image/png').route, ONLINE)
+
+    def test_heavy_pages_make_smaller_shards(self):
+        content = build_pdf(6)
+        # Limit such that about two pages fit a shard
+        with mock.patch.object(docai_router_util.config, 'DOCAI_ONLINE_MAX_BYTES', int(len(content) / 6 * 2.5)):
+            plan = plan_route(content)
+        self.assertEqual(plan.route, SHARDED)
+        self.assertEqual(plan.shards, [(0, 1), (2, 3), (4, 5)])
+
+    def test_merge_documents_moves_anchors_and_pages(self):
+        merged = merge_documents([shard_document('first ', 4), shard_document('second', 2)], [0, 4])
+
+        self.assertEqual(merged.text, 'first second')
+        self.assertEqual([page.page_number for page in merged.pages], [1, 2, 3, 4, 5, 6])
+        segment = merged.pages[5].layout.text_anchor.text_segments[0]
+        self.assertEqual((segment.start_index, segment.end_index), (6, 12))
+        second = merged.entities[1]
+        self.assertEqual(merged.text[second.text_anchor.text_segments[0].start_index:
+                                     second.text_anchor.text_segments[0].end_index], 'second')
+        self.assertEqual([entity.page_anchor.page_refs[0].page for entity in merged.entities], [3, 5])
+
+    def test_shards_are_processed_concurrently_and_merged(self):
+        active, peak, lock = [0], [0], threading.Lock()
+
+        def online_process(project_id, location, processor_id, content, mime_type):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.1)
+            with lock:
+                active[0] -= 1
+            with fitz.open(stream=content, filetype='pdf') as shard:
+                first_page = shard[0].get_text().strip()
+                page_count = shard.page_count
+            return documentai.ProcessResponse(document=shard_document(first_page + ' ', page_count))
+
+        with mock.patch.object(docai_router_util, 'online_process', side_effect=online_process):
+            document = process_document('project', 'us', 'w2', build_pdf(10), 'application/pdf')
+
+        self.assertEqual(peak[0], 3)
+        self.assertEqual(document.text, 'Page 1 Page 5 Page 9 ')
+        self.assertEqual(len(document.pages), 10)
+        self.assertEqual([entity.page_anchor.page_refs[0].page for entity in document.entities], [3, 7, 9])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+import unittest
+
+from app.utils.earnings_util import (
+    DEFAULT_EARNINGS_TAXONOMY, EarningsClassifier, load_earnings_taxonomy, parse_amount
+)
+
+
+def chained_ifs(description):
+    """The substring chain get_earning_type used before the taxonomy."""
+    for earning_type, keywords in DEFAULT_EARNINGS_TAXONOMY.items():
+        for keyword in keywords:
+            if keyword in description:
+                return earning_type
+    return None
+
+
+class TestEarningsClassifier(unittest.TestCase):
+    def test_matches_original_precedence(self):
+        classifier = EarningsClassifier()
+        descriptions = ['Regular 25.00 40.00 1,000.00', 'Overtime Regular 37.50 2.00 75.00',
+                        'BONUS 500.00', 'Commission 1,200.00', 'Holiday Pay 25.00 8.00 200.00',
+                        'Reimbursement 42.00', 'Sick 25.00 8.00 200.00 1,600.00', '']
+        self.assertEqual(classifier.classify_batch(descriptions),
+                         [chained_ifs(description.lower()) for description in descriptions])
+        self.assertEqual(classifier.classify('Overtime Regular 37.50 2.00 75.00'), 'Bonus')
+
+    def test_overlapping_keywords(self):
+        classifier = EarningsClassifier({"Bonus": ["overtime"], "Regular": ["time"]})
+        self.assertEqual(classifier.classify_batch(['Overtime 10.00', 'Time 5.00', 'none']),
+                         ['Bonus', 'Regular', None])
+
+    def test_parse_batch(self):
+        lines = EarningsClassifier().parse_batch(['Regular 25.00 40.00 $1,000.00 12,000.00', 'Salary Base 2,500.00',
+                                                  'Overtime (37.50)'])
+        self.assertEqual((lines[0].earning_type, lines[0].rate, lines[0].hours, lines[0].amount),
+                         ('Regular', '25.00', '40.00', 12000.0))
+        self.assertTrue(lines[1].is_salary)
+        self.assertIsNone(lines[1].rate)
+        self.assertEqual((lines[2].earning_type, lines[2].amount, lines[2].amount_text), ('Bonus', -37.5, '(37.50)'))
+
+    def test_parse_amount(self):
+        self.assertEqual(parse_amount('$1,234.50'), 1234.5)
+        self.assertEqual(parse_amount('-12'), -12.0)
+        self.assertIsNone(parse_amount('n/a'))
+
+    def test_taxonomy_file_adds_employer_codes(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({"Regular": ["reg hrly"], "Bonus": ["shift diff"]}, f)
+        self.addCleanup(os.remove, f.name)
+
+        classifier = EarningsClassifier(load_earnings_taxonomy(f.name))
+        self.assertEqual(classifier.classify_batch(['REG HRLY 30.00 40.00 1,200.00', 'Shift Diff 50.00', 'Commission 9.00']),
+                         ['Regular', 'Bonus', 'Commission'])
+
+    def test_taxonomy_file_keeps_default_precedence(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({"Regular": ["reg hrly"]}, f)
+        self.addCleanup(os.remove, f.name)
+
+        descriptions = ['Regular Overtime 1.5 10 100.00', 'Commission base 100', 'Bonus Holiday 50.00',
+                        'Regular 25.00 40.00 1,000.00']
+        self.assertEqual(EarningsClassifier(load_earnings_taxonomy(f.name)).classify_batch(descriptions),
+                         EarningsClassifier().classify_batch(descriptions))
+        self.assertEqual(EarningsClassifier(load_earnings_taxonomy(f.name)).classify_batch(descriptions[:2]),
+                         ['Bonus', 'Commission'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import json
+import unittest
+
+from google.cloud import documentai_v1 as documentai
+
+from app.models.extracted_entity import EntitySet, ExtractedEntity, iter_entities
+
+
+def make_document():
+    return documentai.Document(entities=[
+        documentai.Document.Entity(
+            type_='earning_item', mention_text='Regular 40.00 25.00 1,000.00', confidence=0.97,
+            properties=[
+                documentai.Document.Entity(type_='earning_rate', mention_text='25.00', confidence=0.4),
+                documentai.Document.Entity(type_='earning_hours', mention_text='40.00', confidence=0.9),
+            ]),
+        documentai.Document.Entity(
+            type_='pay_date', mention_text='01/15/2024', confidence=0.88,
+            normalized_value=documentai.Document.Entity.NormalizedValue(text='2024-01-15')),
+    ])
+
+
+class TestEntitySet(unittest.TestCase):
+    def test_entities_and_properties_in_document_order(self):
+        entities = EntitySet.from_document(make_document())
+
+        self.assertEqual([entity.type for entity in entities],
+                         ['earning_item', 'earning_rate', 'earning_hours', 'pay_date'])
+        pay_date = list(entities)[-1]
+        self.assertEqual(pay_date.normalized_value, '2024-01-15')
+        self.assertAlmostEqual(pay_date.confidence, 0.88, places=5)
+
+    def test_min_confidence_filter(self):
+        document = make_document()
+        self.assertEqual([entity.type for entity in iter_entities(document, min_confidence=0.85)],
+                         ['earning_item', 'earning_hours', 'pay_date'])
+        entities = EntitySet.from_document(document)
+        self.assertEqual(len(list(entities.iter(min_confidence=0.95))), 1)
+
+    def test_records_round_trip(self):
+        entities = EntitySet.from_document(make_document())
+        records = json.loads(entities.to_json())
+        self.assertIsInstance(records[0]['Confidence'], float)
+        self.assertEqual(EntitySet.from_records(records), entities)
+
+    def test_reads_percentage_confidence_records(self):
+        entities = EntitySet.from_records([{'Type': 'FormYear', 'Raw Value': '2023',
+                                            'Normalized Value': '', 'Confidence': '97%'}])
+        self.assertEqual(list(entities), [ExtractedEntity('FormYear', '2023', '', 0.97)])
+
+    def test_entities_have_no_instance_dict(self):
+        self.assertFalse(hasattr(ExtractedEntity('FormYear', '2023'), '__dict__'))
+
+
+if __name__ == '__main__':
+    unittest.main()
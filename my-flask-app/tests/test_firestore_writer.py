@@ -0,0 +1,93 @@
+import threading
+import time
+import unittest
+
+from app.utils.firestore_util import FirestoreWriter
+
+
+class FakeBatch:
+    def __init__(self, client):
+        self.client = client
+        self.writes = []
+
+    def set(self, doc_ref, document):
+        self.writes.append((doc_ref, document))
+
+    def commit(self):
+        with self.client.lock:
+            if self.client.failures:
+                self.client.failures -= 1
+                raise RuntimeError('unavailable')
+            self.client.commits.append(self.writes)
+
+
+class FakeFirestore:
+    """In-memory stand-in for the Firestore client: records committed batches."""
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.commits = []
+        self.lock = threading.Lock()
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def collection(self, name):
+        client = self
+
+        class Collection:
+            def document(self):
+                return (name, len(client.commits))
+        return Collection()
+
+
+class TestFirestoreWriter(unittest.TestCase):
+    def make_writer(self, client, **kwargs):
+        kwargs.setdefault('flush_interval', 0.05)
+        writer = FirestoreWriter(client_factory=lambda: client, initial_backoff=0.01, **kwargs)
+        self.addCleanup(writer.close)
+        return writer
+
+    def test_writes_are_batched(self):
+        client = FakeFirestore()
+        writer = self.make_writer(client, max_batch=500, flush_interval=0.2)
+        start = time.perf_counter()
+        for i in range(1200):
+            writer.submit('w2-entities', {'entities': [i]})
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+        self.assertTrue(writer.flush(timeout=5))
+        self.assertEqual([len(batch) for batch in client.commits], [500, 500, 200])
+        self.assertEqual(writer.stats(), {'queue_depth': 0, 'written': 1200, 'failed': 0})
+
+    def test_failed_commit_is_retried(self):
+        client = FakeFirestore(failures=2)
+        writer = self.make_writer(client)
+        writer.submit('paystub-entities', {'entities': []})
+
+        self.assertTrue(writer.flush(timeout=5))
+        self.assertEqual(len(client.commits), 1)
+        self.assertEqual(writer.written, 1)
+
+    def test_batch_is_dropped_after_max_retries(self):
+        client = FakeFirestore(failures=10)
+        writer = self.make_writer(client, max_retries=2)
+        writer.submit('paystub-entities', {'entities': []})
+
+        self.assertTrue(writer.flush(timeout=5))
+        self.assertEqual(client.commits, [])
+        self.assertEqual(writer.failed, 1)
+
+    def test_close_flushes_queued_writes(self):
+        client = FakeFirestore()
+        writer = self.make_writer(client, flush_interval=60)
+        for i in range(3):
+            writer.submit('w2-entities', {'entities': [i]})
+        self.assertEqual(writer.depth(), 3)
+
+        writer.close(timeout=5)
+        self.assertEqual(sum(len(batch) for batch in client.commits), 3)
+        self.assertEqual(writer.depth(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from app.config import get_config
+from app.utils import clients_util
+from app.utils.docai_router_util import process_batch
+from app.utils.gcs_transfer_util import download_many, parse_gcs_uri, upload_many
+from app.utils.jobs_util import Job, run_inline
+from app.utils.upload_buffer_util import UploadBuffer
+from benchmarks.fakes import FakeBackends, FakeStorage, Latency, load_documents
+from benchmarks.pipeline import BENCHMARK_CONFIG, sample_pdf
+
+
+class TestGcsTransfer(unittest.TestCase):
+    def setUp(self):
+        self.storage = FakeStorage(Latency(0.1))
+        clients_util.set_client('storage', self.storage)
+        self.addCleanup(clients_util.clear_clients)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_parse_gcs_uri(self):
+        self.assertEqual(parse_gcs_uri('gs://bucket/a/b.json'), ('bucket', 'a/b.json'))
+
+    def test_uploads_run_concurrently(self):
+        job = Job()
+        start = time.perf_counter()
+        with run_inline(job):
+            manifest = upload_many(((f"pdf {i}".encode(), f"split/{i}.pdf", 'application/pdf') for i in range(30)),
+                                   'output')
+        elapsed = time.perf_counter() - start
+
+        # 30 uploads one after another would take 3s
+        self.assertLess(elapsed, 1.5)
+        self.assertEqual([entry['uri'] for entry in manifest], [f"gs://output/split/{i}.pdf" for i in range(30)])
+        self.assertEqual(manifest[3]['bytes'], 5)
+        self.assertEqual(self.storage.get('output', 'split/29.pdf'), b'pdf 29')
+        self.assertEqual(job.api_calls['gcs.upload'], 30)
+
+    def test_downloads_go_to_their_own_files(self):
+        self.storage.put('output', 'op/0/output-document.json', b'{"shard": 0}')
+        self.storage.put('output', 'op/1/output-document.json', b'{"shard": 1}')
+        paths = [os.path.join(self.tmpdir, f"output-document-{i}.json") for i in range(2)]
+
+        manifest = download_many([(f"gs://output/op/{i}/output-document.json", paths[i]) for i in range(2)])
+
+        self.assertEqual([entry['local'] for entry in manifest], paths)
+        for i, path in enumerate(paths):
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'{"shard": %d}' % i)
+
+    def test_failures_are_reported_in_the_manifest(self):
+        self.storage.put('output', 'present.json', b'{}')
+        items = [('gs://output/missing.json', os.path.join(self.tmpdir, 'missing.json')),
+                 ('gs://output/present.json', os.path.join(self.tmpdir, 'present.json'))]
+
+        manifest = download_many(items, raise_on_error=False)
+        self.assertIn('NotFound', manifest[0]['error'])
+        self.assertIsNone(manifest[1]['error'])
+        with self.assertRaises(Exception):
+            download_many(items)
+
+    def test_large_files_use_chunked_transfers(self):
+        path = os.path.join(self.tmpdir, 'large.pdf')
+        with open(path, 'wb') as f:
+            f.write(b'x' * 2048)
+        config = get_config(os.getenv('APP_ENV', 'default'))
+        with mock.patch.object(config, 'GCS_CHUNKED_TRANSFER_THRESHOLD', 1024), \
+                mock.patch('google.cloud.storage.transfer_manager.upload_chunks_concurrently') as upload_chunks:
+            manifest = upload_many([(path, 'large.pdf', 'application/pdf'), (b'small', 'small.pdf', None)], 'input')
+
+        self.assertEqual([entry['chunked'] for entry in manifest], [True, False])
+        self.assertEqual(upload_chunks.call_args.args[0], path)
+
+
+class TestPipelineTransfers(unittest.TestCase):
+    def setUp(self):
+        config = get_config(os.getenv('APP_ENV', 'default'))
+        patcher = mock.patch.multiple(config, GCS_CHUNKED_TRANSFER_THRESHOLD=1024, **BENCHMARK_CONFIG)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.backends = FakeBackends(load_documents(), location='us').install()
+        self.addCleanup(self.backends.uninstall)
+
+    def test_routed_batch_jobs_use_chunked_transfers(self):
+        # The chunked transfers go through the fake blobs' single-stream methods
+        upload_chunks = mock.patch('google.cloud.storage.transfer_manager.upload_chunks_concurrently',
+                                   side_effect=lambda path, blob, **kwargs: blob.upload_from_filename(path))
+        download_chunks = mock.patch('google.cloud.storage.transfer_manager.download_chunks_concurrently',
+                                     side_effect=lambda blob, path, **kwargs: blob.download_to_filename(path))
+        content = sample_pdf('w2') + b' ' * 2048
+        for source in (UploadBuffer.from_bytes(content, spill_threshold=1 << 20),
+                       UploadBuffer.from_bytes(content, spill_threshold=1024), content):
+            with self.subTest(source=type(source).__name__), upload_chunks as uploads, download_chunks as downloads:
+                document = process_batch('bench-project', 'us', 'w2', source, 'application/pdf')
+
+                self.assertTrue(document.entities)
+                self.assertEqual(uploads.call_count, 1)
+                # The batch output's size is unknown until its metadata is read
+                self.assertEqual(downloads.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
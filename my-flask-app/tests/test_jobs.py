@@ -0,0 +1,87 @@
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from app import create_app
+from app.utils.jobs_util import JobQueue, QueueFullError, track_stage, SUCCEEDED, FAILED
+
+
+def wait_for(job, timeout=5):
+    deadline = time.time() + timeout
+    while not job.finished and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.queue = JobQueue(max_workers=1, max_pending=2)
+
+    def tearDown(self):
+        self.queue.shutdown()
+
+    def test_records_stage_timings(self):
+        def work():
+            with track_stage('document_ai'):
+                time.sleep(0.02)
+            with track_stage('sheets'):
+                pass
+
+        job = wait_for(self.queue.submit(work, document_type='w2'))
+        status = job.to_dict()
+        self.assertEqual(status['state'], SUCCEEDED)
+        self.assertEqual(list(status['stages']), ['document_ai', 'sheets'])
+        self.assertGreaterEqual(status['stages']['document_ai'], 0.02)
+
+    def test_failure_is_reported(self):
+        def work():
+            raise ValueError("bad pdf")
+
+        job = wait_for(self.queue.submit(work))
+        self.assertEqual(job.state, FAILED)
+        self.assertEqual(job.error, "ValueError: bad pdf")
+
+    def test_rejects_when_full(self):
+        release = threading.Event()
+        self.queue.submit(release.wait)
+        self.queue.submit(release.wait)
+        with self.assertRaises(QueueFullError):
+            self.queue.submit(release.wait)
+        release.set()
+
+
+class TestAsyncProcessRoute(unittest.TestCase):
+    def setUp(self):
+        self.upload_folder = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['UPLOAD_FOLDER'] = self.upload_folder
+        self.client = self.app.test_client()
+
+    def test_async_upload_returns_job(self):
+        queue = JobQueue(max_workers=1, max_pending=2)
+        with mock.patch('app.api.document_routes.get_job_queue', return_value=queue), \
+                mock.patch('app.api.document_routes.process_file') as process_file:
+            with open('tests/test.pdf', 'rb') as fp:
+                response = self.client.post(
+                    '/api/process?async=true',
+                    data={'document_type': 'w2', 'spreadsheetId': 'sheet-id', 'file': (fp, 'test.pdf')}
+                )
+            self.assertEqual(response.status_code, 202)
+            job_id = response.get_json()['job_id']
+            wait_for(queue.get(job_id))
+
+            status = self.client.get(f'/api/jobs/{job_id}')
+            self.assertEqual(status.status_code, 200)
+            self.assertEqual(status.get_json()['state'], SUCCEEDED)
+            self.assertEqual(process_file.call_args.args[1:], ('w2', 'test.pdf', 'sheet-id'))
+        queue.shutdown()
+
+    def test_unknown_job(self):
+        response = self.client.get('/api/jobs/does-not-exist')
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
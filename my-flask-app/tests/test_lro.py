@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from app.utils.lro_util import OperationManager, register_operation_callback
+
+
+class FakeOperations:
+    """Stand-in for the Document AI operations API: an operation is done after `polls` fetches."""
+    def __init__(self, polls):
+        self.polls = dict(polls)
+        self.fetches = {}
+        self.lock = threading.Lock()
+
+    def fetch(self, name, location):
+        with self.lock:
+            self.fetches[name] = self.fetches.get(name, 0) + 1
+            done = self.fetches[name] >= self.polls[name]
+        return SimpleNamespace(operation=SimpleNamespace(done=done), exception=lambda: None, name=name)
+
+
+@register_operation_callback('test_kind')
+def record_completion(operation, context):
+    return (operation.name, context['spreadsheet_id'])
+
+
+class TestOperationManager(unittest.TestCase):
+    def setUp(self):
+        self.state_path = os.path.join(tempfile.mkdtemp(), 'operations.json')
+
+    def make_manager(self, operations):
+        return OperationManager(
+            state_path=self.state_path, initial_delay=0.01, max_delay=0.05,
+            fetch_operation=operations.fetch,
+        )
+
+    def test_tracks_many_operations_with_one_poller(self):
+        operations = FakeOperations({f'op-{i}': i % 3 + 1 for i in range(10)})
+        manager = self.make_manager(operations)
+        futures = [manager.track(name, 'test_kind', {'spreadsheet_id': name}) for name in operations.polls]
+
+        results = [future.result(timeout=5) for future in futures]
+        self.assertEqual(results, [(name, name) for name in operations.polls])
+        self.assertEqual(manager.in_flight(), 0)
+        self.assertFalse(os.path.exists(manager.state_file))
+        manager.stop()
+
+    def test_resume_after_restart(self):
+        with open(os.path.join(os.path.dirname(self.state_path), 'operations.123-0badf00d.json'), 'w') as f:
+            json.dump({'op-1': {'kind': 'test_kind', 'context': {'spreadsheet_id': 'sheet'},
+                                'location': 'us', 'submitted_at': time.time()}}, f)
+        operations = FakeOperations({'op-1': 1})
+        manager = self.make_manager(operations)
+
+        self.assertEqual(manager.resume(), 1)
+        deadline = time.time() + 5
+        while manager.in_flight() and time.time() < deadline:
+            time.sleep(0.01)
+        manager.stop()
+        self.assertEqual(operations.fetches, {'op-1': 1})
+
+    def test_orphaned_operations_are_resumed_by_one_worker(self):
+        entry = {'kind': 'test_kind', 'context': {'spreadsheet_id': 'sheet'}, 'location': 'us',
+                 'submitted_at': time.time()}
+        # A worker that exited, and a worker that is still running with an operation of its own
+        with open(os.path.join(os.path.dirname(self.state_path), 'operations.123-0badf00d.json'), 'w') as f:
+            json.dump({'op-dead': entry}, f)
+        operations = FakeOperations({'op-dead': 1000, 'op-live': 1000})
+        live = self.make_manager(operations)
+        live.track('op-live', 'test_kind', {'spreadsheet_id': 'sheet'})
+
+        workers = [self.make_manager(operations) for _ in range(3)]
+        self.assertEqual(sorted(worker.resume() for worker in workers), [0, 0, 1])
+        with open(workers[[worker.in_flight() for worker in workers].index(1)].state_file) as f:
+            self.assertEqual(list(json.load(f)), ['op-dead'])
+        with open(live.state_file) as f:
+            self.assertEqual(list(json.load(f)), ['op-live'])
+        for manager in workers + [live]:
+            manager.stop()
+
+    def test_unknown_kind_is_rejected(self):
+        manager = self.make_manager(FakeOperations({}))
+        with self.assertRaises(ValueError):
+            manager.track('op', 'missing_kind')
+
+
+if __name__ == '__main__':
+    unittest.main()
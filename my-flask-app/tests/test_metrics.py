@@ -0,0 +1,99 @@
+import unittest
+from unittest import mock
+
+from app import create_app
+from app.utils import metrics_util
+from app.utils.jobs_util import (
+    Job, job_context, track_stage, track_api_call, run_inline,
+    STAGE_SECONDS, API_CALLS, API_CALL_ERRORS, API_CALLS_PER_JOB
+)
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_renders_text_exposition_format(self):
+        registry = metrics_util.MetricsRegistry()
+        calls = registry.register(metrics_util.Counter('calls', 'Calls made.', ('service',)))
+        latency = registry.register(metrics_util.Histogram('latency_seconds', 'Latency.', ('stage',), buckets=(0.1, 1)))
+        in_flight = registry.register(metrics_util.Gauge('in_flight', 'In flight.'))
+        calls.inc(service='sheets')
+        calls.inc(2, service='sheets')
+        latency.observe(0.05, stage='split')
+        latency.observe(0.5, stage='split')
+        latency.observe(5, stage='split')
+        in_flight.set_function(lambda: 3)
+
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE calls counter', lines)
+        self.assertIn('calls_total{service="sheets"} 3', lines)
+        self.assertIn('latency_seconds_bucket{stage="split",le="0.1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{stage="split",le="1"} 2', lines)
+        self.assertIn('latency_seconds_bucket{stage="split",le="+Inf"} 3', lines)
+        self.assertIn('latency_seconds_sum{stage="split"} 5.55', lines)
+        self.assertIn('latency_seconds_count{stage="split"} 3', lines)
+        self.assertIn('in_flight 3', lines)
+
+    def test_label_values_are_escaped(self):
+        calls = metrics_util.Counter('calls', 'Calls made.', ('method',))
+        calls.inc(method='say "hi"\n')
+        self.assertIn('calls_total{method="say \\"hi\\"\\n"} 1', calls.render())
+
+    def test_rejects_wrong_labels(self):
+        calls = metrics_util.Counter('calls', 'Calls made.', ('service',))
+        with self.assertRaises(ValueError):
+            calls.inc(method='get_value')
+
+
+class TestPipelineMetrics(unittest.TestCase):
+    def test_stages_and_api_calls_are_labelled_by_document_type(self):
+        stages = STAGE_SECONDS.count(stage='split', document_type='1040')
+        calls = API_CALLS.value(service='sheets', method='get_value', document_type='1040')
+        errors = API_CALL_ERRORS.value(service='sheets', method='get_value')
+        per_job = API_CALLS_PER_JOB.count(document_type='1040')
+
+        job = Job(document_type='1040')
+        with self.assertRaises(RuntimeError):
+            with run_inline(job), track_stage('split'):
+                with track_api_call('sheets', 'get_value'):
+                    pass
+                with track_api_call('sheets', 'get_value'):
+                    raise RuntimeError("quota exceeded")
+
+        self.assertEqual(STAGE_SECONDS.count(stage='split', document_type='1040'), stages + 1)
+        self.assertEqual(API_CALLS.value(service='sheets', method='get_value', document_type='1040'), calls + 2)
+        self.assertEqual(API_CALL_ERRORS.value(service='sheets', method='get_value'), errors + 1)
+        self.assertEqual(API_CALLS_PER_JOB.count(document_type='1040'), per_job + 1)
+        self.assertEqual(job.to_dict()['api_calls'], {'sheets.get_value': 2})
+        self.assertEqual(job.state, 'failed')
+
+    def test_work_outside_a_job_is_labelled_unknown(self):
+        before = STAGE_SECONDS.count(stage='firestore', document_type='unknown')
+        with job_context(None), track_stage('firestore'):
+            pass
+        self.assertEqual(STAGE_SECONDS.count(stage='firestore', document_type='unknown'), before + 1)
+
+
+class TestMetricsRoute(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+
+    def test_exposes_request_metrics(self):
+        with mock.patch('app.api.document_routes.process_document_w2_paystub'):
+            with open('tests/test.pdf', 'rb') as fp:
+                response = self.client.post(
+                    '/api/process', data={'document_type': 'w2', 'spreadsheetId': 'sheet', 'file': (fp, 'test.pdf')})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Type'], metrics_util.CONTENT_TYPE)
+        body = response.get_data(as_text=True)
+        self.assertIn('docproc_stage_seconds_count{stage="upload_save",document_type="w2"}', body)
+        self.assertIn('docproc_api_calls_per_job_count{document_type="w2"}', body)
+        self.assertIn('docproc_jobs_finished_total{document_type="w2",state="succeeded"}', body)
+        # Only the scrape itself is in flight
+        self.assertIn('docproc_http_requests_in_flight 1', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import asyncio
+import os
+import time
+import unittest
+from unittest import mock
+
+from google.api_core import exceptions
+
+from app.config import get_config
+from app.utils.jobs_util import Job, run_inline
+from app.utils.outbound_util import (
+    THROTTLED, UNAVAILABLE, TokenBucket, call_api, call_api_async, get_outbound_scheduler,
+    reset_outbound_scheduler, retry_reason
+)
+
+
+class FakeHttpError(Exception):
+    """Shape of googleapiclient's HttpError, raised by pygsheets."""
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.resp = mock.Mock(status=status)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        self.assertEqual([bucket.reserve(), bucket.reserve()], [0.0, 0.0])
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.01)
+
+    def test_aimd(self):
+        bucket = TokenBucket(rate=10, burst=5, increase_fraction=0.1)
+        self.assertEqual(bucket.throttled(), 5)
+        self.assertEqual(bucket.throttled(), 2.5)
+        # No burst right after a 429
+        self.assertGreater(bucket.reserve(), 0)
+        for _ in range(100):
+            bucket.succeeded()
+        self.assertEqual(bucket.rate, 10)
+
+
+class TestRetryReason(unittest.TestCase):
+    def test_classification(self):
+        self.assertEqual(retry_reason(exceptions.TooManyRequests('quota')), THROTTLED)
+        self.assertEqual(retry_reason(exceptions.ResourceExhausted('quota')), THROTTLED)
+        self.assertEqual(retry_reason(exceptions.ServiceUnavailable('down')), UNAVAILABLE)
+        self.assertEqual(retry_reason(FakeHttpError(429)), THROTTLED)
+        self.assertEqual(retry_reason(FakeHttpError(503)), UNAVAILABLE)
+        self.assertEqual(retry_reason(ConnectionResetError()), UNAVAILABLE)
+        self.assertIsNone(retry_reason(exceptions.NotFound('gone')))
+        self.assertIsNone(retry_reason(FakeHttpError(400)))
+        self.assertIsNone(retry_reason(ValueError('bad')))
+
+
+class TestCallApi(unittest.TestCase):
+    def setUp(self):
+        config = get_config(os.getenv('APP_ENV', 'default'))
+        patcher = mock.patch.multiple(config, OUTBOUND_RATE_LIMITS={'svc': [50, 2]}, OUTBOUND_MAX_ATTEMPTS=3,
+                                      OUTBOUND_INITIAL_BACKOFF=0.001, OUTBOUND_MAX_BACKOFF=0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        reset_outbound_scheduler()
+        self.addCleanup(reset_outbound_scheduler)
+
+    def test_retries_transient_errors(self):
+        func = mock.Mock(side_effect=[exceptions.ServiceUnavailable('down'), 'ok'])
+        job = Job()
+        with run_inline(job):
+            self.assertEqual(call_api('svc', 'get', func, 1, key='value'), 'ok')
+        func.assert_called_with(1, key='value')
+        self.assertEqual(job.api_calls['svc.get'], 2)
+
+    def test_gives_up(self):
+        func = mock.Mock(side_effect=exceptions.ServiceUnavailable('down'))
+        with self.assertRaises(exceptions.ServiceUnavailable):
+            call_api('svc', 'get', func)
+        self.assertEqual(func.call_count, 3)
+
+        func = mock.Mock(side_effect=exceptions.NotFound('gone'))
+        with self.assertRaises(exceptions.NotFound):
+            call_api('svc', 'get', func)
+        func = mock.Mock(side_effect=exceptions.ServiceUnavailable('down'))
+        with self.assertRaises(exceptions.ServiceUnavailable):
+            call_api('svc', 'commit', func, retry=False)
+        self.assertEqual((func.call_count), 1)
+
+    def test_retries_only_the_given_reasons(self):
+        func = mock.Mock(side_effect=[exceptions.TooManyRequests('quota'), 'ok'])
+        self.assertEqual(call_api('svc', 'start', func, retry=(THROTTLED,)), 'ok')
+        func = mock.Mock(side_effect=exceptions.ServiceUnavailable('down'))
+        with self.assertRaises(exceptions.ServiceUnavailable):
+            call_api('svc', 'start', func, retry=(THROTTLED,))
+        self.assertEqual(func.call_count, 1)
+
+    def test_batch_jobs_are_not_started_twice(self):
+        from app.utils import batch_processing_util
+        client = mock.Mock()
+        client.batch_process_documents.side_effect = [exceptions.TooManyRequests('quota'),
+                                                      exceptions.DeadlineExceeded('accepted?'), 'operation']
+        client.processor_path.return_value = 'projects/p/locations/us/processors/splitter'
+        with mock.patch.object(batch_processing_util, 'get_documentai_client', return_value=client):
+            with self.assertRaises(exceptions.DeadlineExceeded):
+                batch_processing_util.submit_documentai_processing_batch('p', 'us', 'splitter', 'splits/1040.pdf')
+        self.assertEqual(client.batch_process_documents.call_count, 2)
+
+    def test_throttling_slows_the_quota(self):
+        func = mock.Mock(side_effect=[exceptions.TooManyRequests('quota'), 'ok'])
+        call_api('svc', 'get', func, quota='read')
+        bucket = get_outbound_scheduler().bucket('svc', 'read')
+        self.assertLess(bucket.rate, 50)
+        # Other quotas of the service keep their own rate
+        self.assertEqual(get_outbound_scheduler().bucket('svc', 'write').rate, 50)
+        self.assertIsNone(get_outbound_scheduler().bucket('unlimited'))
+
+    def test_rate_limit_spaces_calls(self):
+        start = time.perf_counter()
+        for _ in range(7):
+            call_api('svc', 'get', lambda: None, quota='spacing')
+        # Two calls from the burst, then five at 50 per second
+        self.assertGreaterEqual(time.perf_counter() - start, 0.09)
+
+    def test_async(self):
+        calls = []
+
+        async def request(value):
+            calls.append(value)
+            if len(calls) == 1:
+                raise exceptions.ServiceUnavailable('down')
+            return value
+
+        self.assertEqual(asyncio.run(call_api_async('svc', 'get', request, 'x')), 'x')
+        self.assertEqual(calls, ['x', 'x'])
+
+
+if __name__ == '__main__':
+    unittest.main()
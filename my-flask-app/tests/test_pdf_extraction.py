@@ -0,0 +1,42 @@
+import unittest
+
+import fitz  # PyMuPDF
+
+from app.utils.pdf_extraction_util import PageTextIndex, RegionTemplate, extract_text
+
+TEST_PDF = 'tests/test.pdf'
+
+
+class TestRegionExtraction(unittest.TestCase):
+    def test_index_matches_get_textbox(self):
+        with fitz.open(TEST_PDF) as document:
+            for page_number in (0, 2):
+                page = document.load_page(page_number)
+                index = PageTextIndex(page)
+                textpage = page.get_textpage()
+                for x in range(0, 600, 120):
+                    for y in range(0, 800, 90):
+                        rect = (x, y, x + 137, y + 53)
+                        self.assertEqual(index.text_in(rect), page.get_textbox(rect, textpage=textpage))
+
+    def test_template_matches_per_field_extraction(self):
+        pages = {
+            2: {"line6": (477, 325, 576, 334), "line31": (476, 638, 577, 670)},
+            3: {"line44a": (104, 408, 201, 418)},
+        }
+        template = RegionTemplate(pages, postprocess={"line44a": lambda text: text or None})
+        extracted = template.extract(TEST_PDF)
+
+        for page_number, fields in pages.items():
+            for key, rect in fields.items():
+                self.assertEqual(extracted[key] or "", extract_text(TEST_PDF, rect, page_number))
+
+    def test_template_accepts_bytes(self):
+        with open(TEST_PDF, 'rb') as f:
+            content = f.read()
+        template = RegionTemplate({0: {"form": (0, 0, 612, 60)}})
+        self.assertEqual(template.extract(content), template.extract(TEST_PDF))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import random
+import unittest
+from unittest import mock
+
+import fitz  # PyMuPDF
+
+from app.utils import pdf_optimize_util
+from app.utils.pdf_optimize_util import optimize_pdf, prepare_document, select_pages
+from app.utils.upload_buffer_util import UploadBuffer
+
+PAYSTUB_TEXT = "ACME Corp Earnings Statement\nPay Date 01/15/2024\nRegular 25.00 80.00 2,000.00\nNet Pay 1,540.00"
+
+
+def build_pdf(pages):
+    """A PDF with one page per entry: text, an image as (width, height) in pixels, or None for blank."""
+    with fitz.open() as pdf:
+        for content in pages:
+            page = pdf.new_page(width=612, height=792)
+            if isinstance(content, str):
+                page.insert_text((72, 72), content)
+            elif content is not None:
+                width, height = content
+                # Noise, like a scan, so the image does not compress away
+                samples = random.Random(0).randbytes(width * height * 3)
+                pixmap = fitz.Pixmap(fitz.csRGB, width, height, samples, False)
+                # Shown as 1.5 x 1.5 inches
+                page.insert_image(fitz.Rect(72, 72, 180, 180), pixmap=pixmap)
+        return pdf.tobytes()
+
+
+class TestPdfOptimize(unittest.TestCase):
+    def test_blank_and_duplicate_pages_are_dropped(self):
+        content = build_pdf([PAYSTUB_TEXT, None, PAYSTUB_TEXT, "Net Pay for the second period 1,612.00"])
+        with fitz.open(stream=content, filetype='pdf') as pdf:
+            keep, dropped = select_pages(pdf, 'paystub')
+        self.assertEqual(keep, [0, 3])
+        self.assertEqual(dict(dropped), {'blank': 1, 'duplicate': 1, 'irrelevant': 0})
+
+    def test_irrelevant_pages_are_dropped_only_when_a_page_matches(self):
+        content = build_pdf(["Dear employee, please find enclosed", PAYSTUB_TEXT])
+        with fitz.open(stream=content, filetype='pdf') as pdf:
+            self.assertEqual(select_pages(pdf, 'paystub')[0], [1])
+            self.assertEqual(select_pages(pdf, 'w2')[0], [0, 1])
+
+    def test_w2_keeps_copy_b(self):
+        copies = [f"W-2 Wage and Tax Statement 2023 Copy {copy}\nWages, tips 50,000.00" for copy in 'BC2']
+        with fitz.open(stream=build_pdf(copies), filetype='pdf') as pdf:
+            keep, dropped = select_pages(pdf, 'w2')
+        self.assertEqual(keep, [0])
+        self.assertEqual(dropped['irrelevant'], 2)
+
+    def test_images_are_downsampled_to_the_target_dpi(self):
+        # 1200 pixels over 1.5 inches is 800 dpi
+        content = build_pdf([PAYSTUB_TEXT, (1200, 1200)])
+        with mock.patch.object(pdf_optimize_util.config, 'PDF_OPTIMIZE_TARGET_DPI', 150):
+            optimized, report = optimize_pdf(content, 'paystub')
+
+        self.assertEqual(report['images_downsampled'], 1)
+        self.assertGreater(report['stages']['image_downsampling']['saved'], 0)
+        self.assertEqual(report['optimized_bytes'], len(optimized))
+        self.assertLess(len(optimized), len(content))
+        with fitz.open(stream=optimized, filetype='pdf') as pdf:
+            self.assertEqual(pdf.page_count, 2)
+            image = pdf[1].get_images(full=True)[0]
+            self.assertEqual((image[2], image[3]), (225, 225))
+
+    def test_stage_savings_add_up(self):
+        content = build_pdf([PAYSTUB_TEXT, None, PAYSTUB_TEXT, (1200, 1200)])
+        optimized, report = optimize_pdf(UploadBuffer.from_bytes(content), 'paystub')
+
+        self.assertEqual((report['pages_in'], report['pages_out']), (4, 2))
+        self.assertEqual(list(report['stages']), ['page_selection', 'image_downsampling', 'cleanup'])
+        self.assertEqual(sum(stage['saved'] for stage in report['stages'].values()),
+                         report['original_bytes'] - report['optimized_bytes'])
+
+    def test_prepare_document_falls_back_to_the_original(self):
+        upload = UploadBuffer.from_bytes(b'not a pdf', filename='stub.pdf')
+        self.assertIs(prepare_document(upload, 'application/pdf', 'paystub'), upload)
+        self.assertIs(prepare_document(upload, 'image/png', 'paystub'), upload)
+
+        content = build_pdf([PAYSTUB_TEXT, PAYSTUB_TEXT])
+        prepared = prepare_document(UploadBuffer.from_bytes(content, filename='stub.pdf'), 'application/pdf', 'paystub')
+        self.assertIsInstance(prepared, UploadBuffer)
+        self.assertEqual(prepared.filename, 'stub.pdf')
+        self.assertLess(len(prepared), len(content))
+        with mock.patch.object(pdf_optimize_util.config, 'PDF_OPTIMIZE', False):
+            self.assertEqual(prepare_document(content, 'application/pdf', 'paystub'), content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from app.config import get_config
+from app.models import fannie_mae_1040_extraction
+from app.models.fannie_mae_operations import section_dispatcher
+from app.utils.jobs_util import Job, run_inline
+
+
+def extract_schedule_e(pdf_path):
+    return {"line26": "1200", "line23a": None}
+
+
+class TestSectionDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.schedule_c = os.path.join(self.tmpdir, 'return_pg3-4_schedule_C.pdf')
+        shutil.copy('tests/test.pdf', self.schedule_c)
+        self.schedule_e = os.path.join(self.tmpdir, 'return_pg5_schedule_E.pdf')
+        shutil.copy('tests/test.pdf', self.schedule_e)
+
+        section_dispatcher.register_section_handler(
+            'schedule_E', {"line26": "G30", "line23a": "G31"}, stage='schedule_e', cpu_bound=False
+        )(extract_schedule_e)
+        self.addCleanup(section_dispatcher._handlers.pop, 'schedule_E')
+
+        self.worksheet = mock.Mock()
+        client = mock.Mock()
+        client.open_by_url.return_value.worksheet.return_value = self.worksheet
+        patcher = mock.patch('app.utils.google_sheets_util.get_sheets_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_schedule_c_is_registered(self):
+        self.assertIn('schedule_C', fannie_mae_1040_extraction.EXTRACTED_SECTIONS)
+        handler = section_dispatcher.handler_for(self.schedule_c)
+        self.assertEqual((handler.stage, handler.cpu_bound), ('schedule_c', True))
+        self.assertIsNone(section_dispatcher.handler_for(os.path.join(self.tmpdir, 'return_pg1-2_1040.pdf')))
+
+    def test_sections_run_concurrently_into_one_update(self):
+        config = get_config(os.getenv('APP_ENV', 'default'))
+        submit = section_dispatcher._submit
+        events = []
+
+        def recording_submit(handler, local_file, in_process):
+            future, replay_stages = submit(handler, local_file, in_process)
+            events.append(('submit', handler.label))
+            collect = future.result
+            future.result = lambda: events.append(('result', handler.label)) or collect()
+            return future, replay_stages
+
+        for workers in (1, 0):
+            with self.subTest(process_workers=workers), mock.patch.object(config, 'SECTION_PROCESS_WORKERS', workers), \
+                    mock.patch.object(section_dispatcher, '_submit', recording_submit):
+                self.worksheet.reset_mock()
+                events.clear()
+                job = Job(document_type='1040')
+                with run_inline(job):
+                    section_dispatcher.extract_sections(
+                        [(self.schedule_c, None), (self.schedule_e, None), (os.path.join(self.tmpdir, 'x_1040.pdf'), None)],
+                        'sheet-id'
+                    )
+
+                self.assertEqual(self.worksheet.update_values_batch.call_count, 1)
+                ranges, values = self.worksheet.update_values_batch.call_args.args
+                written = dict(zip(ranges, (value[0][0] for value in values)))
+                self.assertEqual(written["G30"], "1200")
+                self.assertNotIn("G31", written)
+                self.assertIn("G17", written)
+                self.assertLessEqual({'schedule_c', 'region_extraction', 'schedule_e', 'sheets'}, set(job.stages))
+                # Both sections are in flight before either result is waited on
+                self.assertEqual(events, [('submit', 'schedule_C'), ('submit', 'schedule_E'),
+                                          ('result', 'schedule_C'), ('result', 'schedule_E')])
+
+
+if __name__ == '__main__':
+    unittest.main()
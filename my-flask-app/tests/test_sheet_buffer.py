@@ -0,0 +1,116 @@
+import unittest
+from unittest import mock
+
+from app.utils.google_sheets_util import (
+    SheetWriteBuffer, SheetPopulator, SheetSnapshot, SnapshotWriteBuffer, cell_position
+)
+from app.models.extracted_entity import EntitySet, ExtractedEntity
+
+
+class FakeWorksheet:
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+        self.reads = 0
+        self.batch_reads = 0
+        self.batch_calls = []
+
+    def get_value(self, cell):
+        self.reads += 1
+        return self.values.get(cell, "")
+
+    def get_values_batch(self, ranges):
+        self.batch_reads += 1
+        values = {cell_position(cell): value for cell, value in self.values.items()}
+        results = []
+        for cell_range in ranges:
+            (top, left), (bottom, right) = (cell_position(cell) for cell in cell_range.split(':'))
+            results.append([[values.get((row, column), "") for column in range(left, right + 1)]
+                            for row in range(top, bottom + 1)])
+        return results
+
+    def update_values_batch(self, ranges, values):
+        self.batch_calls.append((ranges, values))
+        for cell, value in zip(ranges, values):
+            self.values[cell] = str(value[0][0])
+
+
+class TestSheetWriteBuffer(unittest.TestCase):
+    def test_last_write_wins_in_one_call(self):
+        worksheet = FakeWorksheet()
+        buffer = SheetWriteBuffer(worksheet)
+        buffer.set("C19", 100)
+        buffer.set("c40", 100)
+        buffer.set("C19", 250.0)
+
+        self.assertEqual(buffer.get("C19"), "250")
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(worksheet.batch_calls, [(["C19", "C40"], [[[250.0]], [[100]]])])
+        self.assertEqual(buffer.flush(), 0)
+
+    def open_populator(self, worksheet):
+        spreadsheet = mock.Mock()
+        spreadsheet.worksheet.return_value = worksheet
+        client = mock.Mock()
+        client.open_by_url.return_value = spreadsheet
+        with mock.patch('app.utils.google_sheets_util.get_sheets_client', return_value=client):
+            return SheetPopulator('credentials.json', 'https://sheet')
+
+    def test_w2_population_is_one_read_and_one_write(self):
+        worksheet = FakeWorksheet()
+        populator = self.open_populator(worksheet)
+        populator.populate_sheet(True, EntitySet([
+            ExtractedEntity('FormYear', '2023'),
+            ExtractedEntity('WagesTipsOtherCompensation', '52,000.00'),
+        ]))
+
+        self.assertEqual((worksheet.batch_reads, worksheet.reads), (1, 0))
+        self.assertEqual(len(worksheet.batch_calls), 1)
+        self.assertEqual(worksheet.values["E19"], "2023")
+        self.assertEqual(worksheet.values["C19"], "52000.0")
+
+    def test_paystub_row_probe_reads_snapshot(self):
+        worksheet = FakeWorksheet({"H11": "$1,000.00", "H12": "$1,100.00"})
+        populator = self.open_populator(worksheet)
+        populator.populate_sheet(False, EntitySet([ExtractedEntity('employee_name', 'Jane Doe')]),
+                                 {"employee_name": "C4"}, {})
+
+        self.assertEqual((worksheet.batch_reads, worksheet.reads), (1, 0))
+        self.assertEqual(worksheet.values["C4"], "Jane Doe")
+        # Flushed writes are applied to the snapshot, so later reads see them
+        self.assertEqual(populator.get_value("C4"), "Jane Doe")
+
+    def test_paystub_earning_lines(self):
+        worksheet = FakeWorksheet()
+        populator = self.open_populator(worksheet)
+        earning_lines = [ExtractedEntity('earning_item', 'Regular 25.00 8.00 200.00 1,600.00')] * 40
+        populator.populate_sheet(False, EntitySet(earning_lines + [
+            ExtractedEntity('earning_item', 'Overtime 37.50 2.00 75.00'),
+            ExtractedEntity('earning_item', 'Commission 1,200.00'),
+        ]), {}, {})
+
+        self.assertEqual(worksheet.values["E11"], "25.00")
+        self.assertEqual(worksheet.values["F11"], "8.00")
+        self.assertEqual(worksheet.values["H11"], "$64,000.00")
+        self.assertEqual(worksheet.values["C62"], "1,200.00")
+
+
+class TestSheetSnapshot(unittest.TestCase):
+    def test_reads_and_writes_inside_range(self):
+        # Trailing empty rows and cells are omitted by the Sheets API
+        snapshot = SheetSnapshot('C10:I90', [[], ['', '', '', '', '', '$1,000.00']])
+        self.assertEqual(snapshot.get_value('H11'), '$1,000.00')
+        self.assertEqual(snapshot.get_value('H12'), '')
+        self.assertEqual(snapshot.get_value('i90'), '')
+        with self.assertRaises(KeyError):
+            snapshot.get_value('B10')
+
+        buffer = SnapshotWriteBuffer(snapshot)
+        buffer.set('H12', 2000.0)
+        buffer.set('C4', 'Jane')
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(snapshot.get_value('H12'), '2000')
+        self.assertEqual(list(buffer.written.items()), [('H12', 2000.0), ('C4', 'Jane')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import fitz  # PyMuPDF
+from google.cloud import documentai_v1 as documentai
+
+from app.models.fannie_mae_operations import splitter
+from app.utils import docai_router_util
+from app.utils.docai_router_util import BATCH
+from app.utils.batch_processing_util import join_shard_sections, manifest_from_document
+
+
+def split_document(sections):
+    entities = []
+    for type_, pages in sections:
+        page_refs = [documentai.Document.PageAnchor.PageRef(page=page) for page in pages]
+        entities.append(documentai.Document.Entity(
+            type_=type_, page_anchor=documentai.Document.PageAnchor(page_refs=page_refs)
+        ))
+    return documentai.Document(entities=entities)
+
+
+class TestOnlineSplitter(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.pdf_path = os.path.join(self.tmpdir, 'upload.pdf')
+        with fitz.open('tests/test.pdf') as source, fitz.open() as pdf:
+            pdf.insert_pdf(source, from_page=0, to_page=3)
+            pdf.save(self.pdf_path)
+
+    def test_manifest_from_document(self):
+        document = split_document([('1040', [0, 1]), ('schedule_C', [2, 3])])
+        self.assertEqual(manifest_from_document(document), [
+            {'type': '1040', 'start_page': 0, 'end_page': 1},
+            {'type': 'schedule_C', 'start_page': 2, 'end_page': 3},
+        ])
+
+    def test_only_extracted_sections_are_written(self):
+        response = documentai.ProcessResponse(document=split_document([('1040', [0, 1]), ('schedule_C', [2, 3])]))
+        output_dir = tempfile.mkdtemp()
+        with mock.patch.object(splitter, 'online_process', return_value=response) as online_process, \
+                mock.patch.object(splitter, 'get_document_cache', return_value=None), \
+                mock.patch.object(splitter.config, 'ARCHIVE_SPLIT_PDFS', False), \
+                mock.patch.object(splitter.config, 'SPLIT_MODE', 'auto'):
+            files = splitter.split_1040_package(
+                'project', 'us', 'splitter', 'return.pdf', self.pdf_path, output_dir, sections=('schedule_C',)
+            )
+
+        online_process.assert_called_once()
+        self.assertEqual(files, [(os.path.join(output_dir, 'return_pg3-4_schedule_C.pdf'), None)])
+        self.assertEqual(os.listdir(output_dir), ['return_pg3-4_schedule_C.pdf'])
+
+    def test_join_shard_sections(self):
+        manifest = [
+            {'type': '1040', 'start_page': 0, 'end_page': 1},
+            {'type': 'schedule_C', 'start_page': 2, 'end_page': 2},
+            {'type': 'schedule_C', 'start_page': 3, 'end_page': 3},
+            {'type': 'schedule_C', 'start_page': 4, 'end_page': 4},
+        ]
+        self.assertEqual(join_shard_sections(manifest, [(0, 2), (3, 5)]), [
+            {'type': '1040', 'start_page': 0, 'end_page': 1},
+            {'type': 'schedule_C', 'start_page': 2, 'end_page': 3},
+            {'type': 'schedule_C', 'start_page': 4, 'end_page': 4},
+        ])
+
+    def test_medium_packages_are_split_in_online_shards(self):
+        # Shards of pages 1-3 and 4: schedule C runs over the boundary
+        responses = [
+            documentai.ProcessResponse(document=split_document([('1040', [0, 1]), ('schedule_C', [2])])),
+            documentai.ProcessResponse(document=split_document([('schedule_C', [0])])),
+        ]
+        output_dir = tempfile.mkdtemp()
+        with mock.patch.object(docai_router_util, 'online_process', side_effect=responses) as online_process, \
+                mock.patch.object(splitter, 'get_document_cache', return_value=None), \
+                mock.patch.multiple(splitter.config, ARCHIVE_SPLIT_PDFS=False, SPLIT_MODE='auto',
+                                    ONLINE_SPLIT_MAX_PAGES=3, SHARDED_MAX_PAGES=10):
+            self.assertEqual(splitter.split_route(self.pdf_path).shards, [(0, 2), (3, 3)])
+            files = splitter.split_1040_package(
+                'project', 'us', 'splitter', 'return.pdf', self.pdf_path, output_dir, sections=('schedule_C',)
+            )
+
+        self.assertEqual(online_process.call_count, 2)
+        self.assertEqual(files, [(os.path.join(output_dir, 'return_pg3-4_schedule_C.pdf'), None)])
+
+    def test_large_packages_use_batch(self):
+        with mock.patch.multiple(splitter.config, ONLINE_SPLIT_MAX_PAGES=3, SPLIT_MODE='auto', SHARDED_MAX_PAGES=3):
+            self.assertEqual(splitter.split_route(self.pdf_path).route, BATCH)
+
+
+class TestBatchSplitter(unittest.TestCase):
+    def setUp(self):
+        from benchmarks.fakes import FakeBackends, load_documents
+        from benchmarks.pipeline import BENCHMARK_CONFIG
+        patcher = mock.patch.multiple(splitter.config, **BENCHMARK_CONFIG)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.backends = FakeBackends(load_documents(), location='us').install()
+        self.addCleanup(self.backends.uninstall)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def test_packages_with_the_same_name_do_not_share_an_input_object(self):
+        submitted = []
+        submit = splitter.submit_documentai_processing_batch
+
+        def capture(*args, **kwargs):
+            operation = submit(*args, **kwargs)
+            submitted.append(operation)
+            return operation
+
+        contexts = []
+        manager = mock.Mock()
+        manager.track.side_effect = lambda name, kind, context, location: contexts.append(context)
+        with mock.patch.object(splitter, 'submit_documentai_processing_batch', side_effect=capture), \
+                mock.patch.object(splitter, 'get_operation_manager', return_value=manager):
+            for borrower in ('first', 'second'):
+                with fitz.open() as pdf:
+                    pdf.new_page().insert_text((72, 72), f"{borrower} borrower")
+                    content = pdf.tobytes()
+                splitter.submit_batch_split('project', 'us', 'splitter', '1040.pdf', content, 'kind', {})
+
+        self.assertNotEqual(contexts[0]['input_name'], contexts[1]['input_name'])
+        for borrower, operation, context in zip(('first', 'second'), submitted, contexts):
+            output_dir = tempfile.mkdtemp(dir=self.tmpdir)
+            _, local_pdf_path, _ = splitter.finish_batch_split(operation, context, output_dir)
+            with fitz.open(local_pdf_path) as pdf:
+                self.assertIn(f"{borrower} borrower", pdf[0].get_text())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import threading
+import unittest
+from unittest import mock
+
+from app.models.extracted_entity import EntitySet, ExtractedEntity
+from app.models.extraction_paystub import paystub_population
+from app.models.extraction_w2 import w2_population
+from app.utils.spreadsheet_actor_util import SpreadsheetActor, get_spreadsheet_actor
+from tests.test_sheet_buffer import FakeWorksheet
+
+
+def w2(year, wages):
+    return EntitySet([ExtractedEntity('FormYear', year), ExtractedEntity('WagesTipsOtherCompensation', wages)])
+
+
+def paystub(amount):
+    return EntitySet([ExtractedEntity('earning_item', f'Regular 25.00 40.00 1,000.00 {amount}')])
+
+
+class TestSpreadsheetActor(unittest.TestCase):
+    def setUp(self):
+        self.worksheet = FakeWorksheet()
+        patcher = mock.patch('app.utils.spreadsheet_actor_util.open_income_worksheet', return_value=self.worksheet)
+        self.open_worksheet = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_queued_documents_share_one_read_and_one_write(self):
+        actor = SpreadsheetActor('https://sheet')
+        first = actor.enqueue(w2_population(w2('2022', '40,000.00')))
+        second = actor.enqueue(w2_population(w2('2023', '42,000.00')))
+        actor.wait(second)
+        actor.wait(first)
+
+        self.assertEqual((self.open_worksheet.call_count, self.worksheet.batch_reads), (1, 1))
+        self.assertEqual(len(self.worksheet.batch_calls), 1)
+        self.assertEqual((self.worksheet.values["E19"], self.worksheet.values["E20"]), ("2022", "2023"))
+        self.assertEqual((self.worksheet.values["C19"], self.worksheet.values["C20"]), ("40000.0", "42000.0"))
+
+    def test_concurrent_paystubs_get_distinct_rows(self):
+        def populate(amount):
+            get_spreadsheet_actor('https://sheet').submit(paystub_population(paystub(amount)))
+
+        threads = [threading.Thread(target=populate, args=(f"{1000 * (i + 1)}.00",)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        rows = sorted(self.worksheet.values[f"H{row}"] for row in (11, 12, 13))
+        self.assertEqual(rows, ["$1,000.00", "$2,000.00", "$3,000.00"])
+        self.assertLessEqual(self.worksheet.batch_reads, 3)
+
+    def test_failed_document_leaves_no_writes(self):
+        def broken(populator):
+            populator.update_value("E19", "1999")
+            raise ValueError("bad entities")
+
+        actor = SpreadsheetActor('https://sheet')
+        failed = actor.enqueue(broken)
+        written = actor.enqueue(w2_population(w2('2023', '42,000.00')))
+
+        with self.assertRaises(ValueError):
+            actor.wait(failed)
+        actor.wait(written)
+        self.assertEqual(self.worksheet.values["E19"], "2023")
+
+    def test_sheet_errors_fail_the_whole_batch(self):
+        self.worksheet.update_values_batch = mock.Mock(side_effect=RuntimeError("quota"))
+        actor = SpreadsheetActor('https://sheet')
+        items = [actor.enqueue(w2_population(w2(year, '1.00'))) for year in ('2022', '2023')]
+        for item in items:
+            with self.assertRaisesRegex(RuntimeError, "quota"):
+                actor.wait(item)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from app.config import get_config
+from app.warmup import SDK_MODULES
+
+CHECK_IMPORTS = """
+import sys
+from app import create_app
+app = create_app('testing')
+app.test_client().get('/api/health')
+print('loaded:' + ','.join(sorted(name for name in {modules!r} if name in sys.modules)))
+"""
+
+
+class TestStartup(unittest.TestCase):
+    def run_python(self, code):
+        env = dict(os.environ, WARM_UP='off', LRO_MANAGER_ENABLED='false')
+        for name in ['GOOGLE_APPLICATION_CREDENTIALS', 'GOOGLE_STORAGE_CREDENTIALS',
+                     'GOOGLE_SHEETS_CREDENTIALS', 'GOOGLE_FIRESTORE_CREDENTIALS']:
+            env.setdefault(name, 'test-credentials.json')
+        return subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+
+    def test_create_app_does_not_import_sdks(self):
+        result = self.run_python(CHECK_IMPORTS.format(modules=SDK_MODULES + ('google.cloud.documentai_toolbox',)))
+        self.assertEqual(result.stdout.strip().splitlines()[-1], 'loaded:')
+
+    def test_importing_utils_prints_nothing(self):
+        result = self.run_python('import app.utils')
+        self.assertEqual(result.stdout, '')
+
+    def test_config_is_shared(self):
+        self.assertIs(get_config('testing'), get_config('testing'))
+        self.assertIs(get_config('default'), get_config('development'))
+
+
+if __name__ == '__main__':
+    unittest.main()
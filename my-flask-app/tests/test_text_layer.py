@@ -0,0 +1,150 @@
+import unittest
+from unittest import mock
+
+import fitz  # PyMuPDF
+
+from app.models import extraction_text_layer, extraction_w2
+from app.models.extracted_entity import EntitySet
+from app.utils.docai_cache_util import DocumentCache, MemoryCacheBackend
+from benchmarks.fakes import load_documents
+from tests.test_sheet_buffer import FakeWorksheet, TestSheetWriteBuffer
+
+# (x, y, text) of a W-2 copy B: labels at the top of their boxes, values under them
+W2_TEXT = [
+    (40, 40, "Form W-2 Wage and Tax Statement 2023"),
+    (320, 40, "Copy B—To Be Filed With Employee's FEDERAL Tax Return."),
+    (40, 80, "b Employer identification number (EIN)"), (40, 95, "12-3456789"),
+    (300, 80, "1 Wages, tips, other compensation"), (300, 95, "52,000.00"),
+    (450, 80, "2 Federal income tax withheld"), (450, 95, "6,240.00"),
+    (40, 120, "c Employer's name, address, and ZIP code"), (40, 135, "ACME WIDGETS LLC"),
+    (300, 120, "3 Social security wages"), (300, 135, "52,000.00"),
+    (450, 120, "4 Social security tax withheld"), (450, 135, "3,224.00"),
+    (300, 160, "5 Medicare wages and tips"), (300, 175, "52,000.00"),
+    (450, 160, "6 Medicare tax withheld"), (450, 175, "754.00"),
+]
+
+# An ADP earnings statement with deductions printed alongside the earnings
+PAYSTUB_TEXT = [
+    (40, 40, "ACME WIDGETS LLC"), (400, 40, "Earnings Statement"),
+    (400, 60, "Period Beginning: 01/01/2024"), (400, 75, "Period Ending: 01/14/2024"),
+    (400, 90, "Pay Date: 01/19/2024"),
+    (40, 90, "Employee Name: JANE Q DOE"),
+    (40, 150, "Earnings"), (140, 150, "rate"), (190, 150, "hours"), (240, 150, "this period"),
+    (320, 150, "year to date"),
+    (450, 150, "Deductions"), (520, 150, "this period"),
+    (40, 165, "Regular"), (140, 165, "25.00"), (190, 165, "80.00"), (240, 165, "2,000.00"), (320, 165, "2,000.00"),
+    (450, 165, "Federal Income Tax"), (540, 165, "-210.00"),
+    (40, 180, "Overtime"), (140, 180, "37.50"), (190, 180, "4.00"), (240, 180, "150.00"), (320, 180, "150.00"),
+    (450, 180, "Social Security Tax"), (540, 180, "-133.30"),
+    (40, 195, "Gross Pay"), (240, 195, "$2,150.00"), (320, 195, "$2,150.00"),
+    (40, 230, "Net Pay"), (240, 230, "$1,640.22"),
+]
+
+
+def build_pdf(items):
+    with fitz.open() as pdf:
+        page = pdf.new_page(width=612, height=792)
+        for x, y, text in items:
+            page.insert_text((x, y), text, fontsize=8)
+        return pdf.tobytes()
+
+
+def values(entities):
+    return [(entity.type, entity.raw_value) for entity in entities]
+
+
+class TestTextLayer(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.multiple(extraction_text_layer.config, TEXT_LAYER_FAST_PATH=True,
+                                      TEXT_LAYER_MIN_CONFIDENCE=0.85, TEXT_LAYER_LAYOUTS_PATH=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        extraction_text_layer.reset_layouts()
+        self.addCleanup(extraction_text_layer.reset_layouts)
+
+    def test_w2_fields(self):
+        entities = extraction_text_layer.extract(build_pdf(W2_TEXT), 'application/pdf', 'w2')
+
+        self.assertEqual(values(entities), [
+            ('FormYear', '2023'),
+            ('WagesTipsOtherCompensation', '52,000.00'),
+            ('FederalIncomeTaxWithheld', '6,240.00'),
+            ('SocialSecurityWages', '52,000.00'),
+            ('MedicareWagesAndTips', '52,000.00'),
+        ])
+        self.assertTrue(all(0.85 <= entity.confidence < 1 for entity in entities))
+
+    def test_paystub_fields(self):
+        entities = extraction_text_layer.extract(build_pdf(PAYSTUB_TEXT), 'application/pdf', 'paystub')
+
+        self.assertEqual(values(entities), [
+            ('employee_name', 'JANE Q DOE'),
+            ('start_date', '01/01/2024'),
+            ('end_date', '01/14/2024'),
+            ('pay_date', '01/19/2024'),
+            ('earning_item', 'Regular 25.00 80.00 2,000.00 2,000.00'),
+            ('earning_item', 'Overtime 37.50 4.00 150.00 150.00'),
+            ('gross_earnings', '$2,150.00'),
+            ('gross_earnings_ytd', '$2,150.00'),
+            ('net_pay', '$1,640.22'),
+        ])
+        self.assertEqual(list(entities)[1].normalized_value, '2024-01-01')
+
+    def test_populates_the_sheet_like_document_ai(self):
+        documents = load_documents()
+        for document_type, items in (('w2', W2_TEXT), ('paystub', PAYSTUB_TEXT)):
+            with self.subTest(document_type):
+                local = extraction_text_layer.extract(build_pdf(items), 'application/pdf', document_type)
+                document_ai = EntitySet.from_document(documents[document_type])
+                sheets = []
+                for entities in (local, document_ai):
+                    worksheet = FakeWorksheet()
+                    populator = TestSheetWriteBuffer.open_populator(self, worksheet)
+                    if document_type == 'w2':
+                        populator.populate_sheet(True, entities)
+                    else:
+                        populator.populate_sheet(False, entities, {"employee_name": "C4"}, {})
+                    sheets.append(worksheet.values)
+                self.assertEqual(sheets[0], sheets[1])
+
+    def test_falls_back_to_document_ai(self):
+        with open('tests/test.pdf', 'rb') as f:
+            return_1040 = f.read()
+        unreadable = build_pdf([(40, 40, "Wage and Tax Statement")])
+        missing_wages = build_pdf([item for item in W2_TEXT if item[2] != "52,000.00"])
+
+        for name, content, mime_type in (('scan', b'\x89PNG', 'image/png'), ('long', return_1040, 'application/pdf'),
+                                         ('no text', unreadable, 'application/pdf'),
+                                         ('missing field', missing_wages, 'application/pdf')):
+            with self.subTest(name):
+                self.assertIsNone(extraction_text_layer.extract(content, mime_type, 'w2'))
+        # A W-2 is not a paystub
+        self.assertIsNone(extraction_text_layer.extract(build_pdf(W2_TEXT), 'application/pdf', 'paystub'))
+
+    def test_text_layer_results_are_not_cached(self):
+        cache = DocumentCache(MemoryCacheBackend(max_bytes=1_000_000))
+        content = build_pdf(W2_TEXT)
+        with mock.patch.object(extraction_w2, 'get_document_cache', return_value=cache), \
+                mock.patch.object(extraction_w2, 'store_data_in_firestore'), \
+                mock.patch.object(extraction_w2, 'prepare_document', side_effect=lambda content, *args: content), \
+                mock.patch.object(extraction_w2, 'process_document',
+                                  return_value=load_documents()['w2']) as process_document:
+            extraction_w2.extract_w2_entities('project', 'us', 'w2', content, 'application/pdf')
+            process_document.assert_not_called()
+            # With the fast path off, the upload goes to Document AI rather than a stored text-layer result
+            with mock.patch.object(extraction_text_layer.config, 'TEXT_LAYER_FAST_PATH', False):
+                extraction_w2.extract_w2_entities('project', 'us', 'w2', content, 'application/pdf')
+                extraction_w2.extract_w2_entities('project', 'us', 'w2', content, 'application/pdf')
+        self.assertEqual(process_document.call_count, 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_conflicting_copies_lower_confidence(self):
+        other_copy = [(x, y + 300, "51,000.00" if text == "52,000.00" else text) for x, y, text in W2_TEXT]
+        self.assertIsNone(extraction_text_layer.extract(build_pdf(W2_TEXT + other_copy), 'application/pdf', 'w2'))
+        same_copy = [(x, y + 300, text) for x, y, text in W2_TEXT]
+        entities = extraction_text_layer.extract(build_pdf(W2_TEXT + same_copy), 'application/pdf', 'w2')
+        self.assertEqual(values(entities)[1], ('WagesTipsOtherCompensation', '52,000.00'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from app import create_app
+from app.utils import gcs_operations, gcs_transfer_util
+from app.utils.upload_buffer_util import UploadBuffer, read_document, open_pdf, document_size
+
+with open('tests/test.pdf', 'rb') as _f:
+    PDF_BYTES = _f.read()
+
+
+class TestUploadBuffer(unittest.TestCase):
+    def test_small_upload_stays_in_memory(self):
+        with UploadBuffer.from_bytes(PDF_BYTES, spill_threshold=len(PDF_BYTES)) as buffer:
+            self.assertTrue(buffer.in_memory)
+            self.assertEqual(len(buffer), len(PDF_BYTES))
+            # Repeated reads share one bytes object instead of copying the upload
+            self.assertIs(read_document(buffer), read_document(buffer))
+            with open_pdf(buffer) as pdf:
+                self.assertEqual(pdf.page_count, 30)
+
+    def test_large_upload_spills_to_directory(self):
+        directory = tempfile.mkdtemp()
+        buffer = UploadBuffer(spill_threshold=1024, directory=directory)
+        for start in range(0, len(PDF_BYTES), 4096):
+            buffer.write(PDF_BYTES[start:start + 4096])
+        buffer.seek(0)
+
+        self.assertFalse(buffer.in_memory)
+        self.assertEqual(os.path.dirname(buffer.path), directory)
+        self.assertEqual(document_size(buffer), len(PDF_BYTES))
+        self.assertEqual(buffer.read(), PDF_BYTES)
+        with open_pdf(buffer) as pdf:
+            self.assertEqual(pdf.page_count, 30)
+        buffer.close()
+        self.assertEqual(os.listdir(directory), [])
+
+    def test_gcs_upload_streams_buffer(self):
+        blob = mock.Mock()
+        client = mock.Mock()
+        client.bucket.return_value.blob.return_value = blob
+        buffer = UploadBuffer.from_bytes(PDF_BYTES)
+        with mock.patch.object(gcs_transfer_util, 'get_storage_client', return_value=client):
+            gcs_operations.upload_file_to_gcs(buffer, 'bucket', 'test.pdf')
+
+        blob.upload_from_file.assert_called_once_with(
+            buffer, rewind=True, size=len(PDF_BYTES), content_type='application/pdf')
+        blob.upload_from_filename.assert_not_called()
+
+
+class TestUploadRoute(unittest.TestCase):
+    def setUp(self):
+        self.upload_folder = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['UPLOAD_FOLDER'] = self.upload_folder
+        self.client = self.app.test_client()
+
+    def test_upload_is_processed_from_memory(self):
+        seen = {}
+
+        def process(upload, mime_type, document_type, spreadsheet_id):
+            seen['in_memory'] = upload.in_memory
+            seen['content'] = read_document(upload)
+
+        with mock.patch('app.api.document_routes.process_document_w2_paystub', side_effect=process):
+            with open('tests/test.pdf', 'rb') as fp:
+                response = self.client.post(
+                    '/api/process', data={'document_type': 'w2', 'spreadsheetId': 'sheet', 'file': (fp, 'test.pdf')})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(seen['in_memory'])
+        self.assertEqual(seen['content'], PDF_BYTES)
+        self.assertEqual(os.listdir(self.upload_folder), [])
+
+
+if __name__ == '__main__':
+    unittest.main()